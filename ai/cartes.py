@@ -0,0 +1,109 @@
+"""
+Cartes produit des modules IA (recommandations, suggestions).
+
+Une carte est le dictionnaire sérialisable d'un produit tel que l'affichent
+les listes des modules IA (JSON de /api/ai/reco/, suggestions_partial.html) :
+nom, URL de la fiche, URL de l'image principale, prix affiché, etc.
+
+cartes() les produit pour une liste d'identifiants :
+
+- une requête lit les dates de mise à jour du produit et de sa catégorie,
+  ainsi que le stock et la note (qui changent sans modifier la date) ;
+- la partie stable de chaque carte est lue dans le cache, sous une clé qui
+  contient ces dates : un produit modifié (y compris ses images, voir
+  catalog.signals.dater_produit) a une nouvelle clé, sans invalidation ;
+- les cartes absentes du cache sont construites ensemble, en une requête qui
+  lit aussi le chemin de l'image principale (sous-requête), sans charger les
+  objets ni appeler reverse() et le stockage pour chaque image séparément.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Substr
+from django.urls import reverse
+
+from catalog.models import ImageProduit, Produit
+
+from .echantillonnage import eligibles
+
+CLE_CARTE = 'ai:carte:{}:{}:{}'
+IMAGE_PAR_DEFAUT = 'https://via.placeholder.com/300x200?text=Image+non+disponible'
+LONGUEUR_DESCRIPTION = 100
+
+
+def _horodatage(date):
+    return int(date.timestamp() * 1000) if date else 0
+
+
+def _url_image(chemin):
+    if not chemin:
+        return IMAGE_PAR_DEFAUT
+    return ImageProduit._meta.get_field('image').storage.url(chemin)
+
+
+def construire_cartes(ids):
+    """
+    Partie stable des cartes des produits `ids`, en une requête.
+
+    Returns:
+        dict: produit_id -> carte (sans stock ni note)
+    """
+    image = ImageProduit.objects.filter(produit=OuterRef('pk'), est_principale=True).order_by('ordre', 'date_ajout')
+    lignes = Produit.objects.filter(pk__in=ids).values(
+        'id', 'nom', 'slug', 'prix', 'prix_promotionnel', 'categorie__nom',
+        extrait=Substr('description', 1, LONGUEUR_DESCRIPTION),
+        chemin_image=Subquery(image.values('image')[:1]),
+    )
+    cartes = {}
+    for ligne in lignes:
+        en_promotion = ligne['prix_promotionnel'] is not None and ligne['prix_promotionnel'] < ligne['prix']
+        cartes[ligne['id']] = {
+            'id': ligne['id'],
+            'nom': ligne['nom'],
+            'description': ligne['extrait'] + '...' if ligne['extrait'] else '',
+            'prix': float(ligne['prix_promotionnel'] if en_promotion else ligne['prix']),
+            'prix_initial': float(ligne['prix']) if en_promotion else None,
+            'categorie': ligne['categorie__nom'] or '',
+            'url': reverse('catalog:detail_produit', kwargs={'slug': ligne['slug']}),
+            'image': _url_image(ligne['chemin_image']),
+        }
+    return cartes
+
+
+def cartes(ids, queryset=None):
+    """
+    Cartes des produits `ids` proposables (actifs et en stock), dans l'ordre
+    des identifiants. Les produits qui ne le sont pas sont écartés.
+
+    Args:
+        ids (list): Identifiants des produits
+        queryset (QuerySet, optional): Restreint les produits (défaut : tous les produits)
+
+    Returns:
+        list: Cartes (dict), avec le stock et la note moyenne à jour
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return []
+    etats = {}
+    lignes = eligibles(queryset).filter(pk__in=ids).values_list(
+        'id', 'date_mise_a_jour', 'categorie__date_mise_a_jour', 'quantite', 'note_moyenne'
+    )
+    for produit_id, date_produit, date_categorie, quantite, note in lignes:
+        cle = CLE_CARTE.format(produit_id, _horodatage(date_produit), _horodatage(date_categorie))
+        etats[produit_id] = (cle, quantite, note)
+
+    trouvees = cache.get_many([cle for cle, _, _ in etats.values()])
+    manquants = [produit_id for produit_id, (cle, _, _) in etats.items() if cle not in trouvees]
+    if manquants:
+        nouvelles = {etats[produit_id][0]: carte for produit_id, carte in construire_cartes(manquants).items()}
+        cache.set_many(nouvelles, getattr(settings, 'AI_CARTES_DUREE', 24 * 3600))
+        trouvees.update(nouvelles)
+
+    resultat = []
+    for produit_id in ids:
+        if produit_id not in etats or etats[produit_id][0] not in trouvees:
+            continue
+        cle, quantite, note = etats[produit_id]
+        resultat.append({**trouvees[cle], 'stock': quantite, 'note_moyenne': float(note or 0)})
+    return resultat
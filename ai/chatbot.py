@@ -1,8 +1,17 @@
 """
 Module de chatbot IA pour l'assistance client
+
+L'intention du message est détectée par ai.intentions ; les questions sur
+les produits sont cherchées dans le catalogue (index de ai.smartsearch) et
+celles sur les commandes reçoivent le statut de la dernière commande.
 """
 import random
-from datetime import datetime
+
+from catalog.search.analyse import MOTS_VIDES
+from orders.models import Commande
+
+from .intentions import get_moteur, tokeniser
+from .smartsearch import smart_search
 
 # Réponses prédéfinies pour différentes intentions
 RESPONSES = {
@@ -33,43 +42,52 @@ RESPONSES = {
     ]
 }
 
+# Mots de la demande, retirés de la question avant la recherche dans le catalogue
+MOTS_DEMANDE = frozenset("""
+acheter achat avez auriez bon bonne cherche cherchais combien conseil conseillez coute
+coutent dispo disponible disponibles est faudrait faut meilleur meilleure montrez prix
+produit produits propose proposez quel quelle quelles quels recherche stock svp vendez
+voudrais voulais veux vous
+""".split())
+
+
 def detect_intent(question):
-    """Détecte l'intention derrière la question de l'utilisateur"""
-    question = question.lower()
-    
-    if any(word in question for word in ['bonjour', 'salut', 'coucou', 'hey', 'hello']):
-        return 'greeting'
-    elif any(word in question for word in ['merci', 'remercie', 'super', 'parfait', 'génial']):
-        return 'thanks'
-    elif any(word in question for word in ['au revoir', 'à plus', 'bye', 'a+', 'ciao']):
-        return 'goodbye'
-    elif any(word in question for word in ['aide', 'aider', 'peux-tu m\'aider', 'comment faire']):
-        return 'help'
-    
-    return None
+    """Détecte l'intention derrière la question de l'utilisateur (voir ai.intentions)"""
+    return get_moteur().detecter(question).nom
 
-def get_product_info(question):
-    """Simule la récupération d'informations sur un produit"""
-    # Dans une vraie implémentation, on interrogerait ici la base de données
-    products = {
-        'ordinateur': 'Nous avons plusieurs ordinateurs portables et de bureau disponibles. Souhaitez-vous des conseils pour choisir ?',
-        'téléphone': 'Nous proposons les dernières marques de smartphones. Avez-vous une marque ou un modèle précis en tête ?',
-        'livre': 'Notre sélection de livres couvre divers genres. Quel type de livre recherchez-vous ?',
-    }
-    
-    question = question.lower()
-    for product, response in products.items():
-        if product in question:
-            return response
-    
-    return None
+def get_product_info(question, tokens=None):
+    """
+    Cherche les produits demandés dans le catalogue (index de recherche
+    intelligente, voir ai.smartsearch) et les présente.
+    """
+    tokens = tokeniser(question) if tokens is None else tokens
+    requete = ' '.join(mot for mot in tokens if mot not in MOTS_DEMANDE and mot not in MOTS_VIDES)
+    if not requete:
+        return None
 
-def get_order_status(question):
-    """Simule la vérification du statut d'une commande"""
-    if any(word in question.lower() for word in ['commande', 'colis', 'livraison', 'suivi']):
-        return "Pour vérifier le statut de votre commande, veuillez vous connecter à votre compte ou utiliser le numéro de suivi reçu par email."
+    resultats = smart_search(requete, limite=8)
+    produits = [resultat for resultat in resultats if resultat['type'] == 'produit'][:3]
+    if produits:
+        liste = ', '.join(
+            f"{produit['nom']} ({float(produit['prix'] or 0):.2f} €, {produit['url']})" for produit in produits
+        )
+        return f"Voici ce que j'ai trouvé : {liste}."
+    categories = [resultat for resultat in resultats if resultat['type'] == 'categorie']
+    if categories:
+        return f"Jetez un œil à notre rayon {categories[0]['nom']} : {categories[0]['url']}"
     return None
 
+def get_order_status(user_id=None):
+    """Statut de la dernière commande de l'utilisateur connecté"""
+    if user_id:
+        commande = Commande.objects.filter(utilisateur_id=user_id).order_by('-date_commande', '-id').first()
+        if commande is not None:
+            return (
+                f"Votre dernière commande (n° {commande.pk} du {commande.date_commande:%d/%m/%Y}) "
+                f"est : {commande.get_statut_display().lower()}. Le détail est dans votre historique de commandes."
+            )
+    return "Pour vérifier le statut de votre commande, veuillez vous connecter à votre compte ou utiliser le numéro de suivi reçu par email."
+
 def ask_bot(question, user_id=None):
     """
     Génère une réponse du chatbot IA basée sur la question de l'utilisateur.
@@ -85,22 +103,21 @@ def ask_bot(question, user_id=None):
         return "Je n'ai pas compris votre demande. Pouvez-vous reformuler ?"
     
     # Détecter l'intention
-    intent = detect_intent(question)
+    intention = get_moteur().detecter(question)
     
     # Répondre selon l'intention détectée
-    if intent and intent in RESPONSES:
-        return random.choice(RESPONSES[intent])
+    if intention.nom in RESPONSES:
+        return random.choice(RESPONSES[intention.nom])
     
-    # Vérifier les questions sur les produits
-    product_response = get_product_info(question)
+    # Vérifier les questions sur le statut des commandes
+    if intention.nom == 'order':
+        return get_order_status(user_id)
+    
+    # Questions sur les produits, ou sans intention reconnue : recherche dans le catalogue
+    product_response = get_product_info(question, intention.mots)
     if product_response:
         return product_response
     
-    # Vérifier les questions sur le statut des commandes
-    order_response = get_order_status(question)
-    if order_response:
-        return order_response
-    
     # Réponse par défaut si aucune intention spécifique n'est détectée
     default_responses = [
         "Je peux vous aider à trouver des produits, vérifier le statut d'une commande, ou répondre à vos questions sur nos services.",
@@ -0,0 +1,112 @@
+"""
+Tirage aléatoire de produits sans ORDER BY RANDOM().
+
+Trier la table des produits au hasard à chaque appel coûte un parcours et
+un tri complets. L'échantillonneur garde à la place, en mémoire du
+processus, les identifiants des produits éligibles (actifs et en stock) par
+segment :
+
+- 'tous' : tous les produits éligibles ;
+- ('categorie', id) : ceux d'une catégorie ;
+- 'mieux_notes' : les AI_ECHANTILLON_MIEUX_NOTES mieux notés.
+
+Un tirage choisit des positions au hasard dans le tableau du segment (coût
+proportionnel au nombre de produits tirés, pas à la taille du catalogue),
+puis les produits tirés sont lus en une requête id__in (voir ai.cartes).
+Les tableaux sont reconstruits en arrière-plan toutes les
+AI_ECHANTILLON_INTERVALLE secondes (voir catalog.search.memoire) : un produit
+désactivé ou épuisé entre-temps est écarté à la lecture.
+"""
+import random
+import threading
+from array import array
+
+from django.conf import settings
+
+from catalog.search.memoire import IndexMemoire
+
+TOUS = 'tous'
+MIEUX_NOTES = 'mieux_notes'
+
+
+def segment_categorie(categorie_id):
+    return ('categorie', categorie_id)
+
+
+def eligibles(queryset=None):
+    """Produits qui peuvent être proposés : actifs et en stock."""
+    from catalog.models import Produit
+
+    if queryset is None:
+        queryset = Produit.objects.all()
+    return queryset.filter(est_actif=True, en_stock=True, quantite__gt=0)
+
+
+class EchantillonneurProduits(IndexMemoire):
+    """Identifiants des produits éligibles par segment, pour des tirages aléatoires."""
+    intervalle_synchro = getattr(settings, 'AI_ECHANTILLON_INTERVALLE', 300)
+
+    def __init__(self):
+        super().__init__()
+        self.segments = {}
+
+    def construire(self):
+        produits = eligibles()
+        segments = {TOUS: array('q')}
+        for produit_id, categorie_id in produits.order_by().values_list('id', 'categorie_id').iterator(chunk_size=5000):
+            segments[TOUS].append(produit_id)
+            if categorie_id is not None:
+                segments.setdefault(segment_categorie(categorie_id), array('q')).append(produit_id)
+        # Servi par l'index partiel produit_actif_note
+        segments[MIEUX_NOTES] = array('q', produits.order_by('-note_moyenne', '-nombre_avis', '-id').values_list(
+            'id', flat=True
+        )[:getattr(settings, 'AI_ECHANTILLON_MIEUX_NOTES', 200)])
+        # Remplacement d'un bloc : les lectures en cours gardent l'ancien dictionnaire
+        self.segments = segments
+
+    def synchroniser(self):
+        self.construire()
+
+    def taille(self, segment):
+        self.preparer()
+        return len(self.segments.get(segment, ()))
+
+    def tirer(self, segment, nombre, exclus=(), aleatoire=random):
+        """
+        Tire au plus `nombre` identifiants distincts du segment, hors `exclus`.
+
+        Returns:
+            list: Identifiants dans l'ordre du tirage
+        """
+        self.preparer()
+        ids = self.segments.get(segment)
+        if not ids or nombre <= 0:
+            return []
+        exclus = set(exclus)
+        # Quelques positions de plus pour remplacer les exclus tirés
+        positions = aleatoire.sample(range(len(ids)), min(len(ids), nombre + len(exclus)))
+        tires = [ids[position] for position in positions if ids[position] not in exclus]
+        return tires[:nombre]
+
+
+_echantillonneur = None
+_verrou_echantillonneur = threading.Lock()
+
+
+def get_echantillonneur():
+    """Retourne l'échantillonneur du processus, créé (mais pas encore chargé) au premier appel."""
+    global _echantillonneur
+    if _echantillonneur is None:
+        with _verrou_echantillonneur:
+            if _echantillonneur is None:
+                _echantillonneur = EchantillonneurProduits()
+    return _echantillonneur
+
+
+def ids_au_hasard(segment, nombre, exclus=()):
+    """
+    Identifiants tirés au hasard dans le segment, avec quelques-uns de plus
+    pour compenser ceux qui ne seraient plus éligibles : l'appelant garde les
+    `nombre` premiers produits qu'il retrouve (voir ai.cartes.cartes).
+    """
+    return get_echantillonneur().tirer(segment, nombre + max(2, nombre // 2), exclus)
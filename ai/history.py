@@ -1,148 +1,285 @@
 """
 Module de gestion des suggestions basées sur l'historique utilisateur
+
+Historique de consultation des fiches produit :
+
+- noter_consultation() garde, pour chaque visiteur, les AI_HISTORIQUE_TAILLE
+  derniers produits consultés (couples [produit_id, categorie_id], du plus
+  récent au plus ancien) dans le cache, sous la clé de l'utilisateur ou de
+  sa session. Aucune écriture en base pendant la requête.
+- Les consultations des utilisateurs connectés sont aussi accumulées en
+  mémoire du processus, puis enregistrées par lots (ConsultationProduit) en
+  arrière-plan, tous les AI_HISTORIQUE_LOT événements ou toutes les
+  AI_HISTORIQUE_DELAI secondes, et à l'arrêt du worker. Elles reconstituent
+  l'historique quand il n'est plus dans le cache.
+- suggest_from_history() calcule l'affinité du visiteur pour chaque catégorie
+  (les consultations récentes pèsent plus) et propose les produits les mieux
+  notés des catégories préférées, sous forme de cartes (ai.cartes).
 """
+import atexit
 import logging
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Prefetch, Q
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
 from django.urls import reverse
-from catalog.models import Produit, ImageProduit
+from django.utils import timezone
+
+from .cartes import cartes
+from .echantillonnage import MIEUX_NOTES, eligibles, ids_au_hasard
 
 logger = logging.getLogger(__name__)
 
-def suggest_from_history(user_id, history):
+CLE_HISTORIQUE = 'ai:historique:{}'
+# Poids d'une consultation selon son rang (0 : la plus récente)
+DECROISSANCE = 0.8
+
+# Consultations d'utilisateurs connectés pas encore enregistrées en base
+_en_attente = []
+_verrou_en_attente = threading.Lock()
+_vidage_en_cours = threading.Lock()
+_dernier_vidage = time.monotonic()
+
+
+def parametre(nom, defaut):
+    return getattr(settings, nom, defaut)
+
+
+def cle_historique(user_id=None, session_key=None):
+    """Clé de cache de l'historique du visiteur, ou None s'il n'est pas identifiable."""
+    if user_id:
+        return CLE_HISTORIQUE.format(f'u{user_id}')
+    if session_key:
+        return CLE_HISTORIQUE.format(f's{session_key}')
+    return None
+
+
+def noter_consultation(produit_id, categorie_id, user_id=None, session_key=None):
+    """
+    Ajoute une consultation en tête de l'historique du visiteur (un produit
+    déjà présent remonte en tête). Pour un visiteur anonyme, sans session,
+    la consultation est ignorée : la noter forcerait la création d'une session.
+    """
+    cle = cle_historique(user_id, session_key)
+    if cle is None:
+        return
+    taille = parametre('AI_HISTORIQUE_TAILLE', 20)
+    entrees = historique(user_id, session_key)
+    entrees = [[produit_id, categorie_id]] + [entree for entree in entrees if entree[0] != produit_id]
+    cache.set(cle, entrees[:taille], parametre('AI_HISTORIQUE_DUREE', 30 * 24 * 3600))
+
+    if user_id:
+        with _verrou_en_attente:
+            _en_attente.append((user_id, produit_id, timezone.now()))
+            nombre = len(_en_attente)
+        if nombre >= parametre('AI_HISTORIQUE_LOT', 100) or \
+                time.monotonic() - _dernier_vidage > parametre('AI_HISTORIQUE_DELAI', 60):
+            vider_en_arriere_plan()
+
+
+def vider_consultations():
+    """
+    Enregistre en base les consultations en attente, en une insertion.
+    Celles d'un produit ou d'un utilisateur supprimé entre-temps sont
+    écartées (une requête id__in pour chacun). En cas d'erreur, le lot est
+    remis en attente et l'exception propagée.
+
+    Returns:
+        int: Nombre de consultations enregistrées
+    """
+    from django.contrib.auth import get_user_model
+
+    from ai_user.models import ConsultationProduit
+    from catalog.models import Produit
+
+    global _en_attente, _dernier_vidage
+    with _verrou_en_attente:
+        lot, _en_attente = _en_attente, []
+        _dernier_vidage = time.monotonic()
+    if not lot:
+        return 0
+
+    try:
+        produits = set(Produit.objects.filter(id__in={produit_id for _, produit_id, _ in lot}).values_list('id', flat=True))
+        utilisateurs = set(get_user_model().objects.filter(id__in={user_id for user_id, _, _ in lot}).values_list('id', flat=True))
+        valides = [
+            (user_id, produit_id, date) for user_id, produit_id, date in lot
+            if produit_id in produits and user_id in utilisateurs
+        ]
+        ConsultationProduit.objects.bulk_create([
+            ConsultationProduit(utilisateur_id=user_id, produit_id=produit_id, date=date)
+            for user_id, produit_id, date in valides
+        ], batch_size=1000)
+    except Exception:
+        # Lot remis en tête de la file pour le prochain vidage, dans la limite
+        # de quelques lots (les plus anciens sont perdus si la base reste indisponible)
+        limite = 10 * parametre('AI_HISTORIQUE_LOT', 100)
+        with _verrou_en_attente:
+            _en_attente = (lot + _en_attente)[-limite:]
+        raise
+    if len(valides) < len(lot):
+        logger.info("%d consultation(s) de produits ou d'utilisateurs supprimés écartée(s)", len(lot) - len(valides))
+    return len(valides)
+
+
+def vider_en_arriere_plan():
+    if not _vidage_en_cours.acquire(blocking=False):
+        return
+    threading.Thread(target=_vider, daemon=True).start()
+
+
+def _vider():
+    try:
+        vider_consultations()
+    except Exception:
+        logger.exception("Échec de l'enregistrement des consultations de produits")
+    finally:
+        close_old_connections()
+        _vidage_en_cours.release()
+
+
+@atexit.register
+def _vider_a_l_arret():
+    try:
+        vider_consultations()
+    except Exception:
+        logger.exception("Échec de l'enregistrement des consultations de produits")
+
+
+def historique(user_id=None, session_key=None):
+    """
+    Derniers produits consultés par le visiteur, du plus récent au plus
+    ancien. Pour un utilisateur connecté absent du cache, l'historique est
+    relu en base (une requête) puis remis en cache.
+
+    Returns:
+        list: Couples [produit_id, categorie_id]
+    """
+    from ai_user.models import ConsultationProduit
+
+    cle = cle_historique(user_id, session_key)
+    if cle is None:
+        return []
+    entrees = cache.get(cle)
+    if entrees is not None:
+        return entrees
+    if not user_id:
+        return []
+    taille = parametre('AI_HISTORIQUE_TAILLE', 20)
+    categories = {}
+    for produit_id, categorie_id in (
+        ConsultationProduit.objects.filter(utilisateur_id=user_id)
+        .order_by('-date')
+        .values_list('produit_id', 'produit__categorie_id')[:taille * 3]
+    ):
+        # Première occurrence : la consultation la plus récente du produit
+        categories.setdefault(produit_id, categorie_id)
+    entrees = [[produit_id, categorie_id] for produit_id, categorie_id in categories.items()][:taille]
+    cache.set(cle, entrees, parametre('AI_HISTORIQUE_DUREE', 30 * 24 * 3600))
+    return entrees
+
+
+def affinites_categories(history):
+    """
+    Affinité pour chaque catégorie : somme des poids des consultations de
+    ses produits, DECROISSANCE ** rang.
+
+    Returns:
+        Counter: categorie_id -> affinité
+    """
+    affinites = Counter()
+    for rang, (_, categorie_id) in enumerate(history or []):
+        if categorie_id is not None:
+            affinites[categorie_id] += DECROISSANCE ** rang
+    return affinites
+
+
+def suggestion_par_defaut():
+    """Carte affichée quand aucune suggestion n'est disponible."""
+    return {
+        'id': 0,
+        'nom': "Découvrez nos produits",
+        'description': '',
+        'prix': None,
+        'prix_initial': None,
+        'categorie': '',
+        'url': reverse('catalog:liste_produits'),
+        'image': "https://via.placeholder.com/300x200?text=Découvrir+nos+produits",
+    }
+
+
+def suggest_from_history(user_id, history, limit=5):
     """
     Génère des suggestions basées sur l'historique utilisateur.
-    
+
     Args:
         user_id (int): ID de l'utilisateur
-        history (list): Historique des produits consultés
-        
+        history (list): Historique des produits consultés ([produit_id, categorie_id], du plus récent au plus ancien)
+        limit (int): Nombre maximum de suggestions
+
     Returns:
-        list: Suggestions basées sur l'historique
+        list: Cartes des produits suggérés (voir ai.cartes)
     """
     try:
-        if not history:
+        affinites = affinites_categories(history)
+        if not affinites:
             return []
-            
-        # Récupérer les catégories des produits de l'historique
-        categories = set()
-        for item in history:
-            if 'categorie' in item and item['categorie']:
-                categories.add(item['categorie'])
-        
-        # Si on a des catégories, chercher des produits similaires
-        if categories:
-            suggestions = Produit.objects.filter(
-                Q(categorie__nom__in=categories) | 
-                Q(categorie__parent__nom__in=categories),
-                est_actif=True,
-                en_stock=True
-            ).distinct()[:5]
-            
-            return [{
-                'id': p.id,
-                'title': p.nom,
-                'price': f"{p.prix:.2f}",
-                'image_url': p.images.filter(est_principale=True).first().image.url if p.images.exists() else 
-                            'https://via.placeholder.com/300x200?text=Image+non+disponible',
-                'url': reverse('catalog:detail', kwargs={'pk': p.id, 'slug': p.slug})
-            } for p in suggestions]
-            
-        return []
-        
+
+        # Produits les mieux notés des catégories préférées, hors produits déjà
+        # consultés : quelques candidats par suggestion, départagés par l'affinité
+        preferees = [categorie_id for categorie_id, _ in affinites.most_common(3)]
+        candidats = list(
+            eligibles()
+            .filter(categorie_id__in=preferees)
+            .exclude(pk__in=[produit_id for produit_id, _ in history])
+            .order_by('-note_moyenne', '-nombre_avis', '-id')
+            .values_list('id', 'categorie_id', 'note_moyenne')[:limit * 4]
+        )
+        candidats.sort(
+            key=lambda candidat: affinites[candidat[1]] * (1 + float(candidat[2] or 0) / 5),
+            reverse=True,
+        )
+        return cartes([produit_id for produit_id, _, _ in candidats[:limit]])
+
     except Exception as e:
         logger.error(f"Erreur dans suggest_from_history: {str(e)}", exc_info=True)
         return []
 
-def get_suggestions(user_id=None, limit=5):
+def get_suggestions(user_id=None, limit=5, session_key=None):
     """
     Récupère des suggestions de produits personnalisées.
-    
+
     Args:
         user_id (int, optional): ID de l'utilisateur
         limit (int): Nombre maximum de suggestions à retourner
-        
+        session_key (str, optional): Session d'un visiteur anonyme
+
     Returns:
-        list: Liste de dictionnaires contenant les suggestions de produits
+        list: Cartes des produits suggérés (voir ai.cartes)
     """
     try:
         # 1. D'abord essayer de récupérer des suggestions basées sur l'historique
-        if user_id:
-            # Ici, on pourrait récupérer l'historique réel de l'utilisateur
-            # Pour l'instant, on utilise une liste vide
-            user_history = []
-            suggestions = suggest_from_history(user_id, user_history)
-            
-            # Si on a des suggestions, on les retourne
-            if suggestions:
-                return suggestions[:limit]
-        
-        # 2. Si pas d'historique ou pas d'utilisateur, retourner les meilleurs produits
-        produits = Produit.objects.filter(
-            est_actif=True,
-            en_stock=True
-        ).prefetch_related(
-            Prefetch('images', queryset=ImageProduit.objects.filter(est_principale=True))
-        ).order_by('-note_moyenne', '?')[:limit]
-        
-        # Construire la liste des suggestions
-        suggestions = []
-        for produit in produits:
-            try:
-                # Obtenir l'URL de l'image principale
-                image_url = None
-                if hasattr(produit, 'images') and produit.images.exists():
-                    main_image = produit.images.first()
-                    if main_image and hasattr(main_image, 'image') and hasattr(main_image.image, 'url'):
-                        image_url = main_image.image.url
-                
-                # Si aucune image valide n'est trouvée
-                if not image_url:
-                    image_url = 'https://via.placeholder.com/300x200?text=Image+non+disponible'
-                
-                # Construire l'URL du produit
-                try:
-                    product_url = reverse('catalog:detail', kwargs={
-                        'pk': produit.id,
-                        'slug': produit.slug or 'produit'
-                    })
-                except:
-                    product_url = f'/catalogue/produit/{produit.id}/'
-                
-                # Ajouter la suggestion
-                suggestions.append({
-                    "id": produit.id,
-                    "title": produit.nom,
-                    "price": f"{float(produit.prix):.2f}" if produit.prix is not None else "0.00",
-                    "image_url": image_url,
-                    "url": product_url
-                })
-                
-            except (AttributeError, ObjectDoesNotExist) as e:
-                logger.warning(f"Erreur avec le produit {getattr(produit, 'id', 'inconnu')}: {str(e)}")
-                continue
-        
+        suggestions = suggest_from_history(user_id, historique(user_id, session_key), limit)
+
+        # 2. Compléter avec des produits tirés au hasard parmi les mieux notés
+        # (sans ORDER BY RANDOM())
+        if len(suggestions) < limit:
+            manquantes = limit - len(suggestions)
+            deja = [suggestion['id'] for suggestion in suggestions]
+            suggestions += cartes(ids_au_hasard(MIEUX_NOTES, manquantes, exclus=deja))[:manquantes]
+
         # Si on a des suggestions, les retourner
         if suggestions:
             return suggestions
-            
+
         # Si aucune suggestion n'est disponible, retourner une suggestion par défaut
-        return [{
-            "id": 0,
-            "title": "Découvrez nos produits",
-            "price": "0.00",
-            "image_url": "https://via.placeholder.com/300x200?text=Découvrir+nos+produits",
-            "url": "/catalogue/"
-        }]
-        
+        return [suggestion_par_defaut()]
+
     except Exception as e:
         logger.error(f"Erreur critique dans get_suggestions: {str(e)}", exc_info=True)
-        
+
         # En cas d'erreur critique, retourner une suggestion d'erreur
-        return [{
-            "id": 0,
-            "title": "Découvrez nos produits",
-            "price": "0.00",
-            "image_url": "https://via.placeholder.com/300x200?text=Découvrir+nos+produits",
-            "url": "/catalogue/"
-        }]
+        return [suggestion_par_defaut()]
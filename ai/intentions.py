@@ -0,0 +1,224 @@
+"""
+Détection de l'intention des messages du chatbot (voir ai.chatbot).
+
+Le message est découpé une seule fois en mots normalisés (minuscules, sans
+accents, voir catalog.search.analyse), qui servent aux deux détecteurs :
+
+- les expressions de MOTS_CLES sont compilées en un arbre de mots, parcouru
+  depuis chaque mot du message (au plus la longueur de l'expression la plus
+  longue) : toutes les expressions sont cherchées en une passe ;
+- un classifieur linéaire (TF-IDF des racines et des paires de mots, puis
+  régression logistique multinomiale, calculée avec NumPy) est entraîné sur
+  les exemples annotés du fichier AI_CHATBOT_EXEMPLES, au premier usage
+  dans le processus (environ 0,1 s pour une centaine d'exemples).
+
+L'intention retenue est celle dont la probabilité donnée par le classifieur,
+augmentée de BONUS_MOT_CLE si une de ses expressions est dans le message,
+est la plus forte ; en dessous de AI_CHATBOT_SEUIL, aucune intention n'est
+retenue.
+"""
+import json
+import math
+import threading
+from collections import Counter, namedtuple
+from pathlib import Path
+
+from django.conf import settings
+
+from catalog.search.analyse import mots, raciniser
+
+FICHIER_EXEMPLES = Path(__file__).resolve().parent / 'donnees' / 'intentions.json'
+
+# Expressions qui signalent une intention (comparées sans accents ni majuscules)
+MOTS_CLES = {
+    'greeting': ['bonjour', 'bonsoir', 'salut', 'coucou', 'hey', 'hello'],
+    'thanks': ['merci', 'remercie', 'parfait', 'génial'],
+    'goodbye': ['au revoir', 'à plus', 'à bientôt', 'à la prochaine', 'bye', 'ciao'],
+    'help': ['aide', 'aider', 'aidez', 'comment faire', 'comment ça marche'],
+    'order': ['commande', 'commandes', 'colis', 'livraison', 'suivi', 'expédition', 'remboursement'],
+}
+BONUS_MOT_CLE = 0.5
+
+Intention = namedtuple('Intention', ['nom', 'confiance', 'mots'])
+
+
+def tokeniser(texte):
+    """Mots normalisés du message, mots vides compris (« où est ma commande » en dépend)."""
+    return mots(texte)
+
+
+def caracteristiques(tokens):
+    """Termes du classifieur : racines des mots et paires de mots consécutifs."""
+    return [raciniser(mot) for mot in tokens] + [f'{a} {b}' for a, b in zip(tokens, tokens[1:])]
+
+
+class AutomateMotsCles:
+    """Arbre des expressions (une branche par mot), parcouru sur les mots du message."""
+    FIN = ''
+
+    def __init__(self, mots_cles):
+        self.racine = {}
+        for intention, expressions in mots_cles.items():
+            for expression in expressions:
+                noeud = self.racine
+                for mot in mots(expression):
+                    noeud = noeud.setdefault(mot, {})
+                noeud[self.FIN] = intention
+
+    def intentions(self, tokens):
+        """Intentions dont une expression figure dans les mots, avec leur nombre d'occurrences."""
+        trouvees = Counter()
+        for debut in range(len(tokens)):
+            noeud = self.racine
+            for position in range(debut, len(tokens)):
+                noeud = noeud.get(tokens[position])
+                if noeud is None:
+                    break
+                if self.FIN in noeud:
+                    trouvees[noeud[self.FIN]] += 1
+        return trouvees
+
+
+class ClassifieurIntentions:
+    """TF-IDF + régression logistique multinomiale, en NumPy."""
+
+    def __init__(self):
+        self.intentions = []
+        self.vocabulaire = {}
+        self.idf = None
+        self.poids = None
+        self.biais = None
+
+    def vecteur(self, tokens):
+        """
+        Termes connus du message et leur poids TF-IDF (normé).
+
+        Returns:
+            tuple: (indices, valeurs), tableaux NumPy
+        """
+        import numpy as np
+
+        comptes = Counter(
+            self.vocabulaire[terme] for terme in caracteristiques(tokens) if terme in self.vocabulaire
+        )
+        indices = np.fromiter(comptes, dtype=np.int64, count=len(comptes))
+        valeurs = np.fromiter(
+            (1 + math.log(nombre) for nombre in comptes.values()), dtype=np.float32, count=len(comptes)
+        ) * self.idf[indices]
+        norme = np.linalg.norm(valeurs)
+        return indices, valeurs / norme if norme else valeurs
+
+    def matrice(self, liste_tokens):
+        """Vecteurs TF-IDF de plusieurs messages (une ligne par message)."""
+        import numpy as np
+
+        x = np.zeros((len(liste_tokens), len(self.vocabulaire)), dtype=np.float32)
+        for ligne, tokens in enumerate(liste_tokens):
+            indices, valeurs = self.vecteur(tokens)
+            x[ligne, indices] = valeurs
+        return x
+
+    def entrainer(self, liste_tokens, etiquettes, iterations=500, pas=5.0, regularisation=1e-4):
+        """Apprend les poids par descente de gradient (entropie croisée, régularisation L2)."""
+        import numpy as np
+
+        self.intentions = sorted(set(etiquettes))
+        documents = [set(caracteristiques(tokens)) for tokens in liste_tokens]
+        frequences = Counter(terme for termes in documents for terme in termes)
+        self.vocabulaire = {terme: numero for numero, terme in enumerate(sorted(frequences))}
+        self.idf = np.array(
+            [math.log((1 + len(documents)) / (1 + frequences[terme])) + 1 for terme in sorted(frequences)],
+            dtype=np.float32,
+        )
+
+        x = self.matrice(liste_tokens)
+        y = np.zeros((len(etiquettes), len(self.intentions)), dtype=np.float32)
+        y[np.arange(len(etiquettes)), [self.intentions.index(etiquette) for etiquette in etiquettes]] = 1
+        self.poids = np.zeros((x.shape[1], y.shape[1]), dtype=np.float32)
+        self.biais = np.zeros(y.shape[1], dtype=np.float32)
+        for _ in range(iterations):
+            erreur = (self.softmax(x @ self.poids + self.biais) - y) / len(x)
+            self.poids -= pas * (x.T @ erreur + regularisation * self.poids)
+            self.biais -= pas * erreur.sum(axis=0)
+
+    @staticmethod
+    def softmax(scores):
+        import numpy as np
+
+        scores = scores - scores.max(axis=-1, keepdims=True)
+        exp = np.exp(scores)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def probabilites(self, tokens):
+        indices, valeurs = self.vecteur(tokens)
+        return self.softmax(valeurs @ self.poids[indices] + self.biais)
+
+    def probabilites_lot(self, liste_tokens):
+        return self.softmax(self.matrice(liste_tokens) @ self.poids + self.biais)
+
+
+def charger_exemples(chemin=None):
+    """
+    Exemples annotés : fichier JSON {intention: [messages]}.
+
+    Returns:
+        list: Couples (message, intention)
+    """
+    chemin = chemin or getattr(settings, 'AI_CHATBOT_EXEMPLES', None) or FICHIER_EXEMPLES
+    with open(chemin, encoding='utf-8') as fichier:
+        donnees = json.load(fichier)
+    return [(message, intention) for intention, messages in donnees.items() for message in messages]
+
+
+class MoteurIntentions:
+    """Mots-clés et classifieur, entraîné à la construction."""
+
+    def __init__(self, exemples=None, mots_cles=None):
+        exemples = charger_exemples() if exemples is None else exemples
+        self.automate = AutomateMotsCles(MOTS_CLES if mots_cles is None else mots_cles)
+        self.classifieur = ClassifieurIntentions()
+        self.classifieur.entrainer([tokeniser(message) for message, _ in exemples], [intention for _, intention in exemples])
+        self.seuil = getattr(settings, 'AI_CHATBOT_SEUIL', 0.5)
+
+    def decider(self, tokens, probabilites):
+        trouvees = self.automate.intentions(tokens)
+        scores = {
+            intention: float(probabilite) + (BONUS_MOT_CLE if intention in trouvees else 0)
+            for intention, probabilite in zip(self.classifieur.intentions, probabilites)
+        }
+        # Intention des mots-clés absente des exemples
+        for intention in trouvees.keys() - scores.keys():
+            scores[intention] = BONUS_MOT_CLE
+        nom = max(scores, key=scores.get)
+        confiance = min(scores[nom], 1.0)
+        return Intention(nom if confiance >= self.seuil else None, confiance, tokens)
+
+    def detecter(self, texte):
+        """
+        Returns:
+            Intention: nom (None si aucune intention n'est assez sûre), confiance et mots du message
+        """
+        tokens = tokeniser(texte)
+        return self.decider(tokens, self.classifieur.probabilites(tokens))
+
+    def detecter_lot(self, textes):
+        """Comme detecter(), pour plusieurs messages (une multiplication de matrices pour tous)."""
+        liste_tokens = [tokeniser(texte) for texte in textes]
+        return [
+            self.decider(tokens, probabilites)
+            for tokens, probabilites in zip(liste_tokens, self.classifieur.probabilites_lot(liste_tokens))
+        ]
+
+
+_moteur = None
+_verrou_moteur = threading.Lock()
+
+
+def get_moteur():
+    """Retourne le moteur du processus, entraîné au premier appel."""
+    global _moteur
+    if _moteur is None:
+        with _verrou_moteur:
+            if _moteur is None:
+                _moteur = MoteurIntentions()
+    return _moteur
@@ -1,70 +1,218 @@
 """
 Module de recommandation de produits personnalisée
+
+Filtrage collaboratif article-article sur les achats : deux produits sont
+proches quand les mêmes clients les ont achetés (similarité cosinus entre
+les colonnes de la matrice clients x produits).
+
+- entrainer() calcule hors ligne, avec NumPy et SciPy (matrices creuses),
+  les AI_RECO_VOISINS plus proches voisins de chaque produit et les
+  enregistre (ai_user.models.VoisinsProduit). Après une première fois, seuls
+  les produits achetés par les clients dont une commande a changé sont
+  recalculés (commande entrainer_recommandations).
+- get_recommendations() ne fait que lire les listes de voisins des achats
+  récents du client (et du produit consulté) et les fusionner : aucun calcul
+  de similarité pendant la requête.
 """
-import random
+import logging
+from collections import Counter
+
 from django.conf import settings
-from django.db.models import Count, Avg
-from catalog.models import Produit, Categorie
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from orders.models import Commande, LigneCommande
+
+from .cartes import cartes
+from .echantillonnage import eligibles
+
+logger = logging.getLogger(__name__)
+
+
+def parametre(nom, defaut):
+    return getattr(settings, nom, defaut)
+
+
+def achats_recents(user_id, limite=None):
+    """Produits achetés par le client, du plus récent au plus ancien, sans doublon."""
+    limite = limite or parametre('AI_RECO_ACHATS_RECENTS', 20)
+    produits = (
+        LigneCommande.objects.filter(commande__utilisateur_id=user_id)
+        .exclude(commande__statut=Commande.STATUT_ANNULE)
+        .order_by('-commande__date_commande', '-commande_id')
+        .values_list('produit_id', flat=True)[:limite * 3]
+    )
+    return list(dict.fromkeys(produits))[:limite]
+
 
-def get_recommendations(user_id=None, history=None, top_n=6):
+def scores_voisins(graines):
+    """
+    Fusionne les listes de voisins des produits `graines` (du plus important
+    au moins important) : le score d'un candidat est la somme des similarités
+    avec chaque graine, pondérées par le rang de la graine.
+
+    Returns:
+        Counter: produit_id -> score, sans les graines
+    """
+    from ai_user.models import VoisinsProduit
+
+    poids = {produit_id: 1 / (rang + 1) for rang, produit_id in enumerate(graines)}
+    scores = Counter()
+    for produit_id, voisins in VoisinsProduit.objects.filter(produit_id__in=poids).values_list('produit_id', 'voisins'):
+        for voisin_id, similarite in voisins:
+            scores[voisin_id] += poids[produit_id] * similarite
+    for produit_id in poids:
+        scores.pop(produit_id, None)
+    return scores
+
+
+def get_recommendations(user_id=None, history=None, top_n=6, produit_id=None):
     """
     Retourne une liste de recommandations de produits basée sur l'historique de l'utilisateur
     ou des produits populaires si l'utilisateur est anonyme.
-    
+
     Args:
         user_id (int, optional): ID de l'utilisateur connecté
         history (list, optional): Historique des produits consultés
         top_n (int): Nombre de recommandations à retourner
-        
+        produit_id (int, optional): Produit consulté, dont les voisins passent en premier
+
     Returns:
-        list: Liste de dictionnaires contenant les informations des produits recommandés
+        list: Cartes des produits recommandés (voir ai.cartes)
     """
     try:
-        # Récupérer les produits en stock avec leurs images
-        produits_disponibles = Produit.objects.filter(
-            stock__gt=0  # Uniquement les produits en stock
-        ).select_related('categorie').prefetch_related('images')
-        
-        # Si l'utilisateur est connecté, on peut personnaliser les recommandations
-        if user_id and history:
-            # Ici, on pourrait implémenter une logique de recommandation personnalisée
-            # basée sur l'historique de navigation/achat de l'utilisateur
-            # Pour l'instant, on sélectionne des produits aléatoires
-            produits_recommandes = list(produits_disponibles.order_by('?')[:top_n])
-        else:
-            # Pour les utilisateurs anonymes, on retourne les produits les mieux notés
-            produits_recommandes = list(produits_disponibles.annotate(
-                avg_rating=Avg('commentaires__note')
-            ).order_by('-avg_rating', '?')[:top_n])
-        
-        # Formater les résultats pour le template
+        graines = []
+        if produit_id:
+            graines.append(int(produit_id))
+        graines += [int(pk) for pk in history or []]
+        if user_id:
+            graines += achats_recents(user_id)
+        graines = list(dict.fromkeys(graines))
+
         recommendations = []
-        for produit in produits_recommandes:
-            # Récupérer l'image principale du produit ou une image par défaut
-            image_url = None
-            if produit.images.exists():
-                image_url = produit.images.first().image.url
-            else:
-                image_url = f"https://via.placeholder.com/300x200?text={produit.nom[:20]}"
-            
-            # Construire l'URL du produit
-            produit_url = f"/catalogue/produit/{produit.id}/"
-            
-            recommendations.append({
-                'id': produit.id,
-                'nom': produit.nom,
-                'description': produit.description[:100] + '...' if produit.description else '',
-                'prix': float(produit.prix),
-                'categorie': produit.categorie.nom if produit.categorie else '',
-                'url': produit_url,
-                'image': image_url,
-                'stock': produit.stock,
-                'note_moyenne': float(produit.moyenne_notes() or 0)
-            })
-        
+        scores = scores_voisins(graines) if graines else Counter()
+        if scores:
+            # Quelques candidats de plus : certains peuvent être inactifs ou épuisés
+            candidats = [pk for pk, _ in scores.most_common(top_n * 3)]
+            recommendations = cartes(candidats)[:top_n]
+
+        if len(recommendations) < top_n:
+            # Complément (visiteur anonyme, client sans achat) : les mieux notés
+            exclus = set(graines) | {carte['id'] for carte in recommendations}
+            mieux_notes = (
+                eligibles().exclude(pk__in=exclus)
+                .order_by('-note_moyenne', '-nombre_avis', '-id')
+                .values_list('id', flat=True)[:top_n - len(recommendations)]
+            )
+            recommendations += cartes(list(mieux_notes))
+
         return recommendations
-        
-    except Exception as e:
+
+    except Exception:
         # En cas d'erreur, retourner une liste vide
-        print(f"Erreur dans get_recommendations: {str(e)}")
+        logger.exception("Erreur dans get_recommendations")
         return []
+
+
+def derniere_date_calcul():
+    from ai_user.models import VoisinsProduit
+    return VoisinsProduit.objects.aggregate(date=Max('date_calcul'))['date']
+
+
+def produits_a_recalculer(depuis):
+    """
+    Produits dont les voisins ont pu changer depuis `depuis` : ceux des
+    clients dont une commande a été passée ou a changé de statut. Deux
+    produits n'ont de clients communs qu'à travers de tels clients.
+    """
+    clients = Commande.objects.filter(date_mise_a_jour__gte=depuis).values('utilisateur_id')
+    return set(
+        LigneCommande.objects.filter(commande__utilisateur_id__in=clients)
+        .order_by().values_list('produit_id', flat=True).distinct()
+    )
+
+
+def entrainer(complet=False, k=None):
+    """
+    Calcule les plus proches voisins des produits et les enregistre.
+
+    Sans `complet`, et si un calcul a déjà eu lieu, seuls les produits des
+    clients dont les commandes ont changé depuis sont recalculés : leurs
+    voisins sont exacts, ceux des autres produits gardent les similarités du
+    calcul précédent (le nombre d'acheteurs de leurs voisins a pu bouger un
+    peu). Un calcul complet de temps en temps remet tout à jour.
+
+    Returns:
+        dict: produits (recalculés), voisins (enregistrés), clients, complet
+    """
+    import numpy as np
+    from scipy import sparse
+    from ai_user.models import VoisinsProduit
+
+    k = k or parametre('AI_RECO_VOISINS', 50)
+    minimum = parametre('AI_RECO_MIN_CLIENTS_COMMUNS', 1)
+    debut = timezone.now()
+    depuis = None if complet else derniere_date_calcul()
+    complet = depuis is None
+
+    # Matrice clients x produits (1 si le client a acheté le produit)
+    paires = np.array(
+        list(
+            LigneCommande.objects.exclude(commande__statut=Commande.STATUT_ANNULE)
+            .order_by().values_list('commande__utilisateur_id', 'produit_id').distinct()
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    clients, ligne_client = np.unique(paires[:, 0], return_inverse=True)
+    produits, colonne_produit = np.unique(paires[:, 1], return_inverse=True)
+    achats = sparse.csr_matrix(
+        (np.ones(len(paires), dtype=np.float32), (ligne_client.ravel(), colonne_produit.ravel())),
+        shape=(len(clients), len(produits)),
+    )
+
+    if complet:
+        a_calculer = np.arange(len(produits))
+    else:
+        cibles = produits_a_recalculer(depuis)
+        a_calculer = np.flatnonzero(np.isin(produits, np.fromiter(cibles, dtype=np.int64, count=len(cibles))))
+
+    # Clients communs des produits à calculer avec tous les autres, puis
+    # similarité cosinus : communs / racine(acheteurs de i x acheteurs de j)
+    acheteurs = np.asarray(achats.sum(axis=0)).ravel()
+    communs = (achats[:, a_calculer].T @ achats).tocsr()
+    lignes = np.repeat(np.arange(communs.shape[0]), np.diff(communs.indptr))
+    garder = (communs.indices != a_calculer[lignes]) & (communs.data >= minimum)
+    inverse = 1 / np.sqrt(acheteurs)
+    communs.data = np.where(garder, communs.data * inverse[a_calculer][lignes] * inverse[communs.indices], 0)
+    communs.eliminate_zeros()
+
+    # k meilleurs voisins de chaque ligne
+    lignes_voisins = []
+    for ligne in range(communs.shape[0]):
+        debut_ligne, fin_ligne = communs.indptr[ligne], communs.indptr[ligne + 1]
+        scores = communs.data[debut_ligne:fin_ligne]
+        colonnes = communs.indices[debut_ligne:fin_ligne]
+        if len(scores) > k:
+            meilleurs = np.argpartition(-scores, k)[:k]
+            scores, colonnes = scores[meilleurs], colonnes[meilleurs]
+        ordre = np.argsort(-scores, kind='stable')
+        lignes_voisins.append(VoisinsProduit(
+            produit_id=int(produits[a_calculer[ligne]]),
+            voisins=[[int(produits[colonne]), round(float(score), 4)] for colonne, score in zip(colonnes[ordre], scores[ordre])],
+            date_calcul=debut,
+        ))
+
+    with transaction.atomic():
+        anciens = VoisinsProduit.objects.all()
+        if not complet:
+            # Y compris les produits qui n'ont plus d'achat (commandes annulées)
+            anciens = anciens.filter(produit_id__in=cibles)
+        anciens.delete()
+        VoisinsProduit.objects.bulk_create(lignes_voisins, batch_size=2000)
+    return {
+        'produits': len(lignes_voisins),
+        'voisins': sum(len(ligne.voisins) for ligne in lignes_voisins),
+        'clients': len(clients),
+        'complet': complet,
+    }
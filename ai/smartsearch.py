@@ -1,11 +1,380 @@
 """
-Recherche intelligente (correction orthographique, synonymes, etc.) (mock/demo)
+Recherche intelligente : tolérance aux fautes de frappe et synonymes.
+
+Chaque worker tient en mémoire un index des noms de produits et de catégories :
+- un vocabulaire (mot -> entrées qui le contiennent), trié pour la recherche
+  par préfixe pendant la saisie ;
+- un index de trigrammes de caractères (trigramme -> mots du vocabulaire),
+  qui retrouve en quelques microsecondes les mots proches d'un mot mal
+  orthographié ; les candidats sont ensuite départagés par distance d'édition.
+
+Les synonymes viennent du paramètre AI_SMARTSEARCH_SYNONYMES (voir
+SYNONYMES_PAR_DEFAUT pour le format).
 """
+import bisect
+import heapq
+import threading
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.urls import reverse
+
+from catalog.search.analyse import MOTS_VIDES, mots
+from catalog.search.memoire import IndexCatalogueMemoire
+
+# Groupes de mots équivalents (sans accents, en minuscules)
+SYNONYMES_PAR_DEFAUT = [
+    ['telephone', 'smartphone', 'portable', 'mobile'],
+    ['ordinateur', 'pc', 'laptop'],
+    ['ecran', 'moniteur'],
+    ['casque', 'ecouteurs'],
+    ['enceinte', 'baffle'],
+    ['chaussure', 'basket', 'soulier'],
+    ['veste', 'blouson'],
+    ['sac', 'sacoche'],
+    ['canape', 'sofa'],
+    ['tv', 'television', 'televiseur'],
+]
+
+# Similarités attribuées selon la façon dont un mot de la requête est trouvé
+SIMILARITE_EXACTE = 1.0
+SIMILARITE_SYNONYME = 0.9
+SIMILARITE_PREFIXE = 0.8
+
+# Nombre maximal de mots du vocabulaire retenus pour un préfixe
+MAX_MOTS_PREFIXE = 50
+
+Entree = namedtuple('Entree', ['cle', 'id', 'type', 'nom', 'slug', 'categorie_id', 'prix', 'mots'])
+
+
+def mots_significatifs(texte):
+    """Mots normalisés d'un texte, sans les mots vides."""
+    return [mot for mot in mots(texte) if mot not in MOTS_VIDES]
+
+
+def trigrammes(mot):
+    """Trigrammes de caractères d'un mot, complété par des espaces (« ab » -> «  a », « ab », « ab »)."""
+    mot = f'  {mot} '
+    return {mot[i:i + 3] for i in range(len(mot) - 2)}
+
+
+def distance_max(mot):
+    """Nombre de fautes tolérées, selon la longueur du mot."""
+    if len(mot) <= 3:
+        return 0
+    if len(mot) <= 5:
+        return 1
+    if len(mot) <= 9:
+        return 2
+    return 3
+
+
+def levenshtein(a, b, maximum):
+    """
+    Distance d'édition entre a et b (une inversion de deux lettres voisines
+    compte pour une faute), ou maximum + 1 dès qu'elle dépasse `maximum`
+    (le calcul s'arrête alors au plus tôt).
+    """
+    if abs(len(a) - len(b)) > maximum:
+        return maximum + 1
+    avant_precedente = None
+    precedente = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        courante = [i]
+        for j, cb in enumerate(b, 1):
+            valeur = min(
+                precedente[j] + 1,
+                courante[j - 1] + 1,
+                precedente[j - 1] + (ca != cb),
+            )
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                valeur = min(valeur, avant_precedente[j - 2] + 1)
+            courante.append(valeur)
+        if min(courante) > maximum:
+            return maximum + 1
+        avant_precedente, precedente = precedente, courante
+    return precedente[-1]
+
+
+def prefixe_commun(a, b):
+    n = 0
+    for ca, cb in zip(a, b):
+        if ca != cb:
+            break
+        n += 1
+    return n
+
+
+def charger_synonymes():
+    """
+    Construit le dictionnaire mot -> synonymes à partir de AI_SMARTSEARCH_SYNONYMES,
+    une liste de groupes de mots équivalents.
+    """
+    synonymes = {}
+    for groupe in getattr(settings, 'AI_SMARTSEARCH_SYNONYMES', SYNONYMES_PAR_DEFAUT):
+        groupe = {mot for terme in groupe for mot in mots(terme)}
+        for mot in groupe:
+            synonymes.setdefault(mot, set()).update(groupe - {mot})
+    return synonymes
+
+
+class IndexRechercheFloue(IndexCatalogueMemoire):
+    """Index des noms de produits et de catégories, tolérant aux fautes."""
+    PRODUIT_CHAMPS = IndexCatalogueMemoire.PRODUIT_CHAMPS + ('prix', 'prix_promotionnel')
+
+    def __init__(self):
+        self.synonymes = charger_synonymes()
+        super().__init__()
+
+    def vider(self):
+        super().vider()
+        self.entrees = {}
+        self.vocabulaire = {}
+        self.mots_tries = []
+        self.index_trigrammes = {}
+        # Entrées de chaque mot triées par longueur de nom, calculées à la demande
+        self._ordre_mots = {}
+        self.noms_categories = {}
+
+    # Construction et mises à jour
 
-def smart_search(query):
+    def _ajouter_mot(self, mot, cle):
+        self._ordre_mots.pop(mot, None)
+        cles = self.vocabulaire.get(mot)
+        if cles is None:
+            cles = self.vocabulaire[mot] = set()
+            bisect.insort(self.mots_tries, mot)
+            for trigramme in trigrammes(mot):
+                self.index_trigrammes.setdefault(trigramme, set()).add(mot)
+        cles.add(cle)
+
+    def _retirer_mot(self, mot, cle):
+        cles = self.vocabulaire.get(mot)
+        if cles is None:
+            return
+        cles.discard(cle)
+        self._ordre_mots.pop(mot, None)
+        if not cles:
+            del self.vocabulaire[mot]
+            del self.mots_tries[bisect.bisect_left(self.mots_tries, mot)]
+            for trigramme in trigrammes(mot):
+                mots_trigramme = self.index_trigrammes[trigramme]
+                mots_trigramme.discard(mot)
+                if not mots_trigramme:
+                    del self.index_trigrammes[trigramme]
+
+    def _placer(self, entree):
+        with self.verrou:
+            self._enlever(entree.cle)
+            self.entrees[entree.cle] = entree
+            for mot in entree.mots:
+                self._ajouter_mot(mot, entree.cle)
+
+    def _enlever(self, cle):
+        with self.verrou:
+            entree = self.entrees.pop(cle, None)
+            if entree is not None:
+                for mot in entree.mots:
+                    self._retirer_mot(mot, cle)
+
+    def placer_produit(self, valeurs):
+        """Ajoute ou remplace un produit, à partir d'un dictionnaire de PRODUIT_CHAMPS."""
+        cle = ('produit', valeurs['id'])
+        if not valeurs['est_actif']:
+            self._enlever(cle)
+            return
+        prix = valeurs['prix_promotionnel'] or valeurs['prix']
+        self._placer(Entree(
+            cle=cle,
+            id=valeurs['id'],
+            type='produit',
+            nom=valeurs['nom'],
+            slug=valeurs['slug'],
+            categorie_id=valeurs['categorie_id'],
+            prix=float(prix) if prix is not None else None,
+            mots=frozenset(mots_significatifs(valeurs['nom'])),
+        ))
+
+    def placer_categorie(self, valeurs):
+        """Ajoute ou remplace une catégorie, à partir d'un dictionnaire de CATEGORIE_CHAMPS."""
+        cle = ('categorie', valeurs['id'])
+        with self.verrou:
+            if not valeurs['est_active']:
+                self.noms_categories.pop(valeurs['id'], None)
+                self._enlever(cle)
+                return
+            self.noms_categories[valeurs['id']] = valeurs['nom']
+            self._placer(Entree(
+                cle=cle,
+                id=valeurs['id'],
+                type='categorie',
+                nom=valeurs['nom'],
+                slug=valeurs['slug'],
+                categorie_id=None,
+                prix=None,
+                mots=frozenset(mots_significatifs(valeurs['nom'])),
+            ))
+
+    def retirer_produit(self, produit_id):
+        self._enlever(('produit', produit_id))
+
+    def retirer_categorie(self, categorie_id):
+        with self.verrou:
+            self.noms_categories.pop(categorie_id, None)
+            self._enlever(('categorie', categorie_id))
+
+    def ids_indexes(self, type_entree):
+        return [cle[1] for cle in self.entrees if cle[0] == type_entree]
+
+    # Recherche
+
+    def mots_proches(self, mot, dernier=False):
+        """
+        Mots du vocabulaire proches de `mot`, avec leur similarité (entre 0 et 1).
+
+        Le dernier mot de la requête est aussi cherché comme préfixe, l'utilisateur
+        étant probablement en train de le taper.
+        """
+        resultats = {}
+        if mot in self.vocabulaire:
+            resultats[mot] = SIMILARITE_EXACTE
+        for synonyme in self.synonymes.get(mot, ()):
+            if synonyme in self.vocabulaire:
+                resultats.setdefault(synonyme, SIMILARITE_SYNONYME)
+
+        if dernier:
+            debut = bisect.bisect_left(self.mots_tries, mot)
+            for candidat in self.mots_tries[debut:debut + MAX_MOTS_PREFIXE]:
+                if not candidat.startswith(mot):
+                    break
+                if candidat not in resultats:
+                    resultats[candidat] = SIMILARITE_PREFIXE + 0.2 * len(mot) / len(candidat)
+
+        maximum = distance_max(mot)
+        if maximum:
+            # Une faute détruit au plus trois trigrammes : on écarte sans calcul
+            # les mots qui n'en partagent pas assez
+            trigrammes_mot = trigrammes(mot)
+            seuil = max(1, len(trigrammes_mot) - 3 * maximum)
+            communs = Counter()
+            for trigramme in trigrammes_mot:
+                communs.update(self.index_trigrammes.get(trigramme, ()))
+            for candidat, nombre in communs.items():
+                if nombre < seuil or candidat in resultats:
+                    continue
+                distance = levenshtein(mot, candidat, maximum)
+                if distance <= maximum:
+                    # Les fautes en fin de mot sont plus fréquentes qu'au début
+                    bonus = 0.05 * min(prefixe_commun(mot, candidat), 4)
+                    resultats[candidat] = min(
+                        SIMILARITE_SYNONYME, 1 - distance / (len(mot) + 1) + bonus
+                    )
+        return resultats
+
+    def rechercher(self, requete, limite=10):
+        """
+        Retourne les entrées les plus pertinentes pour `requete`, sous forme de
+        couples (score, Entree) triés par score décroissant.
+        """
+        termes = mots_significatifs(requete)
+        if not termes:
+            return []
+        self.preparer()
+
+        with self.verrou:
+            # Pour chaque terme : mots du vocabulaire retenus et leur similarité
+            par_terme = [
+                proches for proches in (
+                    self.mots_proches(terme, dernier=position == len(termes) - 1)
+                    for position, terme in enumerate(termes)
+                ) if proches
+            ]
+            if not par_terme:
+                return []
+
+            # Entrées qui contiennent tous les termes ; à défaut, au moins un
+            if len(par_terme) == 1:
+                cles = self._meilleures_cles(par_terme[0], limite)
+            else:
+                ensembles = sorted((self._cles_terme(proches) for proches in par_terme), key=len)
+                cles = ensembles[0].intersection(*ensembles[1:])
+                if not cles:
+                    cles = set().union(*(self._meilleures_cles(proches, limite) for proches in par_terme))
+
+            def score(cle):
+                trouves = [s for s in (self._similarite(cle, proches) for proches in par_terme) if s]
+                couverture = len(trouves) / max(len(self.entrees[cle].mots), 1)
+                return sum(trouves) / len(termes) * (0.9 + 0.1 * min(couverture, 1))
+
+            meilleures = heapq.nlargest(limite, ((score(cle), cle) for cle in cles))
+            return [(valeur, self.entrees[cle]) for valeur, cle in meilleures]
+
+    def _cles_terme(self, proches):
+        """Entrées contenant au moins un des mots retenus pour un terme."""
+        if len(proches) == 1:
+            return self.vocabulaire[next(iter(proches))]
+        return set().union(*(self.vocabulaire[mot] for mot in proches))
+
+    def _similarite(self, cle, proches):
+        """Meilleure similarité entre les mots d'une entrée et les mots retenus pour un terme."""
+        return max((proches[mot] for mot in self.entrees[cle].mots if mot in proches), default=0)
+
+    def _meilleures_cles(self, proches, limite):
+        """
+        Les `limite` premières entrées de chaque mot retenu. Pour un même mot,
+        les entrées aux noms les plus courts (les mieux couvertes par la
+        requête) passent devant : cela suffit à trouver les meilleures.
+        """
+        cles = set()
+        for mot in proches:
+            ordre = self._ordre_mots.get(mot)
+            if ordre is None:
+                ordre = self._ordre_mots[mot] = sorted(
+                    self.vocabulaire[mot], key=lambda cle: len(self.entrees[cle].mots)
+                )
+            cles.update(ordre[:limite])
+        return cles
+
+    def serialiser(self, valeur, entree):
+        if entree.type == 'produit':
+            url = reverse('catalog:detail_produit', kwargs={'slug': entree.slug})
+            categorie = self.noms_categories.get(entree.categorie_id)
+        else:
+            url = reverse('catalog:produits_par_categorie', kwargs={'categorie_slug': entree.slug})
+            categorie = None
+        return {
+            'id': entree.id,
+            'nom': entree.nom,
+            'type': entree.type,
+            'categorie': categorie,
+            'prix': entree.prix,
+            'url': url,
+            'score': round(valeur, 3),
+        }
+
+
+_index = None
+_verrou_index = threading.Lock()
+
+
+def get_index():
+    """Retourne l'index du processus, créé (mais pas encore chargé) au premier appel."""
+    global _index
+    if _index is None:
+        with _verrou_index:
+            if _index is None:
+                _index = IndexRechercheFloue()
+    return _index
+
+
+def smart_search(query, limite=10):
     """
-    Retourne des résultats de recherche améliorés (mock).
+    Recherche tolérante aux fautes et aux synonymes dans les noms de produits
+    et de catégories.
+
+    Returns:
+        list: Dictionnaires (id, nom, type, categorie, prix, url, score)
+              triés par pertinence
     """
-    return [
-        {"id": 301, "nom": "Produit similaire à la recherche"}
-    ]
+    index = get_index()
+    return [index.serialiser(valeur, entree) for valeur, entree in index.rechercher(query, limite)]
@@ -0,0 +1,100 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ai import chatbot
+from ai.intentions import MoteurIntentions, charger_exemples
+from ai.smartsearch import get_index
+from catalog.management.catalogue_synthetique import creer_catalogue
+
+# Questions hors exemples : produits (avec fautes), commandes, messages sans intention
+QUESTIONS = [
+    'bonjour, je cherche une chaise de bureau', 'vous avez des casqes sans fil ?',
+    'où en est mon colis', 'merci pour tout', 'lampe noir', 'prix de la table en bois',
+    'comment je paie', 'ma commande est arrivée abîmée', 'salut !', 'blabla', 'à plus',
+]
+
+
+class AnnulerBenchmark(Exception):
+    """Levée pour annuler la transaction contenant le catalogue synthétique."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le moteur d'intentions du chatbot : durée d'entraînement, "
+        "exactitude en validation croisée sur les exemples annotés, et débit "
+        "(questions par seconde, dans un seul processus) de la détection seule "
+        "puis des réponses complètes, recherche dans un catalogue synthétique "
+        "comprise. Le catalogue est créé dans une transaction annulée à la fin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--catalogue', type=int, default=10000,
+            help="Taille du catalogue synthétique pour les réponses complètes (défaut : 10000, 0 pour les ignorer)",
+        )
+        parser.add_argument(
+            '--plis', type=int, default=5,
+            help="Nombre de plis de la validation croisée (défaut : 5)",
+        )
+        parser.add_argument(
+            '--questions', type=int, default=20000,
+            help="Nombre de questions pour la mesure du débit (défaut : 20000)",
+        )
+
+    def handle(self, *args, **options):
+        exemples = charger_exemples()
+        debut = time.perf_counter()
+        moteur = MoteurIntentions(exemples)
+        self.stdout.write(
+            f"Entraînement : {(time.perf_counter() - debut) * 1000:.0f} ms "
+            f"({len(exemples)} exemples, {len(moteur.classifieur.vocabulaire)} termes, "
+            f"{len(moteur.classifieur.intentions)} intentions)"
+        )
+
+        self.valider(exemples, options['plis'])
+
+        aleatoire = random.Random(7)
+        questions = [aleatoire.choice([message for message, _ in exemples] + QUESTIONS) for _ in range(options['questions'])]
+        self.debit("Détection", questions, lambda: [moteur.detecter(question) for question in questions])
+        self.debit("Détection par lot", questions, lambda: moteur.detecter_lot(questions))
+
+        if options['catalogue']:
+            try:
+                with transaction.atomic():
+                    creer_catalogue(options['catalogue'])
+                    get_index().charger()
+                    reponses = questions[:2000]
+                    self.debit(
+                        f"Réponses (catalogue de {options['catalogue']} produits)",
+                        reponses, lambda: [chatbot.ask_bot(question) for question in reponses],
+                    )
+                    raise AnnulerBenchmark
+            except AnnulerBenchmark:
+                pass
+
+    def valider(self, exemples, plis):
+        """Exactitude des intentions prédites pour des exemples écartés de l'entraînement."""
+        exemples = list(exemples)
+        random.Random(1).shuffle(exemples)
+        justes = justes_classifieur = 0
+        for pli in range(plis):
+            test = exemples[pli::plis]
+            entrainement = [exemple for numero, exemple in enumerate(exemples) if numero % plis != pli]
+            moteur = MoteurIntentions(entrainement)
+            classifieur = MoteurIntentions(entrainement, mots_cles={})
+            classifieur.seuil = 0
+            justes += sum(moteur.detecter(message).nom == intention for message, intention in test)
+            justes_classifieur += sum(classifieur.detecter(message).nom == intention for message, intention in test)
+        self.stdout.write(
+            f"Validation croisée ({plis} plis) : {justes / len(exemples):.0%} avec les mots-clés, "
+            f"{justes_classifieur / len(exemples):.0%} avec le classifieur seul"
+        )
+
+    def debit(self, libelle, questions, mesure):
+        debut = time.perf_counter()
+        mesure()
+        duree = time.perf_counter() - debut
+        self.stdout.write(f"{libelle} : {len(questions) / duree:,.0f} questions/s ({duree * 1000 / len(questions):.3f} ms par question)")
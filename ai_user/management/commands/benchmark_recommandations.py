@@ -0,0 +1,117 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from ai.reco import entrainer, get_recommendations
+from catalog.management.catalogue_synthetique import creer_catalogue
+from catalog.models import Produit
+from orders.models import Commande, LigneCommande
+
+# Produits voisins (identifiants consécutifs) formant un centre d'intérêt
+TAILLE_GROUPE = 40
+
+
+class AnnulerBenchmark(Exception):
+    """Levée pour annuler la transaction contenant les données synthétiques."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure l'entraînement (complet puis incrémental) et le temps de réponse "
+        "des recommandations sur un catalogue et des commandes synthétiques : "
+        "chaque client achète surtout dans deux groupes de produits, que les "
+        "recommandations doivent retrouver. Les données sont créées dans une "
+        "transaction annulée à la fin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produits', type=int, default=20000, help="Taille du catalogue (défaut : 20000)")
+        parser.add_argument('--clients', type=int, default=5000, help="Nombre de clients (défaut : 5000)")
+        parser.add_argument('--commandes', type=int, default=4, help="Commandes par client (défaut : 4)")
+        parser.add_argument('--requetes', type=int, default=300, help="Recommandations mesurées (défaut : 300)")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.mesurer(options)
+                raise AnnulerBenchmark
+        except AnnulerBenchmark:
+            pass
+
+    def mesurer(self, options):
+        aleatoire = random.Random(7)
+        debut = time.perf_counter()
+        creer_catalogue(options['produits'])
+        produits = list(Produit.objects.filter(reference__startswith='BENCH-').order_by('pk').values_list('pk', 'prix'))
+        groupes = [produits[i:i + TAILLE_GROUPE] for i in range(0, len(produits), TAILLE_GROUPE)]
+        User = get_user_model()
+        clients = User.objects.bulk_create([
+            User(username=f'bench-reco-{numero}') for numero in range(options['clients'])
+        ])
+        interets = {client.pk: aleatoire.sample(range(len(groupes)), 2) for client in clients}
+        self.creer_commandes(aleatoire, clients, options['commandes'], groupes, interets)
+        self.stdout.write(
+            f"  données      : {len(produits)} produits, {len(clients)} clients, "
+            f"{LigneCommande.objects.count()} lignes en {time.perf_counter() - debut:.1f} s"
+        )
+
+        debut = time.perf_counter()
+        resultat = entrainer(complet=True)
+        self.stdout.write(
+            f"  entraînement : {time.perf_counter() - debut:.2f} s "
+            f"({resultat['produits']} produits, {resultat['voisins']} voisins)"
+        )
+
+        # Une commande de plus pour 1 % des clients, puis calcul incrémental
+        self.creer_commandes(aleatoire, aleatoire.sample(clients, max(1, len(clients) // 100)), 1, groupes, interets)
+        debut = time.perf_counter()
+        resultat = entrainer()
+        self.stdout.write(
+            f"  incrémental  : {time.perf_counter() - debut:.2f} s ({resultat['produits']} produits recalculés)"
+        )
+
+        durees, requetes, pertinents, total = [], [], 0, 0
+        groupe_de = {pk: numero for numero, groupe in enumerate(groupes) for pk, _ in groupe}
+        for client in aleatoire.sample(clients, min(options['requetes'], len(clients))):
+            with CaptureQueriesContext(connection) as capture:
+                debut = time.perf_counter()
+                recommandations = get_recommendations(user_id=client.pk)
+                durees.append((time.perf_counter() - debut) * 1000)
+            requetes.append(len(capture.captured_queries))
+            pertinents += sum(groupe_de.get(reco['id']) in interets[client.pk] for reco in recommandations)
+            total += len(recommandations)
+        durees.sort()
+        self.stdout.write(
+            f"  réponse      : médiane {statistics.median(durees):.2f} ms, "
+            f"p95 {durees[int(len(durees) * 0.95)]:.2f} ms, max {durees[-1]:.2f} ms, "
+            f"{max(requetes)} requêtes au plus"
+        )
+        self.stdout.write(f"  pertinence   : {pertinents / max(total, 1):.0%} des produits recommandés dans les groupes du client")
+
+    def creer_commandes(self, aleatoire, clients, par_client, groupes, interets):
+        commandes = Commande.objects.bulk_create([
+            Commande(
+                utilisateur=client,
+                adresse_livraison='rue du Test', code_postal='75000', ville='Paris', pays='France',
+                montant_total=Decimal('10.00'), paye=True,
+            )
+            for client in clients
+            for _ in range(par_client)
+        ], batch_size=2000)
+        lignes = []
+        for commande in commandes:
+            for _ in range(aleatoire.randint(1, 4)):
+                # Neuf fois sur dix dans un des groupes du client, sinon au hasard
+                if aleatoire.random() < 0.9:
+                    groupe = groupes[aleatoire.choice(interets[commande.utilisateur_id])]
+                else:
+                    groupe = aleatoire.choice(groupes)
+                produit_id, prix = aleatoire.choice(groupe)
+                lignes.append(LigneCommande(commande=commande, produit_id=produit_id, quantite=1, prix_unitaire=prix))
+        LigneCommande.objects.bulk_create(lignes, batch_size=5000)
@@ -0,0 +1,88 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ai.smartsearch import IndexRechercheFloue
+from catalog.management.catalogue_synthetique import creer_catalogue
+from catalog.models import Produit
+
+# Requêtes avec fautes de frappe, synonymes et mots incomplets (saisie en cours)
+REQUETES = [
+    'chaise', 'chiase', 'lampe noir', 'casqe sans fil', 'ecrn', 'moniteur',
+    'smartphone', 'telephne', 'veste cuire', 'tabel bois', 'pliab', 'ergonomiqe',
+    'perceuse profesionnelle', 'introuvable',
+]
+
+
+class AnnulerBenchmark(Exception):
+    """Levée pour annuler la transaction contenant le catalogue synthétique."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure la construction, la synchronisation et le temps de réponse de "
+        "l'index de recherche intelligente sur des catalogues synthétiques. Les "
+        "données sont créées dans une transaction annulée à la fin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tailles',
+            type=int,
+            nargs='+',
+            default=[10000, 100000],
+            help="Tailles de catalogue à tester (défaut : 10000 100000)",
+        )
+        parser.add_argument(
+            '--repetitions',
+            type=int,
+            default=20,
+            help="Nombre d'exécutions de chaque requête (défaut : 20)",
+        )
+
+    def handle(self, *args, **options):
+        for taille in options['tailles']:
+            try:
+                with transaction.atomic():
+                    self.mesurer(taille, options['repetitions'])
+                    raise AnnulerBenchmark
+            except AnnulerBenchmark:
+                pass
+
+    def mesurer(self, taille, repetitions):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Catalogue de {taille} produits"))
+        creer_catalogue(taille)
+        
+        index = IndexRechercheFloue()
+        debut = time.perf_counter()
+        index.charger()
+        self.stdout.write(
+            f"  construction  : {time.perf_counter() - debut:.1f} s "
+            f"({len(index.vocabulaire)} mots, {len(index.index_trigrammes)} trigrammes)"
+        )
+        
+        marques = [nom.split()[-2] for nom in Produit.objects.order_by('pk').values_list('nom', flat=True)[:3]]
+        requetes = REQUETES + marques + [marque[:-1] + 'x' for marque in marques]
+        durees = []
+        for requete in requetes:
+            for _ in range(repetitions):
+                debut = time.perf_counter()
+                index.rechercher(requete)
+                durees.append((time.perf_counter() - debut) * 1000)
+        durees.sort()
+        p95 = durees[min(len(durees) - 1, int(len(durees) * 0.95))]
+        self.stdout.write(
+            f"  recherche     : médiane {statistics.median(durees):.2f} ms, "
+            f"p95 {p95:.2f} ms, max {durees[-1]:.2f} ms"
+        )
+        
+        # Modification de 100 produits par un « autre worker », puis rattrapage
+        ids = list(Produit.objects.order_by('?').values_list('pk', flat=True)[:100])
+        for produit in Produit.objects.filter(pk__in=ids):
+            produit.nom = f"{produit.nom} édition limitée"
+            produit.save(update_fields=['nom', 'date_mise_a_jour'])
+        debut = time.perf_counter()
+        index.synchroniser()
+        self.stdout.write(f"  synchronisation : {(time.perf_counter() - debut) * 1000:.0f} ms")
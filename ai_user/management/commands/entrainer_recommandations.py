@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ai.reco import entrainer
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcule les voisins d'achat des produits (recommandations, voir "
+        "ai.reco). Par défaut, seuls les produits des clients dont une commande "
+        "a changé depuis le dernier calcul sont recalculés ; --complet recalcule tout."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--complet', action='store_true', help="Recalcule tous les produits")
+        parser.add_argument('--voisins', type=int, help="Voisins conservés par produit (défaut : AI_RECO_VOISINS)")
+
+    def handle(self, *args, **options):
+        debut = time.perf_counter()
+        resultat = entrainer(complet=options['complet'], k=options['voisins'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Calcul {'complet' if resultat['complet'] else 'incrémental'} : "
+            f"{resultat['produits']} produit(s), {resultat['voisins']} voisin(s), "
+            f"{resultat['clients']} client(s), en {time.perf_counter() - debut:.2f} s."
+        ))
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.10 on 2026-10-18 05:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_index_produits_notes'),
+        ('ai_user', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoisinsProduit',
+            fields=[
+                ('produit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='voisins_achats', serialize=False, to='catalog.produit', verbose_name='Produit')),
+                ('voisins', models.JSONField(default=list, verbose_name='Voisins')),
+                ('date_calcul', models.DateTimeField(verbose_name='Date du calcul')),
+            ],
+            options={
+                'verbose_name': "Voisins d'achat d'un produit",
+                'verbose_name_plural': "Voisins d'achat des produits",
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.10 on 2026-10-18 05:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_index_produits_notes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ai_user', '0002_voisins_produit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultationProduit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(verbose_name='Date de consultation')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consultations', to='catalog.produit', verbose_name='Produit')),
+                ('utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consultations_produits', to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur')),
+            ],
+            options={
+                'verbose_name': 'Consultation de produit',
+                'verbose_name_plural': 'Consultations de produits',
+                'indexes': [models.Index(fields=['utilisateur', '-date'], name='consultation_utilisateur')],
+            },
+        ),
+    ]
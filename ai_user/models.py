@@ -32,3 +32,60 @@ class TranslationHistory(models.Model):
     
     def __str__(self):
         return f"Traduction {self.source_language} → {self.target_language} par {self.user or 'Anonyme'}"
+
+
+class VoisinsProduit(models.Model):
+    """
+    Produits les plus souvent achetés par les clients d'un produit
+    (filtrage collaboratif article-article, calculé hors ligne par
+    ai.reco.entrainer) : au plus AI_RECO_VOISINS couples
+    [produit_id, score], par score décroissant.
+    """
+    produit = models.OneToOneField(
+        'catalog.Produit',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='voisins_achats',
+        verbose_name="Produit"
+    )
+    voisins = models.JSONField(default=list, verbose_name="Voisins")
+    date_calcul = models.DateTimeField(verbose_name="Date du calcul")
+
+    class Meta:
+        verbose_name = "Voisins d'achat d'un produit"
+        verbose_name_plural = "Voisins d'achat des produits"
+
+    def __str__(self):
+        return f"{len(self.voisins)} voisin(s) de {self.produit_id}"
+
+
+class ConsultationProduit(models.Model):
+    """
+    Consultation d'une fiche produit par un utilisateur connecté. Les
+    consultations sont d'abord gardées en mémoire puis enregistrées par lots
+    (voir ai.history) : une page vue n'écrit pas en base.
+    """
+    utilisateur = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='consultations_produits',
+        verbose_name="Utilisateur"
+    )
+    produit = models.ForeignKey(
+        'catalog.Produit',
+        on_delete=models.CASCADE,
+        related_name='consultations',
+        verbose_name="Produit"
+    )
+    date = models.DateTimeField(verbose_name="Date de consultation")
+
+    class Meta:
+        verbose_name = "Consultation de produit"
+        verbose_name_plural = "Consultations de produits"
+        indexes = [
+            # Historique récent d'un utilisateur (ai.history.historique)
+            models.Index(fields=['utilisateur', '-date'], name='consultation_utilisateur'),
+        ]
+
+    def __str__(self):
+        return f"{self.utilisateur_id} a consulté {self.produit_id} le {self.date:%d/%m/%Y %H:%M}"
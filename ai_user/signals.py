@@ -0,0 +1,46 @@
+"""
+Mise à jour de l'index de recherche intelligente (ai.smartsearch) du processus
+courant quand un produit ou une catégorie change. Les autres workers
+rattrapent ces modifications lors de leur synchronisation périodique.
+
+Les consultations de fiches produit alimentent l'historique des visiteurs
+(ai.history).
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from catalog.models import Categorie, Produit
+from catalog.signals import produit_consulte
+from ai.history import noter_consultation
+from ai.smartsearch import get_index
+
+
+@receiver(post_save, sender=Produit)
+def indexer_produit(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_index().produit_enregistre(instance)
+
+
+@receiver(post_delete, sender=Produit)
+def desindexer_produit(sender, instance, **kwargs):
+    get_index().produit_supprime(instance)
+
+
+@receiver(post_save, sender=Categorie)
+def indexer_categorie(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_index().categorie_enregistree(instance)
+
+
+@receiver(post_delete, sender=Categorie)
+def desindexer_categorie(sender, instance, **kwargs):
+    get_index().categorie_supprimee(instance)
+
+
+@receiver(produit_consulte)
+def noter_consultation_produit(sender, request, produit_id, categorie_id, **kwargs):
+    noter_consultation(
+        produit_id, categorie_id,
+        user_id=request.user.pk,
+        session_key=request.session.session_key,
+    )
@@ -1,3 +1,311 @@
-from django.test import TestCase
+import random
+import re
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ai import chatbot, history, reco
+from ai.cartes import IMAGE_PAR_DEFAUT, cartes
+from ai.echantillonnage import MIEUX_NOTES, TOUS, EchantillonneurProduits, segment_categorie
+from ai.intentions import AutomateMotsCles, get_moteur, tokeniser
+from ai.smartsearch import IndexRechercheFloue, get_index, levenshtein
+from catalog.models import Categorie, ImageProduit, Produit
+from orders.models import Commande, LigneCommande
+
+from .models import ConsultationProduit, VoisinsProduit
+
+# Sans cache : les cartes produit sont relues à chaque appel
+SANS_CACHE = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+
+
+def commander(utilisateur, *produits):
+    commande = Commande.objects.create(
+        utilisateur=utilisateur, adresse_livraison="1 rue de la Paix", code_postal='75001',
+        ville='Paris', pays='France', montant_total=Decimal('10.00'),
+    )
+    LigneCommande.objects.bulk_create([
+        LigneCommande(commande=commande, produit=produit, quantite=1, prix_unitaire=produit.prix) for produit in produits
+    ])
+    return commande
+
+
+class RechercheFloueTest(TestCase):
+    """Index en mémoire de ai.smartsearch (fautes de frappe, synonymes, resynchronisation)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categorie = Categorie.objects.create(nom="Salon", slug='salon')
+        cls.canape = Produit.objects.create(nom="Canapé d'angle", reference='C1', prix=Decimal('500.00'), categorie=cls.categorie)
+        cls.lampe = Produit.objects.create(nom="Lampe halogène", reference='L1', prix=Decimal('40.00'), categorie=cls.categorie)
+        cls.table = Produit.objects.create(nom="Table basse", reference='T1', prix=Decimal('90.00'), categorie=cls.categorie)
+
+    def setUp(self):
+        # Index hors signaux : il se comporte comme celui d'un autre worker
+        self.index = IndexRechercheFloue()
+        self.index.charger()
+
+    def noms(self, requete):
+        return [entree.nom for _, entree in self.index.rechercher(requete)]
+
+    def test_levenshtein(self):
+        self.assertEqual(levenshtein('lampe', 'lampe', 2), 0)
+        self.assertEqual(levenshtein('lampe', 'lapme', 2), 1)
+        self.assertEqual(levenshtein('lampe', 'table', 1), 2)
+
+    def test_fautes_et_synonymes(self):
+        self.assertEqual(self.noms('lampr halogene'), ["Lampe halogène"])
+        self.assertEqual(self.noms('sofa'), ["Canapé d'angle"])
+        # Dernier mot de la saisie : préfixe
+        self.assertEqual(self.noms('table ba'), ["Table basse"])
+        self.assertIn("Salon", self.noms('salon'))
+
+    def test_synchronisation(self):
+        self.lampe.nom = "Lampadaire"
+        self.lampe.save()
+        # Catégorie, produits modifiés, compte des actifs : pas de relecture des identifiants
+        with self.assertNumQueries(3):
+            self.index.synchroniser()
+        self.assertEqual(self.noms('lampadaire'), ["Lampadaire"])
+
+        self.table.est_actif = False
+        self.table.save()
+        self.canape.delete()
+        with self.assertNumQueries(4):
+            self.index.synchroniser()
+        self.assertEqual(self.noms('table'), [])
+        self.assertEqual(self.noms('canape'), [])
+
+
+@SANS_CACHE
+class RecommandationsTest(TestCase):
+    """Filtrage collaboratif article-article de ai.reco."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categorie = Categorie.objects.create(nom="Salon", slug='salon')
+        cls.a, cls.b, cls.c, cls.d, cls.e = [
+            Produit.objects.create(nom=f"Produit {lettre}", reference=lettre, prix=Decimal('10.00'), quantite=5, categorie=categorie)
+            for lettre in 'ABCDE'
+        ]
+        Produit.objects.filter(pk=cls.e.pk).update(note_moyenne=Decimal('4.50'), nombre_avis=3)
+        User = get_user_model()
+        cls.clients = [User.objects.create_user(username=f'client{numero}', password=None) for numero in range(3)]
+        commander(cls.clients[0], cls.a, cls.b)
+        commander(cls.clients[1], cls.a, cls.b, cls.c)
+        commander(cls.clients[2], cls.d)
+
+    def voisins(self, produit):
+        return VoisinsProduit.objects.get(produit=produit).voisins
+
+    def test_entrainement(self):
+        self.assertEqual(reco.entrainer(complet=True), {'produits': 4, 'voisins': 6, 'clients': 3, 'complet': True})
+        # Cosinus : 2 clients communs sur 2 x 2 acheteurs, puis 1 sur 2 x 1
+        self.assertEqual(self.voisins(self.a), [[self.b.pk, 1.0], [self.c.pk, 0.7071]])
+        self.assertEqual(self.voisins(self.d), [])
+
+    def test_entrainement_incremental(self):
+        reco.entrainer(complet=True)
+        commander(self.clients[2], self.c)
+        # Seuls les produits du client dont la commande a changé
+        self.assertEqual(reco.entrainer()['produits'], 2)
+        self.assertEqual([voisin for voisin, _ in self.voisins(self.d)], [self.c.pk])
+        # D n'a qu'un acheteur : c'est le plus proche de C
+        self.assertEqual([voisin for voisin, _ in self.voisins(self.c)], [self.d.pk, self.a.pk, self.b.pk])
+
+    def test_recommandations(self):
+        reco.entrainer(complet=True)
+        noms = [carte['nom'] for carte in reco.get_recommendations(produit_id=self.a.pk, top_n=3)]
+        # Voisins d'abord, complétés par les mieux notés
+        self.assertEqual(noms, ["Produit B", "Produit C", "Produit E"])
+
+        # Client : voisins de ses achats récents, sans ce qu'il a déjà acheté
+        noms = [carte['nom'] for carte in reco.get_recommendations(user_id=self.clients[0].pk, top_n=1)]
+        self.assertEqual(noms, ["Produit C"])
+
+        # Visiteur anonyme sans historique : les mieux notés
+        self.assertEqual(reco.get_recommendations(top_n=1)[0]['nom'], "Produit E")
+
+
+class EchantillonnageTest(TestCase):
+    """Tirages aléatoires sans ORDER BY RANDOM() (ai.echantillonnage)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salon = Categorie.objects.create(nom="Salon", slug='salon')
+        cls.cuisine = Categorie.objects.create(nom="Cuisine", slug='cuisine')
+        cls.produits = [
+            Produit.objects.create(
+                nom=f"Produit {numero}", reference=f'P{numero}', prix=Decimal('10.00'), quantite=5,
+                categorie=cls.salon if numero % 2 else cls.cuisine,
+            )
+            for numero in range(10)
+        ]
+        Produit.objects.filter(pk=cls.produits[0].pk).update(est_actif=False)
+        Produit.objects.filter(pk=cls.produits[1].pk).update(quantite=0, en_stock=False)
+
+    def setUp(self):
+        self.echantillonneur = EchantillonneurProduits()
+        self.echantillonneur.charger()
+
+    def test_segments(self):
+        self.assertEqual(self.echantillonneur.taille(TOUS), 8)
+        self.assertEqual(self.echantillonneur.taille(segment_categorie(self.salon.pk)), 4)
+        self.assertEqual(self.echantillonneur.taille(MIEUX_NOTES), 8)
+        self.assertEqual(self.echantillonneur.taille(segment_categorie(0)), 0)
+
+    def test_tirage(self):
+        exclus = {self.produits[2].pk, self.produits[3].pk}
+        # Tirage en mémoire : aucune requête
+        with self.assertNumQueries(0):
+            tires = self.echantillonneur.tirer(TOUS, 5, exclus, aleatoire=random.Random(3))
+        self.assertEqual(len(tires), 5)
+        self.assertEqual(len(set(tires)), 5)
+        # Ni exclus, ni inactif, ni épuisé
+        self.assertFalse(set(tires) & (exclus | {self.produits[0].pk, self.produits[1].pk}))
+        # Pas plus que le segment
+        self.assertEqual(len(self.echantillonneur.tirer(segment_categorie(self.salon.pk), 10)), 4)
+        self.assertEqual(self.echantillonneur.tirer(TOUS, 0), [])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-historique'}},
+    AI_HISTORIQUE_DELAI=3600,
+)
+class HistoriqueTest(TestCase):
+    """Historique de consultation (ai.history) et suggestions qui en découlent."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.salon = Categorie.objects.create(nom="Salon", slug='salon')
+        cls.cuisine = Categorie.objects.create(nom="Cuisine", slug='cuisine')
+        cls.canape, cls.lampe, cls.poele = [
+            Produit.objects.create(nom=nom, reference=nom[:3], prix=Decimal('10.00'), quantite=5, categorie=categorie)
+            for nom, categorie in (("Canapé", cls.salon), ("Lampe", cls.salon), ("Poêle", cls.cuisine))
+        ]
+        cls.client_connecte = get_user_model().objects.create_user(username='client', password=None)
+
+    def setUp(self):
+        cache.clear()
+        history._en_attente.clear()
+
+    def test_consultations_par_lots(self):
+        history.noter_consultation(self.canape.pk, self.salon.pk, user_id=self.client_connecte.pk)
+        history.noter_consultation(self.poele.pk, self.cuisine.pk, user_id=self.client_connecte.pk)
+        self.assertFalse(ConsultationProduit.objects.exists())
+        self.assertEqual(history.vider_consultations(), 2)
+
+        # Historique hors du cache : relu en base
+        cache.clear()
+        self.assertEqual(
+            history.historique(user_id=self.client_connecte.pk),
+            [[self.poele.pk, self.cuisine.pk], [self.canape.pk, self.salon.pk]],
+        )
+
+    def test_echec_du_vidage(self):
+        history.noter_consultation(self.canape.pk, self.salon.pk, user_id=self.client_connecte.pk)
+        with mock.patch.object(ConsultationProduit.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                history.vider_consultations()
+        # Le lot est remis en attente, puis enregistré au vidage suivant
+        self.assertEqual(len(history._en_attente), 1)
+        self.assertEqual(history.vider_consultations(), 1)
+        self.assertEqual(ConsultationProduit.objects.get().produit, self.canape)
+
+    def test_suggestions_par_affinite(self):
+        historique = [[self.canape.pk, self.salon.pk]]
+        suggestions = history.suggest_from_history(None, historique)
+        self.assertEqual([carte['nom'] for carte in suggestions], ["Lampe"])
+
+    def test_suggestions_session_anonyme(self):
+        url = reverse('ai_suggestions')
+        # Sans session : segment commun des visiteurs anonymes
+        self.client.get(url)
+        self.assertIsNotNone(cache.get('ai:suggestions:anonyme'))
+
+        session = self.client.session
+        session.save()
+        self.client.get(reverse('catalog:detail_produit', args=[self.canape.slug]))
+        self.assertEqual(history.historique(session_key=session.session_key), [[self.canape.pk, self.salon.pk]])
+        response = self.client.get(url)
+        self.assertIsNotNone(cache.get(f'ai:suggestions:session:{session.session_key}'))
+        # La suggestion issue de l'historique vient en premier
+        noms = re.findall(r'<h4 class="suggestion-name">(.*?)</h4>', response.content.decode())
+        self.assertEqual(noms[0], "Lampe")
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-cartes'}})
+class CartesTest(TestCase):
+    """Cartes produit des modules IA (ai.cartes), construites par lot et gardées en cache."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categorie = Categorie.objects.create(nom="Salon", slug='salon')
+        cls.produits = [
+            Produit.objects.create(nom=f"Produit {numero}", reference=f'P{numero}', prix=Decimal('10.00'), quantite=5, categorie=categorie)
+            for numero in range(3)
+        ]
+        for produit in cls.produits[:2]:
+            ImageProduit.objects.create(produit=produit, image=f'produits/{produit.reference}-2.jpg', ordre=1)
+            ImageProduit.objects.create(produit=produit, image=f'produits/{produit.reference}.jpg', est_principale=True)
+        Produit.objects.filter(pk=cls.produits[1].pk).update(prix_promotionnel=Decimal('8.00'))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cartes(self):
+        ids = [produit.pk for produit in reversed(self.produits)]
+        # États des produits, puis les cartes absentes du cache, images comprises
+        with self.assertNumQueries(2):
+            resultat = cartes(ids)
+        self.assertEqual([carte['nom'] for carte in resultat], ["Produit 2", "Produit 1", "Produit 0"])
+        self.assertEqual(resultat[2]['image'], '/media/produits/P0.jpg')
+        self.assertEqual(resultat[0]['image'], IMAGE_PAR_DEFAUT)
+        self.assertEqual((resultat[1]['prix'], resultat[1]['prix_initial']), (8.0, 10.0))
+        self.assertEqual(resultat[0]['url'], reverse('catalog:detail_produit', args=[self.produits[2].slug]))
+        with self.assertNumQueries(1):
+            self.assertEqual(cartes(ids), resultat)
+
+    def test_produit_modifie(self):
+        cartes([self.produits[0].pk])
+        self.produits[0].nom = "Lampe"
+        self.produits[0].save()
+        Produit.objects.filter(pk=self.produits[1].pk).update(est_actif=False)
+        # Nouvelle date de mise à jour : nouvelle clé, sans invalidation
+        self.assertEqual([carte['nom'] for carte in cartes([self.produits[0].pk, self.produits[1].pk])], ["Lampe"])
+
+
+class IntentionsTest(TestCase):
+    """Détection d'intention du chatbot (ai.intentions) et réponses tirées du catalogue."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categorie = Categorie.objects.create(nom="Salon", slug='salon')
+        Produit.objects.create(nom="Lampe halogène", reference='L1', prix=Decimal('40.00'), quantite=5, categorie=categorie)
+        cls.client_connecte = get_user_model().objects.create_user(username='client', password=None)
+
+    def test_mots_cles(self):
+        automate = AutomateMotsCles({'goodbye': ['au revoir', 'bye'], 'thanks': ['merci']})
+        trouvees = automate.intentions(tokeniser("Merci, au revoir ! Au revoir !"))
+        self.assertEqual(trouvees, {'goodbye': 2, 'thanks': 1})
+        self.assertEqual(automate.intentions(tokeniser("revoir au")), {})
+
+    def test_detection(self):
+        moteur = get_moteur()
+        questions = ["Bonjour", "Où est mon colis ?", "Vous avez des lampes ?", "comment faire pour payer", "xyz qwerty"]
+        attendues = ['greeting', 'order', 'product', 'help', None]
+        self.assertEqual([moteur.detecter(question).nom for question in questions], attendues)
+        self.assertEqual([intention.nom for intention in moteur.detecter_lot(questions)], attendues)
+
+    def test_reponses(self):
+        commander(self.client_connecte)
+        self.assertIn("en cours de traitement", chatbot.ask_bot("où en est ma commande ?", self.client_connecte.pk))
+        self.assertIn("connecter", chatbot.ask_bot("où en est ma commande ?"))
+
+        # Produits cherchés dans l'index de recherche intelligente du processus
+        get_index().charger()
+        self.assertIn("Lampe halogène (40.00 €", chatbot.ask_bot("Vous avez des lampes halogènes ?"))
@@ -1,21 +1,32 @@
+from django.conf import settings
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from django.template.loader import render_to_string
 import json
+import logging
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from ai import reco, chatbot, image_search, history, descgen, smartsearch, sentiment, filtering, review_summary
 from ai.translate import translate as translate_text
+from ecommerce import revalidation
+
+logger = logging.getLogger(__name__)
 
 @csrf_exempt
 def recommendation_view(request):
     """
-    Endpoint IA : recommandations personnalisées (mock)
+    Endpoint IA : recommandations personnalisées (achats récents de
+    l'utilisateur connecté et produit consulté, voir ai.reco)
     """
-    user_id = request.GET.get('user_id')
-    recos = reco.get_recommendations(user_id=user_id)
+    # Le paramètre user_id n'est pas suivi : il exposerait les achats d'un autre client
+    user_id = request.user.id if request.user.is_authenticated else None
+    produit_id = request.GET.get('product_id', '')
+    recos = reco.get_recommendations(
+        user_id=user_id,
+        produit_id=int(produit_id) if produit_id.isdigit() else None,
+    )
     return JsonResponse({'recommendations': recos})
 
 @csrf_exempt
@@ -57,7 +68,7 @@ def chatbot_view(request):
         
         # Obtenir une réponse du chatbot
         try:
-            answer = chatbot.ask_bot(question)
+            answer = chatbot.ask_bot(question, user_id=request.user.pk)
             if not answer:
                 raise ValueError("Aucune réponse du moteur d'IA")
                 
@@ -91,11 +102,12 @@ def image_search_view(request):
 @csrf_exempt
 def history_view(request):
     """
-    Endpoint IA : suggestions selon historique (mock)
+    Endpoint IA : suggestions selon l'historique de consultation du visiteur
+    (utilisateur connecté ou session anonyme)
     """
-    user_id = request.GET.get('user_id')
-    # Ici, on simule un historique vide
-    suggestions = history.suggest_from_history(user_id, history=None)
+    user_id = request.user.pk
+    historique = history.historique(user_id, request.session.session_key)
+    suggestions = history.suggest_from_history(user_id, historique)
     return JsonResponse({'suggestions': suggestions})
 
 @csrf_exempt
@@ -180,11 +192,21 @@ def translate_view(request):
 @csrf_exempt
 def smartsearch_view(request):
     """
-    Endpoint IA : recherche intelligente (mock)
+    Endpoint IA : recherche intelligente (fautes de frappe, synonymes)
     """
-    query = request.GET.get('query', '')
+    query = request.GET.get('q') or request.GET.get('query', '')
     results = smartsearch.smart_search(query)
-    return JsonResponse({'results': results})
+    # Format attendu par la barre de recherche (templates/ai_user/smart_search.html)
+    suggestions = [
+        {
+            'name': result['nom'],
+            'url': result['url'],
+            'category': result['categorie'] or ('Catégorie' if result['type'] == 'categorie' else None),
+            'price': result['prix'],
+        }
+        for result in results
+    ]
+    return JsonResponse({'results': results, 'suggestions': suggestions})
 
 @csrf_exempt
 def sentiment_view(request):
@@ -222,52 +244,35 @@ def review_summary_view(request):
         return JsonResponse({'summary': summary})
     return JsonResponse({'error': 'Méthode non autorisée'}, status=405)
 
+def rendre_suggestions(user_id=None, session_key=None):
+    suggestions = history.get_suggestions(user_id=user_id, session_key=session_key)
+    return render_to_string('ai_user/suggestions_partial.html', {'suggestions': suggestions})
+
 def suggestions_view(request):
     """
-    Endpoint IA : suggestions personnalisées basées sur l'historique de l'utilisateur
+    Endpoint IA : suggestions personnalisées basées sur l'historique de l'utilisateur
+
+    Le fragment HTML est mis en cache par segment (un par utilisateur connecté
+    ou par session anonyme qui a un historique de consultation, un commun aux
+    autres visiteurs anonymes) et recalculé en arrière-plan quand il est
+    périmé (voir ecommerce.revalidation).
     """
-    import logging
-    logger = logging.getLogger(__name__)
-    
+    user_id = request.user.pk if request.user.is_authenticated else None
+    session_key = None if user_id else request.session.session_key
+    if session_key and not history.historique(session_key=session_key):
+        session_key = None
+    if user_id or session_key:
+        cle = f'ai:suggestions:utilisateur:{user_id}' if user_id else f'ai:suggestions:session:{session_key}'
+        fraicheur = getattr(settings, 'AI_SUGGESTIONS_FRAICHEUR', 60)
+        duree = getattr(settings, 'AI_SUGGESTIONS_DUREE', 3600)
+    else:
+        cle = 'ai:suggestions:anonyme'
+        fraicheur = getattr(settings, 'AI_SUGGESTIONS_FRAICHEUR_ANONYME', 300)
+        duree = getattr(settings, 'AI_SUGGESTIONS_DUREE_ANONYME', 24 * 3600)
+
     try:
-        logger.info("Début de la vue suggestions_view")
-        
-        if not request.user.is_authenticated:
-            logger.warning("Utilisateur non authentifié")
-            return JsonResponse({'error': 'Utilisateur non authentifié'}, status=401)
-        
-        # Récupérer l'historique de l'utilisateur (simulé)
-        user_id = request.user.id
-        logger.info(f"Récupération des suggestions pour l'utilisateur {user_id}")
-        
-        # Appel à la fonction get_suggestions avec logging
-        try:
-            suggestions = history.get_suggestions(user_id=user_id)
-            logger.info(f"Suggestions récupérées: {len(suggestions) if suggestions else 0} suggestions")
-            if suggestions:
-                logger.debug(f"Première suggestion: {suggestions[0]}")
-        except Exception as e:
-            logger.error(f"Erreur lors de l'appel à get_suggestions: {str(e)}", exc_info=True)
-            return JsonResponse({'error': 'Erreur lors de la récupération des suggestions'}, status=500)
-        
-        # Rendre le template partiel avec les suggestions
-        try:
-            logger.info("Rendu du template partiel")
-            html = render_to_string('ai_user/suggestions_partial.html', 
-                                 {'suggestions': suggestions or []})
-            logger.debug("Template rendu avec succès")
-            return HttpResponse(html)
-            
-        except Exception as e:
-            logger.error(f"Erreur lors du rendu du template: {str(e)}", exc_info=True)
-            return JsonResponse(
-                {'error': 'Erreur lors de la génération des suggestions'}, 
-                status=500
-            )
-            
-    except Exception as e:
-        logger.critical(f"Erreur inattendue dans suggestions_view: {str(e)}", exc_info=True)
-        return JsonResponse(
-            {'error': 'Une erreur inattendue est survenue'}, 
-            status=500
-        )
+        html = revalidation.obtenir(cle, lambda: rendre_suggestions(user_id, session_key), fraicheur, duree)
+    except Exception:
+        logger.exception("Erreur lors de la génération des suggestions")
+        return JsonResponse({'error': 'Erreur lors de la génération des suggestions'}, status=500)
+    return HttpResponse(html)
@@ -1,91 +1,340 @@
-from decimal import Decimal
+"""
+Panier d'achat.
+
+Deux stockages derrière la même interface (voir obtenir_panier) :
+
+- Cart : visiteurs anonymes, dans la session sous forme compacte
+  {produit_id: quantité}. Les prix sont lus sur les produits à l'affichage.
+- PanierUtilisateur : utilisateurs connectés, en base (Panier/ArticlePanier),
+  avec le nombre d'articles et le total stockés sur Panier. Chaque article
+  retient sa quantité en stock pour une durée limitée (voir cart.reservations).
+
+Dans les deux cas, add() lève QuantiteIndisponible si la quantité demandée
+dépasse le stock disponible.
+
+À la connexion, le panier de session est versé dans le panier en base
+(voir fusionner_panier_session).
+"""
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
-from catalog.models import Produit
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from catalog.models import ImageProduit, Produit
+from .models import ArticlePanier, Panier
+from .reservations import QuantiteIndisponible, annoter_disponible, disponible, reserver, reserver_panier
+
+# Nombre d'articles du panier des utilisateurs connectés (badge de l'en-tête),
+# gardé en cache jusqu'à la prochaine modification du panier (voir Panier.mettre_a_jour_totaux)
+CLE_NOMBRE_ARTICLES = 'cart:nombre_articles:{}'
+DUREE_NOMBRE_ARTICLES = 3600
+
+
+class ArticleSession:
+    """Article d'un panier de session, avec les mêmes attributs qu'ArticlePanier."""
+
+    def __init__(self, produit, quantite):
+        self.produit = produit
+        self.quantite = quantite
+        self.prix_unitaire = ArticlePanier.prix_pour(produit)
+
+    @property
+    def sous_total(self):
+        return self.quantite * self.prix_unitaire
 
 
 class Cart:
     """
     Classe qui gère le panier d'achat en utilisant la session Django.
     """
-    
+
     def __init__(self, request):
         """
         Initialise le panier.
         """
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            # Sauvegarder un panier vide dans la session
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
-    
+        # Un panier vide n'est écrit dans la session qu'au premier ajout :
+        # consulter le panier ne force pas l'enregistrement de la session
+        contenu = self.session.get(settings.CART_SESSION_ID) or {}
+        # Ancien format : {produit_id: {'quantite': ..., 'prix': ...}}
+        self.cart = {
+            produit_id: item['quantite'] if isinstance(item, dict) else item
+            for produit_id, item in contenu.items()
+        }
+        self._articles = None
+
+    def quantite(self, produit_id):
+        """Quantité du produit déjà dans le panier."""
+        return self.cart.get(str(produit_id), 0)
+
     def add(self, produit, quantite=1, override_quantite=False):
         """
         Ajoute un produit au panier ou met à jour sa quantité.
+        Retourne la nouvelle quantité du produit dans le panier.
         """
         produit_id = str(produit.id)
-        if produit_id not in self.cart:
-            self.cart[produit_id] = {'quantite': 0, 'prix': str(produit.prix)}
-        
-        if override_quantite:
-            self.cart[produit_id]['quantite'] = quantite
+        actuelle = self.cart.get(produit_id, 0)
+        if not override_quantite:
+            quantite += actuelle
+        if quantite > actuelle:
+            stock = disponible(produit.id)
+            if quantite > stock:
+                raise QuantiteIndisponible(stock)
+        if quantite > 0:
+            self.cart[produit_id] = quantite
         else:
-            self.cart[produit_id]['quantite'] += quantite
-        
+            self.cart.pop(produit_id, None)
         self.save()
-    
+        return max(quantite, 0)
+
     def save(self):
         """
-        Marque la session comme modifiée pour s'assurer qu'elle est sauvegardée.
+        Enregistre le panier dans la session (qui est alors marquée comme modifiée).
         """
-        self.session.modified = True
-    
-    def remove(self, produit):
+        self.session[settings.CART_SESSION_ID] = self.cart
+        self._articles = None
+
+    def remove(self, produit_id):
         """
         Supprime un produit du panier.
         """
-        produit_id = str(produit.id)
-        if produit_id in self.cart:
-            del self.cart[produit_id]
+        if self.cart.pop(str(produit_id), None) is not None:
             self.save()
-    
+
+    def articles(self):
+        """
+        Retourne les articles du panier avec leur produit, chargés en une
+        fois (voir Produit.objects.for_listing) et gardés pour les parcours
+        suivants. Les produits disparus du catalogue sont ignorés.
+        """
+        if self._articles is None:
+            produits = Produit.objects.for_listing().in_bulk([int(produit_id) for produit_id in self.cart])
+            self._articles = [
+                ArticleSession(produits[int(produit_id)], quantite)
+                for produit_id, quantite in self.cart.items()
+                if int(produit_id) in produits
+            ]
+        return self._articles
+
     def __iter__(self):
         """
         Parcourt les articles du panier et récupère les produits depuis la base de données.
         """
-        produits_ids = self.cart.keys()
-        # Récupère les objets produits et les ajoute au panier
-        produits = Produit.objects.filter(id__in=produits_ids)
-        
-        cart = self.cart.copy()
-        for produit in produits:
-            cart[str(produit.id)]['produit'] = produit
-        
-        for item in cart.values():
-            item['prix'] = Decimal(item['prix'])
-            item['prix_total'] = item['prix'] * item['quantite']
-            yield item
-    
+        return iter(self.articles())
+
     def __len__(self):
         """
         Compte tous les articles dans le panier.
         """
-        return sum(item['quantite'] for item in self.cart.values())
-    
+        return sum(self.cart.values())
+
+    @property
+    def nombre_articles(self):
+        return len(self)
+
+    @property
+    def total(self):
+        return sum((article.sous_total for article in self.articles()), 0)
+
     def get_total_prix(self):
         """
         Calcule le coût total des articles dans le panier.
         """
-        return sum(
-            Decimal(item['prix']) * item['quantite'] 
-            for item in self.cart.values()
-        )
-    
+        return self.total
+
     def clear(self):
         """
         Supprime le panier de la session.
         """
+        self.cart = {}
+        self._articles = None
         if settings.CART_SESSION_ID in self.session:
             del self.session[settings.CART_SESSION_ID]
-            self.save()
+
+
+class PanierUtilisateur:
+    """
+    Panier d'un utilisateur connecté, en base. Chaque modification verrouille
+    la ligne Panier puis recalcule les totaux stockés (Panier.mettre_a_jour_totaux) :
+    un ajout coûte le même nombre de requêtes quelle que soit la taille du panier.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._panier = None
+        self._articles = None
+
+    @property
+    def panier(self):
+        if self._panier is None:
+            self._panier, _ = Panier.objects.get_or_create(utilisateur=self.user)
+        return self._panier
+
+    def _verrouiller(self):
+        panier, _ = Panier.objects.select_for_update().get_or_create(utilisateur=self.user)
+        return panier
+
+    def quantite(self, produit_id):
+        """Quantité du produit déjà dans le panier."""
+        return ArticlePanier.objects.filter(
+            panier__utilisateur=self.user, produit_id=produit_id
+        ).values_list('quantite', flat=True).first() or 0
+
+    def add(self, produit, quantite=1, override_quantite=False):
+        """
+        Ajoute un produit au panier ou met à jour sa quantité.
+        Retourne la nouvelle quantité du produit dans le panier.
+        """
+        with transaction.atomic():
+            panier = self._verrouiller()
+            article = ArticlePanier.objects.filter(panier=panier, produit=produit).first()
+            actuelle = article.quantite if article else 0
+            if not override_quantite:
+                quantite += actuelle
+            if quantite > actuelle:
+                # Produit verrouillé : le stock vérifié ne peut plus être réservé par un autre panier
+                stock = disponible(produit.id, panier.pk, verrouiller=True)
+                if quantite > stock:
+                    raise QuantiteIndisponible(stock)
+            if quantite <= 0:
+                if article:
+                    article.delete()
+            else:
+                if article is None:
+                    article = ArticlePanier(panier=panier)
+                article.produit = produit
+                article.quantite = quantite
+                article.save()
+                reserver(article)
+            panier.mettre_a_jour_totaux()
+        self._panier = panier
+        self._articles = None
+        return max(quantite, 0)
+
+    def remove(self, produit_id):
+        """
+        Supprime un produit du panier.
+        """
+        with transaction.atomic():
+            panier = self._verrouiller()
+            ArticlePanier.objects.filter(panier=panier, produit_id=produit_id).delete()
+            panier.mettre_a_jour_totaux()
+        self._panier = panier
+        self._articles = None
+
+    def articles(self):
+        """Articles du panier avec produit, catégorie et image principale (requêtes en nombre fixe)."""
+        if self._articles is None:
+            self._articles = list(
+                self.panier.items.select_related('produit__categorie').prefetch_related(
+                    Prefetch(
+                        'produit__images',
+                        queryset=ImageProduit.objects.filter(est_principale=True),
+                        to_attr='images_principales',
+                    )
+                )
+            )
+        return self._articles
+
+    def __iter__(self):
+        return iter(self.articles())
+
+    def __len__(self):
+        return self.panier.nombre_articles
+
+    @property
+    def nombre_articles(self):
+        return self.panier.nombre_articles
+
+    @property
+    def total(self):
+        return self.panier.total
+
+    def get_total_prix(self):
+        return self.total
+
+    def clear(self):
+        """Vide le panier."""
+        with transaction.atomic():
+            panier = self._verrouiller()
+            panier.items.all().delete()
+            panier.mettre_a_jour_totaux()
+        self._panier = panier
+        self._articles = None
+
+
+def obtenir_panier(request):
+    """
+    Retourne le panier de la requête : en base pour un utilisateur connecté,
+    en session sinon. Le même objet est renvoyé pendant toute la requête.
+    """
+    panier = getattr(request, '_panier', None)
+    if panier is None:
+        if request.user.is_authenticated:
+            panier = PanierUtilisateur(request.user)
+        else:
+            panier = Cart(request)
+        request._panier = panier
+    return panier
+
+
+def fusionner_panier_session(request, user):
+    """
+    Verse le panier de session dans le panier en base de l'utilisateur qui
+    vient de se connecter, puis vide le panier de session. Les quantités
+    s'additionnent, dans la limite du stock disponible, et tout le panier
+    est réservé.
+    """
+    panier_session = Cart(request)
+    if not panier_session.cart:
+        return
+    with transaction.atomic():
+        panier = PanierUtilisateur(user)._verrouiller()
+        produits = annoter_disponible(Produit.objects.filter(est_actif=True), panier.pk).in_bulk(
+            [int(produit_id) for produit_id in panier_session.cart]
+        )
+        existants = {article.produit_id: article for article in panier.items.all()}
+        nouveaux, modifies = [], []
+        for produit_id, quantite in panier_session.cart.items():
+            produit = produits.get(int(produit_id))
+            if produit is None:
+                continue
+            article = existants.get(produit.id)
+            quantite = min(quantite + (article.quantite if article else 0), produit.stock_disponible)
+            if quantite <= 0:
+                continue
+            if article is None:
+                nouveaux.append(ArticlePanier(
+                    panier=panier, produit=produit, quantite=quantite,
+                    prix_unitaire=ArticlePanier.prix_pour(produit),
+                ))
+            else:
+                article.quantite = quantite
+                article.prix_unitaire = ArticlePanier.prix_pour(produit)
+                modifies.append(article)
+        ArticlePanier.objects.bulk_create(nouveaux)
+        ArticlePanier.objects.bulk_update(modifies, ['quantite', 'prix_unitaire'])
+        panier.mettre_a_jour_totaux()
+        reserver_panier(panier)
+    panier_session.clear()
+
+
+def nombre_articles(request):
+    """
+    Nombre d'articles du panier, pour le badge de l'en-tête.
+
+    Utilisateur connecté : nombre stocké sur son Panier, en cache.
+    Visiteur anonyme : lu dans la session, sans requête sur les produits.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return len(Cart(request))
+    cle = CLE_NOMBRE_ARTICLES.format(user.pk)
+    nombre = cache.get(cle)
+    if nombre is None:
+        nombre = Panier.objects.filter(utilisateur=user).values_list('nombre_articles', flat=True).first() or 0
+        cache.set(cle, nombre, DUREE_NOMBRE_ARTICLES)
+    return nombre
+
+
+def invalider_nombre_articles(utilisateur_id):
+    cache.delete(CLE_NOMBRE_ARTICLES.format(utilisateur_id))
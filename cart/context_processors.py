@@ -1,8 +1,17 @@
-from .cart import Cart
+from django.utils.functional import SimpleLazyObject
+
+from .cart import nombre_articles, obtenir_panier
+
 
 def cart(request):
     """
     Context processor qui ajoute le panier au contexte de tous les templates.
     Permet d'accéder au panier depuis n'importe quelle vue sans avoir à le passer explicitement.
+    
+    Le panier et le nombre d'articles (badge de l'en-tête) ne sont calculés
+    que si le template s'en sert : sinon, ni lecture de session ni requête.
     """
-    return {'cart': Cart(request)}
+    return {
+        'cart': SimpleLazyObject(lambda: obtenir_panier(request)),
+        'nombre_articles_panier': SimpleLazyObject(lambda: nombre_articles(request)),
+    }
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from cart.reservations import liberer_expirees
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime les réservations de stock expirées, par lots. Avec "
+        "--intervalle, tourne en boucle (worker) au lieu de s'arrêter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--taille-lot',
+            type=int,
+            default=1000,
+            help="Nombre de réservations supprimées par requête (défaut : 1000)",
+        )
+        parser.add_argument(
+            '--intervalle',
+            type=float,
+            default=0,
+            help="Secondes entre deux passages ; 0 pour un seul passage (défaut : 0)",
+        )
+
+    def handle(self, *args, **options):
+        taille_lot = options['taille_lot']
+        intervalle = options['intervalle']
+        while True:
+            liberees = self.passage(taille_lot)
+            if intervalle <= 0:
+                break
+            if liberees:
+                self.stdout.write(f"{liberees} réservation(s) libérée(s).")
+            time.sleep(intervalle)
+            close_old_connections()
+        self.stdout.write(self.style.SUCCESS(f"{liberees} réservation(s) libérée(s)."))
+
+    def passage(self, taille_lot):
+        # Lots courts : chaque DELETE ne verrouille que peu de lignes
+        total = 0
+        while True:
+            liberees = liberer_expirees(taille_lot)
+            total += liberees
+            if liberees < taille_lot:
+                return total
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.10 on 2026-10-18 05:21
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Sum
+
+
+def calculer_totaux(apps, schema_editor):
+    Panier = apps.get_model('cart', 'Panier')
+    for panier in Panier.objects.all():
+        totaux = panier.items.aggregate(
+            nombre=Sum('quantite'),
+            total=Sum(F('quantite') * F('prix_unitaire'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        )
+        Panier.objects.filter(pk=panier.pk).update(
+            nombre_articles=totaux['nombre'] or 0,
+            total=totaux['total'] or 0,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='panier',
+            name='nombre_articles',
+            field=models.PositiveIntegerField(default=0, verbose_name="Nombre d'articles"),
+        ),
+        migrations.AddField(
+            model_name='panier',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total'),
+        ),
+        migrations.RunPython(calculer_totaux, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.10 on 2026-10-18 05:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_index_recherche'),
+        ('cart', '0002_totaux_panier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantite', models.PositiveIntegerField(verbose_name='Quantité réservée')),
+                ('expire_le', models.DateTimeField(verbose_name='Expire le')),
+                ('article', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reservation', to='cart.articlepanier', verbose_name='Article du panier')),
+                ('panier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='cart.panier', verbose_name='Panier')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='catalog.produit', verbose_name='Produit')),
+            ],
+            options={
+                'verbose_name': 'Réservation de stock',
+                'verbose_name_plural': 'Réservations de stock',
+                'indexes': [models.Index(fields=['produit', 'expire_le', 'quantite'], name='reservation_produit_expire'), models.Index(fields=['expire_le'], name='reservation_expire')],
+            },
+        ),
+    ]
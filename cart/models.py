@@ -1,4 +1,7 @@
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import DecimalField, F, Sum
+from django.utils import timezone
 from catalog.models import Produit
 from django.conf import settings
 
@@ -12,6 +15,10 @@ class Panier(models.Model):
     )
     date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
     date_mise_a_jour = models.DateTimeField(auto_now=True, verbose_name="Dernière mise à jour")
+    
+    # Synthèse des articles (dénormalisée, voir mettre_a_jour_totaux)
+    nombre_articles = models.PositiveIntegerField(default=0, verbose_name="Nombre d'articles")
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Total")
 
     class Meta:
         verbose_name = "Panier"
@@ -21,15 +28,29 @@ class Panier(models.Model):
     def __str__(self):
         return f"Panier de {self.utilisateur.username}"
 
-    @property
-    def total(self):
-        """Calcule le total du panier."""
-        return sum(item.sous_total for item in self.items.all())
-
-    @property
-    def nombre_articles(self):
-        """Retourne le nombre total d'articles dans le panier."""
-        return sum(item.quantite for item in self.items.all())
+    def mettre_a_jour_totaux(self):
+        """
+        Recalcule le nombre d'articles et le total du panier en une requête
+        d'agrégation et les enregistre. À appeler après toute modification
+        des articles (voir cart.cart.PanierUtilisateur).
+        """
+        totaux = self.items.aggregate(
+            nombre=Sum('quantite'),
+            total=Sum(F('quantite') * F('prix_unitaire'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        )
+        champs = {
+            'nombre_articles': totaux['nombre'] or 0,
+            'total': totaux['total'] or Decimal('0.00'),
+        }
+        Panier.objects.filter(pk=self.pk).update(**champs)
+        for champ, valeur in champs.items():
+            setattr(self, champ, valeur)
+        
+        # Badge de l'en-tête (nombre d'articles en cache)
+        from .cart import invalider_nombre_articles
+        utilisateur_id = self.utilisateur_id
+        invalider_nombre_articles(utilisateur_id)
+        transaction.on_commit(lambda: invalider_nombre_articles(utilisateur_id))
 
 
 class ArticlePanier(models.Model):
@@ -68,11 +89,65 @@ class ArticlePanier(models.Model):
         """Calcule le sous-total pour cet article."""
         return self.quantite * self.prix_unitaire
 
+    @staticmethod
+    def prix_pour(produit):
+        """Prix appliqué au panier : le prix promotionnel s'il existe, sinon le prix normal."""
+        if getattr(produit, 'prix_promotionnel', None):
+            return produit.prix_promotionnel
+        return produit.prix
+
     def save(self, *args, **kwargs):
         """Sauvegarde l'article avec le prix actuel du produit."""
-        # Utilise le prix promotionnel s'il existe, sinon le prix normal
-        if hasattr(self.produit, 'prix_promotionnel') and self.produit.prix_promotionnel:
-            self.prix_unitaire = self.produit.prix_promotionnel
-        else:
-            self.prix_unitaire = self.produit.prix
+        self.prix_unitaire = self.prix_pour(self.produit)
         super().save(*args, **kwargs)
+
+
+class ReservationStockQuerySet(models.QuerySet):
+    def actives(self):
+        return self.filter(expire_le__gt=timezone.now())
+
+    def expirees(self):
+        return self.filter(expire_le__lte=timezone.now())
+
+
+class ReservationStock(models.Model):
+    """
+    Quantité d'un produit retenue pour un article de panier jusqu'à
+    `expire_le` (voir cart.reservations). Une réservation expirée ne compte
+    plus ; elle est supprimée par la commande liberer_reservations.
+    """
+    article = models.OneToOneField(
+        ArticlePanier,
+        on_delete=models.CASCADE,
+        related_name='reservation',
+        verbose_name="Article du panier"
+    )
+    # Dénormalisés depuis l'article : le stock disponible se calcule sans jointure
+    panier = models.ForeignKey(
+        Panier,
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        verbose_name="Panier"
+    )
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        verbose_name="Produit"
+    )
+    quantite = models.PositiveIntegerField(verbose_name="Quantité réservée")
+    expire_le = models.DateTimeField(verbose_name="Expire le")
+
+    objects = ReservationStockQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Réservation de stock"
+        verbose_name_plural = "Réservations de stock"
+        indexes = [
+            # Somme des réservations actives d'un produit lue dans l'index seul
+            models.Index(fields=['produit', 'expire_le', 'quantite'], name='reservation_produit_expire'),
+            models.Index(fields=['expire_le'], name='reservation_expire'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantite} x {self.produit_id} jusqu'au {self.expire_le:%d/%m/%Y %H:%M}"
@@ -0,0 +1,134 @@
+"""
+Réservations de stock des paniers.
+
+Chaque article d'un panier en base retient sa quantité pendant
+CART_RESERVATION_DUREE secondes (ReservationStock), prolongée à chaque
+modification de l'article et à l'affichage du formulaire de commande. Le
+stock disponible d'un produit pour un panier est son stock réel (voir
+catalog.stock) moins les réservations actives des autres paniers : une
+seule requête, servie par l'index (produit, expire_le, quantite).
+
+Les réservations expirées ne comptent plus dès leur expiration ; la
+commande liberer_reservations les supprime par lots.
+
+Les paniers de session (visiteurs anonymes) ne réservent rien mais
+tiennent compte des réservations des autres.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from catalog import stock
+from catalog.models import Produit
+from .models import ReservationStock
+
+
+class QuantiteIndisponible(Exception):
+    """
+    La quantité demandée dépasse le stock disponible.
+
+    Attributes:
+        disponible (int): Quantité disponible pour ce panier
+    """
+
+    def __init__(self, disponible):
+        self.disponible = disponible
+        super().__init__(f"{disponible} disponible(s)")
+
+
+def duree_reservation():
+    return timedelta(seconds=getattr(settings, 'CART_RESERVATION_DUREE', 15 * 60))
+
+
+def annoter_disponible(queryset, panier_id=None):
+    """
+    Ajoute `stock_disponible` (et `stock_reel`) aux produits : stock réel
+    moins les réservations actives, hors celles du panier `panier_id`. Peut
+    être négatif si le stock a baissé depuis les réservations.
+    """
+    retenues = ReservationStock.objects.actives().filter(produit=OuterRef('pk'))
+    if panier_id is not None:
+        retenues = retenues.exclude(panier_id=panier_id)
+    retenues = retenues.order_by().values('produit').annotate(total=Sum('quantite')).values('total')
+    return stock.annoter_stock(queryset).annotate(stock_disponible=ExpressionWrapper(
+        F('stock_reel') - Coalesce(Subquery(retenues), Value(0)),
+        output_field=IntegerField(),
+    ))
+
+
+def disponible(produit_id, panier_id=None, verrouiller=False):
+    """
+    Quantité du produit disponible pour le panier `panier_id` (ou pour un
+    panier sans réservation), en une requête. Avec `verrouiller`, la ligne
+    du produit est d'abord verrouillée jusqu'à la fin de la transaction
+    (voir catalog.stock.verrouiller) : deux paniers ne peuvent pas réserver
+    le même dernier exemplaire.
+    """
+    if verrouiller:
+        stock.verrouiller([produit_id])
+    valeur = annoter_disponible(Produit.objects.filter(pk=produit_id), panier_id).values_list('stock_disponible', flat=True).first()
+    return max(valeur or 0, 0)
+
+
+def reserver(article):
+    """
+    Crée ou prolonge la réservation de l'article pour sa quantité actuelle.
+    À appeler panier verrouillé (voir PanierUtilisateur.add) : une seule
+    requête quand la réservation existe déjà.
+    """
+    valeurs = {
+        'panier_id': article.panier_id,
+        'produit_id': article.produit_id,
+        'quantite': article.quantite,
+        'expire_le': timezone.now() + duree_reservation(),
+    }
+    if not ReservationStock.objects.filter(article=article).update(**valeurs):
+        ReservationStock.objects.create(article=article, **valeurs)
+
+
+def reserver_panier(panier):
+    """
+    Renouvelle les réservations de tous les articles du panier, en un
+    nombre fixe de requêtes. Les articles dont la quantité n'est plus
+    disponible ne sont pas réservés.
+
+    Returns:
+        list: Triplets (produit, quantité demandée, quantité disponible) des
+              articles non réservés
+    """
+    with transaction.atomic():
+        articles = list(panier.items.values_list('pk', 'produit_id', 'quantite'))
+        produits = annoter_disponible(
+            Produit.objects.filter(pk__in=[produit_id for _, produit_id, _ in articles]), panier.pk
+        ).in_bulk()
+        expire_le = timezone.now() + duree_reservation()
+        reservations, manquants = [], []
+        for article_id, produit_id, quantite in articles:
+            produit = produits[produit_id]
+            if quantite > produit.stock_disponible:
+                manquants.append((produit, quantite, max(produit.stock_disponible, 0)))
+                continue
+            reservations.append(ReservationStock(
+                article_id=article_id, panier_id=panier.pk, produit_id=produit_id,
+                quantite=quantite, expire_le=expire_le,
+            ))
+        ReservationStock.objects.filter(panier=panier).delete()
+        ReservationStock.objects.bulk_create(reservations)
+    return manquants
+
+
+def liberer_expirees(taille_lot=1000):
+    """
+    Supprime un lot de réservations expirées.
+
+    Returns:
+        int: Nombre de réservations supprimées
+    """
+    ids = list(ReservationStock.objects.expirees().values_list('pk', flat=True)[:taille_lot])
+    if not ids:
+        return 0
+    return ReservationStock.objects.filter(pk__in=ids).delete()[0]
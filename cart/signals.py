@@ -0,0 +1,10 @@
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+from .cart import fusionner_panier_session
+
+
+@receiver(user_logged_in)
+def promouvoir_panier_session(sender, request, user, **kwargs):
+    """Le panier constitué avant la connexion rejoint le panier de l'utilisateur."""
+    if request is not None and hasattr(request, 'session'):
+        fusionner_panier_session(request, user)
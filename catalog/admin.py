@@ -1,8 +1,10 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
-from .models import Categorie, Produit, ImageProduit, AvisProduit, CaracteristiqueProduit, ImageCategorie
+from . import stock
+from .models import Categorie, Produit, ImageProduit, AvisProduit, CaracteristiqueProduit, ImageCategorie, MouvementStock
 
 
 class ImageProduitInline(admin.TabularInline):
@@ -97,7 +99,7 @@ class ProduitAdmin(admin.ModelAdmin):
     search_fields = ('nom', 'reference', 'description', 'resume')
     list_editable = ('prix', 'est_actif', 'en_stock')
     prepopulated_fields = {'slug': ('nom', 'reference')}
-    readonly_fields = ('date_creation', 'date_mise_a_jour', 'apercu_prix')
+    readonly_fields = ('date_creation', 'date_mise_a_jour', 'apercu_prix', 'historique_stock')
     inlines = [ImageProduitInline, CaracteristiqueProduitInline, AvisProduitInline]
     save_on_top = True
     
@@ -106,7 +108,7 @@ class ProduitAdmin(admin.ModelAdmin):
             'fields': ('nom', 'slug', 'reference', 'categorie', 'description', 'resume')
         }),
         (_('Prix et stock'), {
-            'fields': ('prix', 'prix_promotionnel', 'apercu_prix', 'en_stock', 'quantite')
+            'fields': ('prix', 'prix_promotionnel', 'apercu_prix', 'en_stock', 'quantite', 'historique_stock')
         }),
         (_('Options d\'affichage'), {
             'fields': ('est_actif', 'est_nouveau', 'est_meilleur_vente')
@@ -121,6 +123,43 @@ class ProduitAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_object(self, request, object_id, from_field=None):
+        produit = super().get_object(request, object_id, from_field)
+        if produit is not None:
+            # Le formulaire affiche le stock réel (compacté + mouvements en attente)
+            produit.quantite = stock.stock_reel(produit.pk)
+        return produit
+    
+    def save_model(self, request, obj, form, change):
+        """
+        Le stock ne se modifie que par le journal (voir catalog.stock) : une
+        quantité saisie devient un mouvement d'ajustement.
+        """
+        quantite = obj.quantite
+        if not change:
+            super().save_model(request, obj, form, change)
+            if quantite:
+                # Déjà dans Produit.quantite : enregistré comme compacté
+                MouvementStock.objects.create(
+                    produit=obj, type_mouvement=MouvementStock.TYPE_AJUSTEMENT, quantite=quantite,
+                    auteur=request.user, motif="Stock initial", compacte=True,
+                )
+            return
+        with transaction.atomic():
+            # Verrou : la compaction ne peut pas modifier le stock entre-temps
+            stock.verrouiller([obj.pk])
+            obj.quantite = Produit.objects.values_list('quantite', flat=True).get(pk=obj.pk)
+            super().save_model(request, obj, form, change)
+            if 'quantite' in form.changed_data:
+                stock.ajuster(obj, quantite, auteur=request.user, motif="Modification dans l'administration")
+    
+    def historique_stock(self, obj):
+        if not obj.pk:
+            return "-"
+        url = reverse('admin:catalog_mouvementstock_changelist') + f'?produit__id__exact={obj.pk}'
+        return format_html('<a href="{}">Mouvements de stock</a>', url)
+    historique_stock.short_description = 'Historique du stock'
+    
     def apercu_prix(self, obj):
         if obj.est_en_promotion():
             return format_html('<span style="color:red; font-weight:bold;">{} € (au lieu de {} € -{}%)</span>', 
@@ -192,3 +231,37 @@ class CaracteristiqueProduitAdmin(admin.ModelAdmin):
     list_filter = ('produit__categorie',)
     search_fields = ('produit__nom', 'nom', 'valeur')
     list_editable = ('nom', 'valeur', 'ordre')
+
+
+@admin.register(MouvementStock)
+class MouvementStockAdmin(admin.ModelAdmin):
+    """
+    Journal de stock : consultation, et ajout de réapprovisionnements ou
+    d'ajustements. Les mouvements ne se modifient ni ne se suppriment.
+    """
+    list_display = ('date_creation', 'produit', 'type_mouvement', 'quantite', 'commande_id', 'auteur', 'compacte')
+    list_filter = ('type_mouvement', 'compacte', 'date_creation')
+    search_fields = ('produit__nom', 'produit__reference', 'motif')
+    list_select_related = ('produit', 'auteur')
+    raw_id_fields = ('produit',)
+    fields = ('produit', 'type_mouvement', 'quantite', 'motif')
+    date_hierarchy = 'date_creation'
+    
+    def formfield_for_choice_field(self, db_field, request, **kwargs):
+        if db_field.name == 'type_mouvement':
+            # Ventes et annulations sont enregistrées par les commandes
+            kwargs['choices'] = [
+                (valeur, libelle) for valeur, libelle in MouvementStock.CHOIX_TYPE
+                if valeur in (MouvementStock.TYPE_REAPPROVISIONNEMENT, MouvementStock.TYPE_AJUSTEMENT)
+            ]
+        return super().formfield_for_choice_field(db_field, request, **kwargs)
+    
+    def save_model(self, request, obj, form, change):
+        obj.auteur = request.user
+        stock.enregistrer([obj])
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,230 @@
+"""
+Cache du catalogue.
+
+Les entrées sont rangées par espace ('produits', 'categories') et leurs clés
+portent le numéro de version de l'espace. Pour invalider, les signaux du
+catalogue incrémentent ce numéro au lieu de supprimer les entrées une à
+une : les anciennes clés ne sont plus jamais lues et expirent d'elles-mêmes.
+
+Les templates reçoivent les versions dans `version_cache` (voir
+CacheCatalogueMixin) pour les fragments {% cache %}.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.utils.functional import cached_property
+
+from ecommerce.conditionnel import ReponseConditionnelleMixin
+from ecommerce.pagination import PaginatorCurseur
+
+ESPACES = ('produits', 'categories')
+
+
+def duree_cache():
+    return getattr(settings, 'CATALOG_CACHE_DUREE', 600)
+
+
+def _cle_version(espace):
+    return f'catalog:version:{espace}'
+
+
+def _nouvelle_version():
+    # Une version perdue (éviction, redémarrage du cache) repart d'une valeur
+    # jamais utilisée : les entrées écrites avec l'ancienne ne reviennent pas
+    return time.time_ns() // 1000
+
+
+def versions():
+    """Versions courantes de tous les espaces, en une lecture du cache."""
+    cles = {_cle_version(espace): espace for espace in ESPACES}
+    trouvees = cache.get_many(list(cles))
+    resultat = {}
+    for cle, espace in cles.items():
+        if cle not in trouvees:
+            cache.add(cle, _nouvelle_version(), timeout=None)
+            trouvees[cle] = cache.get(cle)
+        resultat[espace] = trouvees[cle]
+    return resultat
+
+
+def version(espace):
+    return versions()[espace]
+
+
+def invalider(*espaces):
+    """Rend périmées toutes les entrées des espaces donnés, une fois la transaction validée."""
+    def incrementer():
+        for espace in espaces:
+            try:
+                cache.incr(_cle_version(espace))
+            except ValueError:
+                cache.set(_cle_version(espace), _nouvelle_version(), timeout=None)
+    transaction.on_commit(incrementer)
+
+
+def cle(espace, *parties):
+    return ':'.join(['catalog', espace, str(version(espace)), *map(str, parties)])
+
+
+def parties_produit(produit_id, *parties):
+    """Parties de clé d'une entrée propre à un produit (fiche), supprimée par invalider_produits()."""
+    return ('produit', produit_id, *parties)
+
+
+def invalider_produits(produit_ids):
+    """
+    Supprime les entrées propres aux produits donnés, une fois la transaction
+    validée, sans rendre périmées les listes de l'espace 'produits' (mouvements
+    de stock, qui ne changent que la fiche).
+    """
+    produit_ids = list(produit_ids)
+
+    def supprimer():
+        cache.delete_many([cle('produits', *parties_produit(produit_id, 'detail')) for produit_id in produit_ids])
+    if produit_ids:
+        transaction.on_commit(supprimer)
+
+
+def obtenir(espace, parties, calcul):
+    """
+    Retourne la valeur en cache pour (espace, parties), calculée par
+    `calcul()` et mise en cache si elle n'y est pas. None n'est pas mis en
+    cache.
+    """
+    cle_entree = cle(espace, *parties)
+    valeur = cache.get(cle_entree)
+    if valeur is None:
+        valeur = calcul()
+        if valeur is not None:
+            cache.set(cle_entree, valeur, duree_cache())
+    return valeur
+
+
+class PaginatorCatalogue(Paginator):
+    """
+    Paginator dont le nombre total d'objets est mis en cache (espace
+    'produits'), la requête SQL servant de clé. Les tranches restent
+    paresseuses : si la liste est servie par un fragment en cache, aucune
+    requête n'est faite.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None:
+            return super().count
+        try:
+            empreinte = empreinte_requete(query)
+        except EmptyResultSet:
+            return 0
+        return obtenir('produits', ('count', empreinte), lambda: super(PaginatorCatalogue, self).count)
+
+
+class PaginatorCurseurCatalogue(PaginatorCurseur):
+    """PaginatorCurseur dont le nombre (éventuellement estimé) d'objets est mis en cache, comme PaginatorCatalogue."""
+
+    def compter(self):
+        try:
+            empreinte = empreinte_requete(self.queryset.query)
+        except EmptyResultSet:
+            return 0, False
+        return obtenir('produits', ('compte', empreinte), super().compter)
+
+
+def empreinte_requete(query):
+    """Empreinte du SQL d'une requête, pour les clés de cache ; lève EmptyResultSet si elle ne peut rien renvoyer."""
+    sql, params = query.sql_with_params()
+    return hashlib.md5(repr((sql, params)).encode()).hexdigest()
+
+
+class CacheCatalogueMixin(ReponseConditionnelleMixin):
+    """
+    Pour les vues du catalogue : pagination avec compte en cache (par numéro
+    de page ou par clé, voir ecommerce.pagination.PaginationCurseurMixin) et
+    versions du cache dans le contexte (`version_cache.produits`,
+    `version_cache.categories`), à passer aux fragments {% cache %}.
+
+    Les versions servent aussi d'ETag (voir ecommerce.conditionnel) : une
+    page déjà en cache chez le client est validée sans requête en base.
+    """
+    paginator_class = PaginatorCatalogue
+    paginator_curseur_class = PaginatorCurseurCatalogue
+
+    def get_validateurs(self):
+        return (versions(), self.request.get_full_path()), None
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['version_cache'] = versions()
+        context['duree_cache'] = duree_cache()
+        return context
+
+
+class ArbreCategories:
+    """
+    Catégories actives triées par nom, avec leurs images préchargées et leur
+    nombre de produits actifs (attribut `nombre_produits` de chaque catégorie).
+
+    Les catégories n'ont pas de parent : toutes sont des racines, sans enfants.
+    """
+
+    def __init__(self, categories):
+        self.categories = categories
+        self.par_id = {categorie.id: categorie for categorie in categories}
+        self.par_slug = {categorie.slug: categorie for categorie in categories}
+        self.nombre_produits = {categorie.id: categorie.nombre_produits for categorie in categories}
+        self.racines = categories
+        self.enfants = {categorie.id: [] for categorie in categories}
+
+    def __iter__(self):
+        return iter(self.categories)
+
+    def __len__(self):
+        return len(self.categories)
+
+    @classmethod
+    def construire(cls):
+        from django.db.models import Count
+        from .models import Categorie, Produit
+
+        nombres = dict(
+            Produit.objects.filter(est_actif=True).values_list('categorie_id')
+            .annotate(nombre=Count('pk')).order_by()
+        )
+        categories = list(Categorie.objects.filter(est_active=True).order_by('nom').prefetch_related('images'))
+        for categorie in categories:
+            categorie.nombre_produits = nombres.get(categorie.id, 0)
+        return cls(categories)
+
+
+# Dernier arbre construit ou lu dans le cache partagé par ce processus : (clé, arbre)
+_arbre_local = (None, None)
+
+
+def arbre_categories():
+    """
+    Arbre des catégories actives. Gardé en mémoire par le processus et dans le
+    cache partagé, sous la version de l'espace 'categories' : les signaux du
+    catalogue l'incrémentent aussi quand un produit change de catégorie, est
+    activé, désactivé, créé ou supprimé (voir catalog.signals).
+    """
+    global _arbre_local
+    numero = version('categories')
+    if numero is None:
+        # Pas de cache partagé (DummyCache) : rien ne signalerait une modification
+        return ArbreCategories.construire()
+    cle_arbre = f"catalog:arbre_categories:{numero}"
+    cle_locale, arbre = _arbre_local
+    if cle_locale == cle_arbre:
+        return arbre
+    arbre = cache.get(cle_arbre)
+    if arbre is None:
+        arbre = ArbreCategories.construire()
+        cache.set(cle_arbre, arbre, duree_cache())
+    _arbre_local = (cle_arbre, arbre)
+    return arbre
@@ -1,7 +1,17 @@
-from .models import Categorie
+from django.utils.functional import SimpleLazyObject
+
+from .cache import arbre_categories
+
 
 def categories(request):
-    """Ajoute la liste des catégories actives au contexte de tous les templates."""
+    """
+    Ajoute les catégories actives au contexte de tous les templates.
+    
+    L'arbre n'est lu (en mémoire, voir catalog.cache.arbre_categories) que si
+    le template s'en sert : aucune requête sinon.
+    """
+    arbre = SimpleLazyObject(arbre_categories)
     return {
-        'categories': Categorie.objects.filter(est_active=True).order_by('nom')
+        'categories': arbre,
+        'arbre_categories': arbre,
     }
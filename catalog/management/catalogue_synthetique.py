@@ -0,0 +1,70 @@
+"""
+Génération d'un catalogue synthétique pour les commandes de benchmark.
+
+Les données sont insérées avec bulk_create (sans signaux) ; les commandes
+qui l'utilisent travaillent dans une transaction annulée à la fin.
+"""
+import random
+from decimal import Decimal
+
+from catalog.models import Categorie, Produit
+
+NOMS_CATEGORIES = [
+    'Électronique', 'Informatique', 'Téléphonie', 'Maison', 'Jardin', 'Beauté',
+    'Sport', 'Jouets', 'Bricolage', 'Cuisine', 'Livres', 'Musique',
+]
+
+MOTS = [
+    'chaise', 'table', 'lampe', 'écran', 'clavier', 'souris', 'casque', 'enceinte',
+    'téléphone', 'chargeur', 'câble', 'sac', 'veste', 'chaussure', 'montre', 'livre',
+    'ballon', 'vélo', 'tente', 'poêle', 'casserole', 'couteau', 'perceuse', 'tournevis',
+    'bois', 'métal', 'cuir', 'coton', 'verre', 'plastique', 'noir', 'blanc', 'rouge',
+    'bleu', 'vert', 'élégant', 'robuste', 'léger', 'compact', 'professionnel',
+    'étanche', 'sans fil', 'rechargeable', 'pliable', 'ergonomique', 'portable',
+]
+
+SYLLABES = ['ka', 'lo', 'mi', 'ra', 'ton', 'vel', 'zur', 'pa', 'nex', 'dor', 'fi', 'gal', 'sto', 'bri', 'quo']
+
+
+def marques(aleatoire, nombre=2000):
+    """Génère des noms de marque pseudo-aléatoires, pour un vocabulaire réaliste."""
+    return [''.join(aleatoire.choices(SYLLABES, k=3)) for _ in range(nombre)]
+
+
+def creer_catalogue(nombre_produits, graine=42, taille_lot=5000):
+    """
+    Crée `nombre_produits` produits répartis dans les catégories de NOMS_CATEGORIES.
+
+    Returns:
+        list: Les catégories créées
+    """
+    aleatoire = random.Random(graine)
+    noms_marques = marques(aleatoire)
+    categories = Categorie.objects.bulk_create([
+        Categorie(nom=f'{nom} (bench)', slug=f'bench-{i}')
+        for i, nom in enumerate(NOMS_CATEGORIES)
+    ])
+    
+    lot = []
+    for i in range(nombre_produits):
+        marque = aleatoire.choice(noms_marques)
+        nom = f"{' '.join(aleatoire.sample(MOTS, 2)).capitalize()} {marque} {aleatoire.randint(100, 999)}"
+        description = ' '.join(aleatoire.choices(MOTS + noms_marques[:200], k=40))
+        lot.append(Produit(
+            reference=f'BENCH-{i}',
+            slug=f'bench-{i}',
+            nom=nom,
+            resume=description[:120],
+            description=description,
+            prix=Decimal(aleatoire.randint(100, 100000)) / 100,
+            quantite=aleatoire.randint(0, 50),
+            categorie=aleatoire.choice(categories),
+            est_meilleur_vente=aleatoire.random() < 0.05,
+            est_nouveau=aleatoire.random() < 0.1,
+        ))
+        if len(lot) >= taille_lot:
+            Produit.objects.bulk_create(lot)
+            lot = []
+    if lot:
+        Produit.objects.bulk_create(lot)
+    return categories
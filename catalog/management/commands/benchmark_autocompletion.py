@@ -0,0 +1,99 @@
+import gc
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog.management.catalogue_synthetique import creer_catalogue
+from catalog.models import Produit
+from catalog.search.autocompletion import IndexAutocompletion
+
+
+class AnnulerBenchmark(Exception):
+    """Levée pour annuler la transaction contenant le catalogue synthétique."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Simule la saisie, caractère par caractère, de noms de produits dans "
+        "l'autocomplétion et vérifie le 99e centile de latence par rapport à "
+        "CATALOG_AUTOCOMPLETE_P99_MS. Les données sont créées dans une "
+        "transaction annulée à la fin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tailles',
+            type=int,
+            nargs='+',
+            default=[10000, 100000],
+            help="Tailles de catalogue à tester (défaut : 10000 100000)",
+        )
+        parser.add_argument(
+            '--saisies',
+            type=int,
+            default=500,
+            help="Nombre de noms saisis (défaut : 500)",
+        )
+
+    def handle(self, *args, **options):
+        self.objectif = getattr(settings, 'CATALOG_AUTOCOMPLETE_P99_MS', 5)
+        depassements = []
+        for taille in options['tailles']:
+            try:
+                with transaction.atomic():
+                    p99 = self.mesurer(taille, options['saisies'])
+                    raise AnnulerBenchmark
+            except AnnulerBenchmark:
+                pass
+            if p99 > self.objectif:
+                depassements.append(taille)
+        if depassements:
+            raise CommandError(
+                f"99e centile supérieur à {self.objectif} ms pour : "
+                + ', '.join(str(taille) for taille in depassements)
+            )
+
+    def mesurer(self, taille, saisies):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Catalogue de {taille} produits"))
+        creer_catalogue(taille)
+        
+        index = IndexAutocompletion()
+        debut = time.perf_counter()
+        index.charger()
+        # Comme au démarrage d'un worker (voir gunicorn_config.post_worker_init)
+        gc.freeze()
+        self.stdout.write(
+            f"  construction : {time.perf_counter() - debut:.1f} s ({sum(map(len, index.cles.values()))} clés)"
+        )
+        
+        aleatoire = random.Random(7)
+        noms = list(Produit.objects.values_list('nom', flat=True)[:5000])
+        produits = list(Produit.objects.values(*index.PRODUIT_CHAMPS)[:200])
+        durees = []
+        for numero in range(saisies):
+            nom = aleatoire.choice(noms)
+            # Partir d'un mot au hasard : l'utilisateur ne tape pas toujours le début du nom
+            mots = nom.split()
+            saisie = ' '.join(mots[aleatoire.randrange(len(mots)):])
+            for longueur in range(1, len(saisie) + 1):
+                debut = time.perf_counter()
+                index.suggerer(saisie[:longueur])
+                durees.append((time.perf_counter() - debut) * 1000)
+            # Une modification de produit de temps en temps, qui invalide des préfixes
+            if numero % 10 == 0:
+                valeurs = dict(aleatoire.choice(produits), nom=aleatoire.choice(noms))
+                index.placer_produit(valeurs)
+        
+        durees.sort()
+        p99 = durees[min(len(durees) - 1, int(len(durees) * 0.99))]
+        style = self.style.SUCCESS if p99 <= self.objectif else self.style.ERROR
+        self.stdout.write(
+            f"  {len(durees)} frappes : médiane {statistics.median(durees):.3f} ms, "
+            + style(f"p99 {p99:.2f} ms")
+            + f" (objectif {self.objectif} ms), max {durees[-1]:.2f} ms"
+        )
+        return p99
@@ -0,0 +1,80 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.management.catalogue_synthetique import creer_catalogue
+from catalog.models import Produit
+from catalog.search.backends import IcontainsBackend, IndexInverseBackend
+
+# Requêtes fréquentes (mots présents dans une grande partie du catalogue) ;
+# des requêtes sélectives (marques) et une requête sans résultat sont ajoutées
+# à partir des données générées
+REQUETES = ['chaise', 'lampe noire', 'casque sans fil', 'écrans', 'veste cuir légère', 'table bois robuste']
+
+
+class AnnulerBenchmark(Exception):
+    """Levée pour annuler la transaction contenant le catalogue synthétique."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare la recherche par index inversé (BM25) à la recherche icontains "
+        "sur des catalogues synthétiques. Les données sont créées dans une "
+        "transaction annulée à la fin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tailles',
+            type=int,
+            nargs='+',
+            default=[10000, 100000, 1000000],
+            help="Tailles de catalogue à tester (défaut : 10000 100000 1000000)",
+        )
+        parser.add_argument(
+            '--repetitions',
+            type=int,
+            default=5,
+            help="Nombre d'exécutions de chaque requête (défaut : 5)",
+        )
+
+    def handle(self, *args, **options):
+        for taille in options['tailles']:
+            try:
+                with transaction.atomic():
+                    self.mesurer(taille, options['repetitions'])
+                    raise AnnulerBenchmark
+            except AnnulerBenchmark:
+                pass
+
+    def mesurer(self, taille, repetitions):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Catalogue de {taille} produits"))
+        
+        debut = time.perf_counter()
+        creer_catalogue(taille)
+        self.stdout.write(f"  création      : {time.perf_counter() - debut:.1f} s")
+        
+        index = IndexInverseBackend()
+        debut = time.perf_counter()
+        index.reindexer(taille_lot=2000)
+        self.stdout.write(f"  indexation    : {time.perf_counter() - debut:.1f} s")
+        
+        queryset = Produit.objects.filter(est_actif=True)
+        marques = [nom.split()[-2] for nom in queryset.order_by('pk').values_list('nom', flat=True)[:3]]
+        requetes = REQUETES + marques + ['introuvable']
+        for backend in (IcontainsBackend(), index):
+            durees = []
+            for requete in requetes:
+                for _ in range(repetitions):
+                    debut = time.perf_counter()
+                    # Première page de résultats, comme dans les vues
+                    list(backend.rechercher(requete, queryset)[:12])
+                    durees.append((time.perf_counter() - debut) * 1000)
+            durees.sort()
+            p95 = durees[min(len(durees) - 1, int(len(durees) * 0.95))]
+            self.stdout.write(
+                f"  {type(backend).__name__:<20}: médiane {statistics.median(durees):.1f} ms, "
+                f"p95 {p95:.1f} ms"
+            )
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from catalog.stock import compacter
+
+
+class Command(BaseCommand):
+    help = (
+        "Reporte les mouvements de stock en attente sur la quantité des "
+        "produits (voir catalog.stock). Avec --intervalle, tourne en boucle "
+        "(worker) au lieu de s'arrêter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--taille-lot',
+            type=int,
+            default=500,
+            help="Nombre de produits compactés par transaction (défaut : 500)",
+        )
+        parser.add_argument(
+            '--intervalle',
+            type=float,
+            default=0,
+            help="Secondes entre deux passages ; 0 pour un seul passage (défaut : 0)",
+        )
+
+    def handle(self, *args, **options):
+        taille_lot = options['taille_lot']
+        intervalle = options['intervalle']
+        while True:
+            produits = compacter(taille_lot)
+            if intervalle <= 0:
+                break
+            if produits:
+                self.stdout.write(f"{produits} produit(s) compacté(s).")
+            time.sleep(intervalle)
+            close_old_connections()
+        self.stdout.write(self.style.SUCCESS(f"{produits} produit(s) compacté(s)."))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from catalog.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Reconstruit entièrement l'index de recherche du catalogue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--taille-lot',
+            type=int,
+            default=500,
+            help="Nombre de produits indexés par lot (défaut : 500)",
+        )
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        debut = time.perf_counter()
+        total = backend.reindexer(taille_lot=options['taille_lot'])
+        duree = time.perf_counter() - debut
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} produit(s) indexé(s) avec {type(backend).__name__} en {duree:.1f} s."
+        ))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from catalog.models import Produit, repartition_notes, champs_synthese_notes
+
+
+CHAMPS_SYNTHESE = ['note_moyenne', 'nombre_avis'] + [f'nb_notes_{i}' for i in range(1, 6)]
+
+
+class Command(BaseCommand):
+    help = "Recalcule la synthèse des notes (moyenne, nombre d'avis, répartition) de tous les produits."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--taille-lot',
+            type=int,
+            default=500,
+            help="Nombre de produits mis à jour par requête (défaut : 500)",
+        )
+
+    def handle(self, *args, **options):
+        taille_lot = options['taille_lot']
+        repartition = repartition_notes()
+        
+        a_mettre_a_jour = []
+        modifies = 0
+        with transaction.atomic():
+            produits = Produit.objects.only('id', *CHAMPS_SYNTHESE).order_by('id')
+            for produit in produits.iterator(chunk_size=taille_lot):
+                champs = champs_synthese_notes(repartition.get(produit.id, {}))
+                if all(getattr(produit, champ) == valeur for champ, valeur in champs.items()):
+                    continue
+                for champ, valeur in champs.items():
+                    setattr(produit, champ, valeur)
+                a_mettre_a_jour.append(produit)
+                
+                if len(a_mettre_a_jour) >= taille_lot:
+                    Produit.objects.bulk_update(a_mettre_a_jour, CHAMPS_SYNTHESE)
+                    modifies += len(a_mettre_a_jour)
+                    a_mettre_a_jour = []
+            
+            if a_mettre_a_jour:
+                Produit.objects.bulk_update(a_mettre_a_jour, CHAMPS_SYNTHESE)
+                modifies += len(a_mettre_a_jour)
+        
+        self.stdout.write(self.style.SUCCESS(f"{modifies} produit(s) mis à jour."))
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.10 on 2026-10-18 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_imagecategorie'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produit',
+            name='nb_notes_1',
+            field=models.PositiveIntegerField(default=0, verbose_name='Avis 1 étoile'),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='nb_notes_2',
+            field=models.PositiveIntegerField(default=0, verbose_name='Avis 2 étoiles'),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='nb_notes_3',
+            field=models.PositiveIntegerField(default=0, verbose_name='Avis 3 étoiles'),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='nb_notes_4',
+            field=models.PositiveIntegerField(default=0, verbose_name='Avis 4 étoiles'),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='nb_notes_5',
+            field=models.PositiveIntegerField(default=0, verbose_name='Avis 5 étoiles'),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='nombre_avis',
+            field=models.PositiveIntegerField(default=0, verbose_name="Nombre d'avis"),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='note_moyenne',
+            field=models.FloatField(default=0, verbose_name='Note moyenne'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.10 on 2026-10-18 04:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_produit_synthese_notes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentRecherche',
+            fields=[
+                ('produit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document_recherche', serialize=False, to='catalog.produit', verbose_name='Produit')),
+                ('longueur', models.PositiveIntegerField(default=0, verbose_name='Longueur du document')),
+            ],
+            options={
+                'verbose_name': 'Document de recherche',
+                'verbose_name_plural': 'Documents de recherche',
+            },
+        ),
+        migrations.CreateModel(
+            name='TermeRecherche',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('terme', models.CharField(max_length=64, verbose_name='Terme')),
+                ('poids', models.PositiveIntegerField(default=1, verbose_name='Fréquence pondérée')),
+                ('longueur_document', models.PositiveIntegerField(default=0, verbose_name='Longueur du document')),
+                ('impact', models.FloatField(default=0, verbose_name='Impact BM25')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='termes_recherche', to='catalog.produit', verbose_name='Produit')),
+            ],
+            options={
+                'verbose_name': 'Terme de recherche',
+                'verbose_name_plural': 'Termes de recherche',
+                'indexes': [models.Index(fields=['terme', '-impact'], name='catalog_ter_terme_430ee8_idx')],
+                'unique_together': {('terme', 'produit')},
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.10 on 2026-10-18 05:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def stock_initial(apps, schema_editor):
+    """Le stock actuel devient la première entrée du journal (déjà compactée)."""
+    Produit = apps.get_model('catalog', 'Produit')
+    MouvementStock = apps.get_model('catalog', 'MouvementStock')
+    MouvementStock.objects.bulk_create(
+        [
+            MouvementStock(
+                produit_id=produit_id, type_mouvement='ajustement', quantite=quantite,
+                motif="Stock initial", compacte=True,
+            )
+            for produit_id, quantite in Produit.objects.filter(quantite__gt=0).values_list('pk', 'quantite').iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('orders', '0001_initial'),
+        ('catalog', '0004_index_recherche'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MouvementStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_mouvement', models.CharField(choices=[('vente', 'Vente'), ('annulation', 'Annulation de commande'), ('reapprovisionnement', 'Réapprovisionnement'), ('ajustement', 'Ajustement')], max_length=20, verbose_name='Type de mouvement')),
+                ('quantite', models.IntegerField(verbose_name='Quantité')),
+                ('motif', models.CharField(blank=True, max_length=255, verbose_name='Motif')),
+                ('date_creation', models.DateTimeField(auto_now_add=True, verbose_name='Date')),
+                ('compacte', models.BooleanField(default=False, verbose_name='Reporté sur le stock du produit')),
+                ('auteur', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mouvements_stock', to=settings.AUTH_USER_MODEL, verbose_name='Auteur')),
+                ('commande', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mouvements_stock', to='orders.commande', verbose_name='Commande')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mouvements_stock', to='catalog.produit', verbose_name='Produit')),
+            ],
+            options={
+                'verbose_name': 'Mouvement de stock',
+                'verbose_name_plural': 'Mouvements de stock',
+                'ordering': ['-date_creation', '-id'],
+                'indexes': [models.Index(condition=models.Q(('compacte', False)), fields=['produit', 'quantite'], name='mouvement_a_compacter'), models.Index(fields=['produit', '-date_creation'], name='mouvement_historique')],
+            },
+        ),
+        migrations.RunPython(stock_initial, migrations.RunPython.noop),
+    ]
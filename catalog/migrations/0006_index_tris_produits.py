@@ -0,0 +1,37 @@
+# Generated by Django 4.2.10 on 2026-10-18 05:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_journal_stock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('est_actif', True)), fields=['prix', 'id'], name='produit_actif_prix'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('est_actif', True)), fields=['nom', 'id'], name='produit_actif_nom'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('est_actif', True)), fields=['date_creation', 'id'], name='produit_actif_date'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('est_actif', True)), fields=['categorie', 'date_creation', 'id'], name='produit_categorie_date'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('est_actif', True), ('est_nouveau', True)), fields=['date_creation', 'id'], name='produit_nouveautes'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('est_actif', True), ('prix_promotionnel__isnull', False)), fields=['date_mise_a_jour', 'id'], name='produit_promotions'),
+        ),
+    ]
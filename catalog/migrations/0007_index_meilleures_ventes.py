@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 05:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_index_tris_produits'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('est_actif', True), ('est_meilleur_vente', True)), fields=['date_creation', 'id'], name='produit_meilleures_ventes'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 05:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_index_meilleures_ventes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('est_actif', True)), fields=['note_moyenne', 'nombre_avis', 'id'], name='produit_actif_note'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.10 on 2026-10-18 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_index_produits_notes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='produit',
+            name='produit_promotions',
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(condition=models.Q(('est_actif', True), ('prix_promotionnel__isnull', False)), fields=['date_creation', 'id'], name='produit_promotions'),
+        ),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models import Count, Prefetch
+from django.db.models.functions import Substr
 from django.urls import reverse
 from django.utils.text import slugify
 from django.conf import settings
@@ -100,6 +103,34 @@ class ImageCategorie(models.Model):
         super().save(*args, **kwargs)
 
 
+# Longueur de l'extrait de description chargé par ProduitQuerySet.for_listing()
+LONGUEUR_EXTRAIT_DESCRIPTION = 400
+
+
+class ProduitQuerySet(models.QuerySet):
+    """QuerySet des produits, avec le mode de chargement des listes du catalogue."""
+
+    def for_listing(self):
+        """
+        Produits prêts pour une liste (cartes produit) : catégorie jointe,
+        seule l'image principale préchargée (voir Produit.image_principale) et
+        description complète différée, remplacée par un extrait annoté.
+        
+        La synthèse des avis (note_moyenne, nombre_avis, nb_notes_*) est
+        stockée sur le produit et vient donc avec la ligne. Une page coûte
+        deux requêtes, quel que soit le nombre de produits.
+        """
+        return self.select_related('categorie').prefetch_related(
+            Prefetch(
+                'images',
+                queryset=ImageProduit.objects.filter(est_principale=True),
+                to_attr='images_principales',
+            )
+        ).defer('description').annotate(
+            extrait_description=Substr('description', 1, LONGUEUR_EXTRAIT_DESCRIPTION)
+        )
+
+
 class Produit(models.Model):
     """Modèle représentant un produit dans le catalogue."""
     # Informations de base
@@ -150,10 +181,21 @@ class Produit(models.Model):
         verbose_name="Date de publication"
     )
     
+    # Synthèse des avis approuvés (dénormalisée, voir mettre_a_jour_notes)
+    note_moyenne = models.FloatField(default=0, verbose_name="Note moyenne")
+    nombre_avis = models.PositiveIntegerField(default=0, verbose_name="Nombre d'avis")
+    nb_notes_1 = models.PositiveIntegerField(default=0, verbose_name="Avis 1 étoile")
+    nb_notes_2 = models.PositiveIntegerField(default=0, verbose_name="Avis 2 étoiles")
+    nb_notes_3 = models.PositiveIntegerField(default=0, verbose_name="Avis 3 étoiles")
+    nb_notes_4 = models.PositiveIntegerField(default=0, verbose_name="Avis 4 étoiles")
+    nb_notes_5 = models.PositiveIntegerField(default=0, verbose_name="Avis 5 étoiles")
+    
     # SEO
     meta_titre = models.CharField(max_length=70, blank=True, verbose_name="Méta-titre (SEO)")
     meta_description = models.CharField(max_length=160, blank=True, verbose_name="Méta-description (SEO)")
     
+    objects = ProduitQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Produit"
         verbose_name_plural = "Produits"
@@ -162,6 +204,34 @@ class Produit(models.Model):
             models.Index(fields=['id', 'slug']),
             models.Index(fields=['nom']),
             models.Index(fields=['-date_creation']),
+            # Tris des listes de produits actifs (pagination par curseur, voir
+            # catalog.views.TRIS_PRODUITS) : parcourus dans un sens ou dans
+            # l'autre, les champs de chaque tri ayant le même sens
+            models.Index(fields=['prix', 'id'], name='produit_actif_prix', condition=models.Q(est_actif=True)),
+            models.Index(fields=['nom', 'id'], name='produit_actif_nom', condition=models.Q(est_actif=True)),
+            models.Index(fields=['date_creation', 'id'], name='produit_actif_date', condition=models.Q(est_actif=True)),
+            models.Index(
+                fields=['categorie', 'date_creation', 'id'], name='produit_categorie_date',
+                condition=models.Q(est_actif=True),
+            ),
+            models.Index(
+                fields=['date_creation', 'id'], name='produit_nouveautes',
+                condition=models.Q(est_actif=True, est_nouveau=True),
+            ),
+            models.Index(
+                fields=['date_creation', 'id'], name='produit_promotions',
+                condition=models.Q(est_actif=True, prix_promotionnel__isnull=False),
+            ),
+            # Meilleures ventes de la page d'accueil
+            models.Index(
+                fields=['date_creation', 'id'], name='produit_meilleures_ventes',
+                condition=models.Q(est_actif=True, est_meilleur_vente=True),
+            ),
+            # Produits les mieux notés (recommandations sans historique, voir ai.reco)
+            models.Index(
+                fields=['note_moyenne', 'nombre_avis', 'id'], name='produit_actif_note',
+                condition=models.Q(est_actif=True),
+            ),
         ]
 
     def __str__(self):
@@ -182,22 +252,6 @@ class Produit(models.Model):
     def get_absolute_url(self):
         return reverse('catalog:detail_produit', kwargs={'slug': self.slug})
         
-    def has_purchased_by_user(self, user):
-        """
-        Vérifie si l'utilisateur a déjà acheté ce produit.
-        Retourne True si l'utilisateur a commandé ce produit au moins une fois.
-        """
-        if not user.is_authenticated:
-            return False
-            
-        from orders.models import OrderItem
-        return OrderItem.objects.filter(
-            order__user=user,
-            order__status__in=['completed', 'delivered'],  # Seules les commandes terminées ou livrées
-            product=self,
-            quantity__gt=0
-        ).exists()
-    
     def est_en_promotion(self):
         """Vérifie si le produit est en promotion."""
         return self.prix_promotionnel is not None and self.prix_promotionnel < self.prix
@@ -224,23 +278,41 @@ class Produit(models.Model):
         if self.resume:
             return self.resume
         # Retourne les 30 premiers mots de la description complète si le résumé n'est pas disponible
-        return ' '.join(self.description.split()[:30]) + '...'
+        return ' '.join(self.get_extrait_description().split()[:30]) + '...'
+    
+    def get_extrait_description(self):
+        """
+        Retourne le début de la description : l'extrait annoté par
+        for_listing() s'il est présent, sans charger la description complète.
+        """
+        extrait = getattr(self, 'extrait_description', None)
+        if extrait is not None:
+            return extrait
+        return self.description[:LONGUEUR_EXTRAIT_DESCRIPTION]
+    
+    @property
+    def image_principale(self):
+        """
+        Retourne l'image principale du produit (ImageProduit) ou None.
+        Utilise le préchargement de for_listing() quand il est présent.
+        """
+        if hasattr(self, 'images_principales'):
+            return self.images_principales[0] if self.images_principales else None
+        return self.images.filter(est_principale=True).first() or self.images.first()
         
     @property
     def average_rating(self):
         """
         Retourne la note moyenne du produit sur 5.
         """
-        from django.db.models import Avg
-        result = self.avis.filter(approuve=True).aggregate(avg_rating=Avg('note'))
-        return result['avg_rating'] or 0
+        return self.note_moyenne
         
     @property
     def rating_count(self):
         """
         Retourne le nombre total d'avis approuvés pour ce produit.
         """
-        return self.avis.filter(approuve=True).count()
+        return self.nombre_avis
         
     def get_rating_stats(self):
         """
@@ -251,19 +323,7 @@ class Produit(models.Model):
                   le nombre d'avis pour chaque note.
                   Exemple: {1: 2, 2: 0, 3: 5, 4: 3, 5: 10}
         """
-        from django.db.models import Count
-        
-        # Initialiser un dictionnaire avec des compteurs à zéro pour chaque note
-        stats = {i: 0 for i in range(1, 6)}
-        
-        # Récupérer le nombre d'avis groupés par note
-        ratings = self.avis.filter(approuve=True).values('note').annotate(count=Count('id'))
-        
-        # Mettre à jour le dictionnaire avec les valeurs réelles
-        for item in ratings:
-            stats[item['note']] = item['count']
-            
-        return stats
+        return {i: getattr(self, f'nb_notes_{i}') for i in range(1, 6)}
         
     def get_rating_percentages(self):
         """
@@ -280,6 +340,26 @@ class Produit(models.Model):
             
         stats = self.get_rating_stats()
         return {rating: int((count / total_reviews) * 100) for rating, count in stats.items()}
+    
+    def mettre_a_jour_notes(self):
+        """
+        Recalcule la synthèse des avis approuvés (AvisProduit et reviews.Review)
+        et l'enregistre sur le produit.
+        
+        La ligne du produit est verrouillée pendant le recalcul pour que deux
+        avis enregistrés en même temps ne laissent pas une synthèse périmée.
+        """
+        with transaction.atomic():
+            list(Produit.objects.select_for_update().filter(pk=self.pk).values_list('pk', flat=True))
+            repartition = repartition_notes(produit_ids=[self.pk]).get(self.pk, {})
+            champs = champs_synthese_notes(repartition)
+            Produit.objects.filter(pk=self.pk).update(**champs)
+            # update() n'émet pas post_save : le cache du catalogue est invalidé ici
+            from .cache import invalider
+            invalider('produits')
+        
+        for champ, valeur in champs.items():
+            setattr(self, champ, valeur)
         
     def has_purchased_by_user(self, user):
         """
@@ -294,16 +374,59 @@ class Produit(models.Model):
         if not user.is_authenticated:
             return False
             
-        # Vérifier si l'utilisateur a une commande avec ce produit
+        # Vérifier si l'utilisateur a une commande non annulée avec ce produit
+        # (index ligne_produit_commande, puis clé primaire de la commande)
         from orders.models import Commande, LigneCommande
         
         return LigneCommande.objects.filter(
+            produit=self,
             commande__utilisateur=user,
-            commande__statut__in=[Commande.PAYEE, Commande.EXPEDIEE, Commande.LIVREE],
-            produit=self
+            commande__statut__in=[Commande.STATUT_EN_COURS, Commande.STATUT_LIVRE],
         ).exists()
 
 
+def repartition_notes(produit_ids=None):
+    """
+    Compte les avis approuvés par produit et par note.
+    
+    Les avis du catalogue (AvisProduit) et ceux de l'application reviews sont
+    additionnés. Une requête groupée par source, quel que soit le nombre de produits.
+    
+    Args:
+        produit_ids (list, optional): Limite le calcul à ces produits
+        
+    Returns:
+        dict: {produit_id: {note: nombre_avis}}
+    """
+    sources = [(AvisProduit.objects.filter(approuve=True), 'produit_id', 'note')]
+    if apps.is_installed('reviews'):
+        from reviews.models import Review
+        sources.append((Review.objects.filter(is_approved=True), 'product_id', 'rating'))
+    
+    repartition = {}
+    for queryset, champ_produit, champ_note in sources:
+        if produit_ids is not None:
+            queryset = queryset.filter(**{f'{champ_produit}__in': produit_ids})
+        lignes = queryset.values_list(champ_produit, champ_note).annotate(nombre=Count('id')).order_by()
+        for produit_id, note, nombre in lignes:
+            notes = repartition.setdefault(produit_id, {})
+            notes[note] = notes.get(note, 0) + nombre
+    return repartition
+
+
+def champs_synthese_notes(notes):
+    """
+    Convertit une répartition {note: nombre_avis} en valeurs des champs de synthèse de Produit.
+    """
+    champs = {f'nb_notes_{i}': notes.get(i, 0) for i in range(1, 6)}
+    total = sum(champs.values())
+    champs['nombre_avis'] = total
+    champs['note_moyenne'] = (
+        sum(i * champs[f'nb_notes_{i}'] for i in range(1, 6)) / total if total else 0
+    )
+    return champs
+
+
 class ImageProduit(models.Model):
     """Modèle pour stocker plusieurs images par produit."""
     produit = models.ForeignKey(
@@ -390,3 +513,116 @@ class CaracteristiqueProduit(models.Model):
     
     def __str__(self):
         return f"{self.nom}: {self.valeur}"
+
+
+class MouvementStock(models.Model):
+    """
+    Entrée du journal de stock, qui n'est jamais modifiée ni supprimée.
+
+    Produit.quantite est le stock à la dernière compaction ; le stock réel
+    y ajoute les mouvements pas encore compactés (voir catalog.stock).
+    """
+    TYPE_VENTE = 'vente'
+    TYPE_ANNULATION = 'annulation'
+    TYPE_REAPPROVISIONNEMENT = 'reapprovisionnement'
+    TYPE_AJUSTEMENT = 'ajustement'
+    
+    CHOIX_TYPE = [
+        (TYPE_VENTE, 'Vente'),
+        (TYPE_ANNULATION, 'Annulation de commande'),
+        (TYPE_REAPPROVISIONNEMENT, 'Réapprovisionnement'),
+        (TYPE_AJUSTEMENT, 'Ajustement'),
+    ]
+    
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name='mouvements_stock',
+        verbose_name="Produit"
+    )
+    type_mouvement = models.CharField(max_length=20, choices=CHOIX_TYPE, verbose_name="Type de mouvement")
+    # Négative pour une sortie de stock
+    quantite = models.IntegerField(verbose_name="Quantité")
+    commande = models.ForeignKey(
+        'orders.Commande',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='mouvements_stock',
+        verbose_name="Commande"
+    )
+    auteur = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='mouvements_stock',
+        verbose_name="Auteur"
+    )
+    motif = models.CharField(max_length=255, blank=True, verbose_name="Motif")
+    date_creation = models.DateTimeField(auto_now_add=True, verbose_name="Date")
+    compacte = models.BooleanField(default=False, verbose_name="Reporté sur le stock du produit")
+    
+    class Meta:
+        verbose_name = "Mouvement de stock"
+        verbose_name_plural = "Mouvements de stock"
+        ordering = ['-date_creation', '-id']
+        indexes = [
+            # Mouvements à compacter d'un produit, lus dans l'index seul ; les
+            # mouvements compactés n'y figurent plus, il reste petit
+            models.Index(
+                fields=['produit', 'quantite'],
+                condition=models.Q(compacte=False),
+                name='mouvement_a_compacter',
+            ),
+            models.Index(fields=['produit', '-date_creation'], name='mouvement_historique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_type_mouvement_display()} : {self.quantite:+d} x {self.produit_id}"
+
+
+class DocumentRecherche(models.Model):
+    """Produit présent dans l'index de recherche, avec la longueur pondérée de son texte."""
+    produit = models.OneToOneField(
+        Produit,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='document_recherche',
+        verbose_name="Produit"
+    )
+    longueur = models.PositiveIntegerField(default=0, verbose_name="Longueur du document")
+    
+    class Meta:
+        verbose_name = "Document de recherche"
+        verbose_name_plural = "Documents de recherche"
+    
+    def __str__(self):
+        return f"Document de recherche de {self.produit_id}"
+
+
+class TermeRecherche(models.Model):
+    """Entrée de l'index inversé : un terme et son poids dans un produit."""
+    terme = models.CharField(max_length=64, verbose_name="Terme")
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name='termes_recherche',
+        verbose_name="Produit"
+    )
+    poids = models.PositiveIntegerField(default=1, verbose_name="Fréquence pondérée")
+    longueur_document = models.PositiveIntegerField(default=0, verbose_name="Longueur du document")
+    # Part BM25 du terme hors IDF, précalculée à l'indexation
+    impact = models.FloatField(default=0, verbose_name="Impact BM25")
+    
+    class Meta:
+        verbose_name = "Terme de recherche"
+        verbose_name_plural = "Termes de recherche"
+        unique_together = ['terme', 'produit']
+        indexes = [
+            # Entrées les plus fortes d'un terme en premier (listes de champions)
+            models.Index(fields=['terme', '-impact']),
+        ]
+    
+    def __str__(self):
+        return f"{self.terme} ({self.produit_id})"
@@ -0,0 +1,24 @@
+"""
+Recherche de produits du catalogue.
+
+Le moteur utilisé est défini par le paramètre CATALOG_SEARCH_BACKEND
+(chemin pointé vers une classe de catalog.search.backends).
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = 'catalog.search.backends.IndexInverseBackend'
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """Retourne l'instance (partagée par le processus) du moteur de recherche configuré."""
+    chemin = getattr(settings, 'CATALOG_SEARCH_BACKEND', DEFAULT_BACKEND)
+    return import_string(chemin)()
+
+
+def rechercher_produits(requete, queryset=None):
+    """Raccourci : recherche `requete` avec le moteur configuré."""
+    return get_search_backend().rechercher(requete, queryset)
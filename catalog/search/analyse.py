@@ -0,0 +1,68 @@
+"""
+Analyse de texte pour la recherche du catalogue : normalisation, découpage
+en mots et racinisation légère du français.
+"""
+import re
+import unicodedata
+
+# Longueur maximale d'un terme indexé (voir TermeRecherche.terme)
+LONGUEUR_MAX_TERME = 64
+
+MOTS_VIDES = frozenset("""
+a au aux avec ce ces cet cette d dans de des du elle en est et il ils je l la le les
+leur leurs lui ma mais me mes moi mon ne nos notre nous on ou par pas pour qu que
+qui s sa se ses son sur ta te tes toi ton tu un une vos votre vous y
+""".split())
+
+SUFFIXES = (
+    'issements', 'issement', 'atrices', 'atrice', 'ateurs', 'ateur', 'ations', 'ation',
+    'ements', 'ement', 'ments', 'ment', 'euses', 'euse', 'istes', 'iste', 'iques', 'ique',
+    'ables', 'able', 'ives', 'ive', 'eux',
+)
+
+RE_MOT = re.compile(r'[a-z0-9]+')
+
+
+def replier_accents(texte):
+    """Met le texte en minuscules et retire les accents (« Été » devient « ete »)."""
+    texte = texte.lower().replace('œ', 'oe').replace('æ', 'ae')
+    decompose = unicodedata.normalize('NFKD', texte)
+    return ''.join(c for c in decompose if not unicodedata.combining(c))
+
+
+def raciniser(mot):
+    """
+    Racinisation légère du français : retire les suffixes dérivationnels
+    courants ainsi que les marques du pluriel et du féminin.
+    """
+    if len(mot) <= 3 or mot.isdigit():
+        return mot
+    for suffixe in SUFFIXES:
+        if mot.endswith(suffixe) and len(mot) - len(suffixe) >= 3:
+            return mot[:-len(suffixe)]
+    if mot.endswith('aux') and len(mot) > 4:
+        return mot[:-3] + 'al'
+    if mot[-1] in 'sx':
+        mot = mot[:-1]
+    if mot.endswith('e') and len(mot) > 4:
+        mot = mot[:-1]
+    return mot
+
+
+def mots(texte):
+    """Découpe un texte en mots normalisés (sans accents), mots vides compris."""
+    if not texte:
+        return []
+    return RE_MOT.findall(replier_accents(texte))
+
+
+def analyser(texte):
+    """
+    Transforme un texte en liste de termes indexables : mots normalisés,
+    sans mots vides, racinisés et tronqués à LONGUEUR_MAX_TERME.
+    """
+    return [
+        raciniser(mot)[:LONGUEUR_MAX_TERME]
+        for mot in mots(texte)
+        if mot not in MOTS_VIDES
+    ]
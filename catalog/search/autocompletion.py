@@ -0,0 +1,319 @@
+"""
+Autocomplétion de la recherche du catalogue.
+
+Index en mémoire des noms de produits et de catégories, sous forme d'un
+tableau trié de clés : chaque nom donne une clé par début de mot (« Casque
+sans fil » donne « casque sans fil », « sans fil » et « fil »). Les clés
+commençant par un préfixe forment une tranche contiguë du tableau, trouvée
+par dichotomie, si bien qu'une frappe ne touche jamais la base.
+
+Les suggestions sont classées par popularité : meilleures ventes d'abord,
+puis nombre de commandes. Le classement de chaque préfixe demandé est gardé
+en cache (les plus anciens sont évincés) et tenu à jour entrée par entrée ;
+ceux des préfixes d'un ou deux caractères, les plus coûteux, sont calculés
+dès la construction.
+"""
+import bisect
+import heapq
+import threading
+from collections import namedtuple
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import Count
+from django.urls import reverse
+
+from .analyse import RE_MOT, replier_accents
+from .memoire import IndexCatalogueMemoire
+
+Suggestion = namedtuple('Suggestion', ['cle', 'id', 'type', 'nom', 'slug', 'meilleure_vente', 'textes'])
+
+# Longueur des préfixes dont le classement est calculé dès la construction
+LONGUEUR_PREFIXES_PRECALCULES = 2
+
+# Au-delà de ce nombre de clés pour un préfixe, les produits sont parcourus
+# par popularité décroissante plutôt que classés
+SEUIL_PARCOURS = 2000
+
+
+def normaliser(texte):
+    """« Écran  27\" » devient « ecran 27 »."""
+    return ' '.join(RE_MOT.findall(replier_accents(texte)))
+
+
+def textes_nom(nom):
+    """Une clé par début de mot du nom."""
+    mots = normaliser(nom).split()
+    return tuple(' '.join(mots[i:]) for i in range(len(mots)))
+
+
+def retirer_trie(liste, element):
+    """Retire `element` d'une liste triée, s'il y est."""
+    position = bisect.bisect_left(liste, element)
+    if position < len(liste) and liste[position] == element:
+        del liste[position]
+
+
+class IndexAutocompletion(IndexCatalogueMemoire):
+    """Tableau trié des débuts de mots des noms de produits et de catégories."""
+    PRODUIT_CHAMPS = IndexCatalogueMemoire.PRODUIT_CHAMPS + ('est_meilleur_vente',)
+
+    def __init__(self):
+        self.max_suggestions = getattr(settings, 'CATALOG_AUTOCOMPLETE_MAX_SUGGESTIONS', 8)
+        self.taille_cache = getattr(settings, 'CATALOG_AUTOCOMPLETE_TAILLE_CACHE', 10000)
+        super().__init__()
+
+    def vider(self):
+        super().vider()
+        self.suggestions = {}
+        # Par type d'entrée : couples (clé de texte, clé de l'entrée), triés
+        self.cles = {'categorie': [], 'produit': []}
+        # Nombre de commandes par produit
+        self.ventes = {}
+        # Clé de tri de chaque entrée (voir calculer_rang)
+        self.rangs = {}
+        # Couples (rang, clé) des produits, triés
+        self.par_popularite = []
+        # Suggestions déjà mises en forme pour la réponse JSON
+        self._serialisees = {}
+        # Préfixe -> entrées classées (catégories, produits)
+        self._cache = {}
+
+    # Construction et mises à jour
+
+    def construire(self):
+        from orders.models import LigneCommande
+
+        with self.verrou:
+            super().construire()
+            self.ventes = self.compter_ventes(LigneCommande)
+            self.rangs = {cle: self.calculer_rang(suggestion) for cle, suggestion in self.suggestions.items()}
+            # Un seul tri plutôt qu'une insertion par entrée
+            for cles in self.cles.values():
+                cles.sort()
+            self.par_popularite = sorted(
+                (rang, cle) for cle, rang in self.rangs.items() if cle[0] == 'produit'
+            )
+            self._cache.clear()
+            prefixes = {
+                texte[:longueur]
+                for suggestion in self.suggestions.values()
+                for texte in suggestion.textes
+                for longueur in range(1, LONGUEUR_PREFIXES_PRECALCULES + 1)
+            }
+            for prefixe in prefixes:
+                self.classement(prefixe)
+
+    def compter_ventes(self, modele_ligne):
+        return dict(
+            modele_ligne.objects.values_list('produit_id')
+            .annotate(nombre=Count('commande', distinct=True)).order_by()
+        )
+
+    def synchroniser(self):
+        from orders.models import LigneCommande
+
+        super().synchroniser()
+        ventes = self.compter_ventes(LigneCommande)
+        with self.verrou:
+            for produit_id in set(ventes) | set(self.ventes):
+                avant, apres = self.ventes.get(produit_id, 0), ventes.get(produit_id, 0)
+                if apres != avant:
+                    self.ventes[produit_id] = apres
+                    self._ventes_modifiees(produit_id, ameliore=apres > avant)
+
+    def _actualiser_caches(self, cle, textes, present, ameliore=False):
+        """
+        Répercute la modification d'une entrée sur les classements en cache
+        des préfixes de `textes`, sans les recalculer quand c'est possible :
+        une entrée absente d'un classement n'y entre que si elle dépasse la
+        dernière. Un classement dont l'entrée fait partie n'est recalculé que
+        si elle a pu y perdre sa place (retrait, recul).
+        """
+        if not self._cache:
+            return
+        position = 0 if cle[0] == 'categorie' else 1
+        prefixes = {texte[:longueur] for texte in textes for longueur in range(1, len(texte) + 1)}
+        for prefixe in prefixes:
+            resultat = self._cache.get(prefixe)
+            if resultat is None:
+                continue
+            classes = resultat[position]
+            if cle in classes:
+                if not (present and ameliore):
+                    del self._cache[prefixe]
+                    continue
+                classes = sorted(classes, key=self.rang)
+            elif present and (len(classes) < self.max_suggestions or self.rang(cle) < self.rang(classes[-1])):
+                classes = sorted(classes + [cle], key=self.rang)[:self.max_suggestions]
+            else:
+                continue
+            self._cache[prefixe] = (classes, resultat[1]) if position == 0 else (resultat[0], classes)
+
+    def _placer(self, suggestion):
+        with self.verrou:
+            self._enlever(suggestion.cle)
+            self.suggestions[suggestion.cle] = suggestion
+            self.rangs[suggestion.cle] = self.calculer_rang(suggestion)
+            if self.pret:
+                for texte in suggestion.textes:
+                    bisect.insort(self.cles[suggestion.type], (texte, suggestion.cle))
+                if suggestion.type == 'produit':
+                    bisect.insort(self.par_popularite, (self.rangs[suggestion.cle], suggestion.cle))
+            else:
+                # Construction : les tableaux sont remplis et triés à la fin
+                self.cles[suggestion.type].extend((texte, suggestion.cle) for texte in suggestion.textes)
+            self._actualiser_caches(suggestion.cle, suggestion.textes, present=True)
+
+    def _enlever(self, cle):
+        with self.verrou:
+            suggestion = self.suggestions.get(cle)
+            if suggestion is None:
+                return
+            self._actualiser_caches(cle, suggestion.textes, present=False)
+            del self.suggestions[cle]
+            self._serialisees.pop(cle, None)
+            for texte in suggestion.textes:
+                retirer_trie(self.cles[suggestion.type], (texte, cle))
+            if suggestion.type == 'produit':
+                retirer_trie(self.par_popularite, (self.rangs[cle], cle))
+            del self.rangs[cle]
+
+    def placer_produit(self, valeurs):
+        cle = ('produit', valeurs['id'])
+        if not valeurs['est_actif']:
+            self._enlever(cle)
+            return
+        self._placer(Suggestion(
+            cle=cle,
+            id=valeurs['id'],
+            type='produit',
+            nom=valeurs['nom'],
+            slug=valeurs['slug'],
+            meilleure_vente=valeurs['est_meilleur_vente'],
+            textes=textes_nom(valeurs['nom']),
+        ))
+
+    def placer_categorie(self, valeurs):
+        cle = ('categorie', valeurs['id'])
+        if not valeurs['est_active']:
+            self._enlever(cle)
+            return
+        self._placer(Suggestion(
+            cle=cle,
+            id=valeurs['id'],
+            type='categorie',
+            nom=valeurs['nom'],
+            slug=valeurs['slug'],
+            meilleure_vente=False,
+            textes=textes_nom(valeurs['nom']),
+        ))
+
+    def retirer_produit(self, produit_id):
+        self._enlever(('produit', produit_id))
+
+    def retirer_categorie(self, categorie_id):
+        self._enlever(('categorie', categorie_id))
+
+    def ids_indexes(self, type_entree):
+        return [cle[1] for cle in self.suggestions if cle[0] == type_entree]
+
+    def vente_enregistree(self, produit_id):
+        """Une commande de plus pour le produit (appelé par les signaux, après validation)."""
+        with self.verrou:
+            self.ventes[produit_id] = self.ventes.get(produit_id, 0) + 1
+            self._ventes_modifiees(produit_id, ameliore=True)
+
+    def _ventes_modifiees(self, produit_id, ameliore):
+        cle = ('produit', produit_id)
+        suggestion = self.suggestions.get(cle)
+        if suggestion is not None:
+            retirer_trie(self.par_popularite, (self.rangs[cle], cle))
+            self.rangs[cle] = self.calculer_rang(suggestion)
+            bisect.insort(self.par_popularite, (self.rangs[cle], cle))
+            self._actualiser_caches(cle, suggestion.textes, present=True, ameliore=ameliore)
+
+    # Suggestions
+
+    def calculer_rang(self, suggestion):
+        """Clé de tri : meilleures ventes, puis les plus commandés, puis les plus récents."""
+        ventes = self.ventes.get(suggestion.id, 0) if suggestion.type == 'produit' else 0
+        return (not suggestion.meilleure_vente, -ventes, -suggestion.id)
+
+    def rang(self, cle):
+        return self.rangs[cle]
+
+    def classement(self, prefixe):
+        """Entrées commençant par `prefixe`, classées : (catégories, produits)."""
+        resultat = self._cache.pop(prefixe, None)
+        if resultat is not None:
+            # Remis en fin de dictionnaire : les préfixes les moins demandés sont évincés en premier
+            self._cache[prefixe] = resultat
+            return resultat
+        resultat = (self._classer('categorie', prefixe), self._classer('produit', prefixe))
+        if len(self._cache) >= self.taille_cache:
+            del self._cache[next(iter(self._cache))]
+        self._cache[prefixe] = resultat
+        return resultat
+
+    def _classer(self, type_entree, prefixe):
+        cles = self.cles[type_entree]
+        debut = bisect.bisect_left(cles, (prefixe,))
+        fin = bisect.bisect_left(cles, (prefixe + '\uffff',), debut)
+        if type_entree == 'produit' and fin - debut > SEUIL_PARCOURS:
+            # Préfixe fréquent : en parcourant les produits du plus populaire au
+            # moins populaire, les premiers qui correspondent arrivent vite
+            classes = []
+            for _, cle in self.par_popularite:
+                if any(texte.startswith(prefixe) for texte in self.suggestions[cle].textes):
+                    classes.append(cle)
+                    if len(classes) == self.max_suggestions:
+                        break
+            return classes
+        trouvees = set(map(itemgetter(1), cles[debut:fin]))
+        return heapq.nsmallest(self.max_suggestions, trouvees, key=self.rangs.__getitem__)
+
+    def suggerer(self, saisie, limite=None):
+        """
+        Suggestions pour le texte saisi.
+
+        Returns:
+            dict: 'categories' et 'produits', listes de dictionnaires
+                  (id, nom, url) classés par popularité
+        """
+        limite = min(limite or self.max_suggestions, self.max_suggestions)
+        prefixe = normaliser(saisie)
+        if not prefixe:
+            return {'categories': [], 'produits': []}
+        self.preparer()
+        with self.verrou:
+            categories, produits = self.classement(prefixe)
+            return {
+                'categories': [self.serialiser(cle) for cle in categories[:3]],
+                'produits': [self.serialiser(cle) for cle in produits[:limite]],
+            }
+
+    def serialiser(self, cle):
+        resultat = self._serialisees.get(cle)
+        if resultat is None:
+            suggestion = self.suggestions[cle]
+            if suggestion.type == 'produit':
+                url = reverse('catalog:detail_produit', kwargs={'slug': suggestion.slug})
+            else:
+                url = reverse('catalog:produits_par_categorie', kwargs={'categorie_slug': suggestion.slug})
+            resultat = self._serialisees[cle] = {'id': suggestion.id, 'nom': suggestion.nom, 'url': url}
+        return resultat
+
+
+_index = None
+_verrou_index = threading.Lock()
+
+
+def get_index_autocompletion():
+    """Retourne l'index d'autocomplétion du processus, créé (mais pas encore chargé) au premier appel."""
+    global _index
+    if _index is None:
+        with _verrou_index:
+            if _index is None:
+                _index = IndexAutocompletion()
+    return _index
@@ -0,0 +1,349 @@
+"""
+Moteurs de recherche du catalogue.
+
+Le moteur actif est choisi par le paramètre CATALOG_SEARCH_BACKEND
+(voir catalog.search.get_search_backend). Tous les moteurs exposent la même
+interface : rechercher() renvoie les produits trouvés (QuerySet ou
+ResultatsRecherche), et les méthodes d'indexation sont appelées par les
+signaux du catalogue.
+"""
+import functools
+import math
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Avg, Case, Count, Exists, ExpressionWrapper, F, FloatField, OuterRef, Q, Sum, Value, When,
+)
+
+from catalog.models import DocumentRecherche, Produit, TermeRecherche
+from .analyse import analyser
+
+
+class ResultatsRecherche:
+    """
+    Résultats classés par pertinence.
+
+    La liste ordonnée des identifiants est calculée une fois ; seuls les
+    produits de la tranche demandée (la page affichée) sont chargés, avec
+    les select_related/prefetch_related du QuerySet d'origine. L'objet se
+    comporte comme une séquence, ce qui suffit au Paginator de Django.
+
+    Le classement peut être limité aux meilleurs résultats ; order_by()
+    renvoie pour les tris explicites un QuerySet classique sur toutes les
+    correspondances (`correspondances()`, sous-requête d'identifiants
+    calculée à la demande, par défaut les identifiants classés).
+    """
+
+    def __init__(self, ids, queryset, correspondances=None):
+        self.ids = ids
+        self.queryset = queryset
+        self.model = queryset.model
+        self.correspondances = correspondances
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __bool__(self):
+        return bool(self.ids)
+
+    def count(self):
+        return len(self.ids)
+
+    def exists(self):
+        return bool(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1 or None][0]
+        ids = self.ids[index]
+        produits = self.queryset.in_bulk(ids)
+        return [produits[pk] for pk in ids if pk in produits]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def order_by(self, *champs):
+        correspondances = self.ids if self.correspondances is None else self.correspondances()
+        return self.queryset.filter(pk__in=correspondances).order_by(*champs)
+
+
+class BaseSearchBackend:
+    """Interface commune des moteurs de recherche."""
+
+    def rechercher(self, requete, queryset=None):
+        """
+        Retourne les produits de `queryset` correspondant à `requete`,
+        triés par pertinence quand le moteur sait la calculer.
+        """
+        raise NotImplementedError
+
+    def indexer(self, produit_ids):
+        """Met à jour l'index pour les produits donnés."""
+
+    def desindexer(self, produit_ids):
+        """Retire les produits donnés de l'index."""
+
+    def reindexer(self, taille_lot=500):
+        """Reconstruit l'index complet. Retourne le nombre de produits indexés."""
+        return 0
+
+
+class IcontainsBackend(BaseSearchBackend):
+    """
+    Recherche historique par sous-chaîne (LIKE '%...%').
+    Ne nécessite pas d'index mais parcourt toute la table à chaque requête.
+    """
+
+    def rechercher(self, requete, queryset=None):
+        if queryset is None:
+            queryset = Produit.objects.all()
+        return queryset.filter(
+            Q(nom__icontains=requete) |
+            Q(description__icontains=requete) |
+            Q(categorie__nom__icontains=requete)
+        )
+
+
+class IndexInverseBackend(BaseSearchBackend):
+    """
+    Recherche plein texte sur un index inversé stocké en base (TermeRecherche),
+    avec classement BM25.
+
+    Les champs sont pondérés en répétant leurs termes : un mot du nom compte
+    plus qu'un mot de la description. La partie du score BM25 qui ne dépend
+    que du document (l'« impact ») est précalculée à l'indexation, si bien
+    qu'une recherche se résume à une somme groupée en SQL. Un produit doit
+    contenir tous les termes de la requête ; si aucun n'y parvient, on se
+    replie sur les produits qui en contiennent au moins un.
+
+    Pour les termes très fréquents, seules les `taille_champions` entrées de
+    plus fort impact sont d'abord considérées (« listes de champions ») : les
+    meilleurs résultats s'y trouvent presque toujours. Le calcul exact n'est
+    refait que si cette première passe donne moins de `min_resultats` produits.
+
+    Seul le classement par pertinence est limité à `max_resultats` produits :
+    les tris explicites portent sur toutes les correspondances.
+    """
+    k1 = 1.2
+    b = 0.75
+    # En dessous (moins d'une page de résultats), la passe sur les listes de
+    # champions est refaite en exact
+    min_resultats = 12
+
+    # Poids de chaque champ dans la fréquence des termes
+    POIDS_CHAMPS = {
+        'nom': 3,
+        'categorie': 2,
+        'resume': 2,
+        'caracteristiques': 1,
+        'description': 1,
+    }
+
+    def __init__(self):
+        self.max_resultats = getattr(settings, 'CATALOG_SEARCH_MAX_RESULTATS', 500)
+        self.taille_champions = getattr(settings, 'CATALOG_SEARCH_TAILLE_CHAMPIONS', 2000)
+
+    # Indexation
+
+    def textes_produit(self, produit):
+        """Retourne les textes indexés d'un produit, par champ."""
+        return {
+            'nom': produit.nom,
+            'categorie': produit.categorie.nom if produit.categorie else '',
+            'resume': produit.resume,
+            'caracteristiques': ' '.join(c.valeur for c in produit.caracteristiques.all()),
+            'description': produit.description,
+        }
+
+    def analyser_produit(self, produit):
+        """Retourne (poids par terme, longueur pondérée) pour un produit."""
+        poids = Counter()
+        for champ, texte in self.textes_produit(produit).items():
+            for terme in analyser(texte):
+                poids[terme] += self.POIDS_CHAMPS[champ]
+        return poids, sum(poids.values())
+
+    def impact(self, poids, longueur, longueur_moyenne):
+        """Part BM25 d'un terme dans un document, hors IDF."""
+        normalisation = self.k1 * (1 - self.b + self.b * longueur / longueur_moyenne)
+        return poids * (self.k1 + 1) / (poids + normalisation)
+
+    def longueur_moyenne(self):
+        return DocumentRecherche.objects.aggregate(moyenne=Avg('longueur'))['moyenne'] or 1
+
+    def _entrees(self, produits, longueur_moyenne):
+        documents, termes = [], []
+        for produit in produits:
+            poids, longueur = self.analyser_produit(produit)
+            documents.append(DocumentRecherche(produit_id=produit.id, longueur=longueur))
+            termes.extend(
+                TermeRecherche(
+                    terme=terme,
+                    produit_id=produit.id,
+                    poids=valeur,
+                    longueur_document=longueur,
+                    impact=self.impact(valeur, longueur, longueur_moyenne),
+                )
+                for terme, valeur in poids.items()
+            )
+        return documents, termes
+
+    def _produits_a_indexer(self):
+        return Produit.objects.select_related('categorie').prefetch_related('caracteristiques')
+
+    def indexer(self, produit_ids):
+        produit_ids = list(produit_ids)
+        produits = list(self._produits_a_indexer().filter(pk__in=produit_ids))
+        documents, termes = self._entrees(produits, self.longueur_moyenne())
+        with transaction.atomic():
+            self.desindexer(produit_ids)
+            DocumentRecherche.objects.bulk_create(documents)
+            TermeRecherche.objects.bulk_create(termes, batch_size=1000)
+
+    def desindexer(self, produit_ids):
+        produit_ids = list(produit_ids)
+        TermeRecherche.objects.filter(produit_id__in=produit_ids).delete()
+        DocumentRecherche.objects.filter(produit_id__in=produit_ids).delete()
+
+    def reindexer(self, taille_lot=500):
+        total = 0
+        with transaction.atomic():
+            TermeRecherche.objects.all().delete()
+            DocumentRecherche.objects.all().delete()
+            lot = []
+            for produit in self._produits_a_indexer().order_by('pk').iterator(chunk_size=taille_lot):
+                lot.append(produit)
+                if len(lot) >= taille_lot:
+                    total += self._inserer_lot(lot)
+                    lot = []
+            if lot:
+                total += self._inserer_lot(lot)
+            self.recalculer_impacts()
+        return total
+
+    def _inserer_lot(self, produits):
+        # Les impacts sont provisoires : la longueur moyenne n'est connue qu'à la fin
+        documents, termes = self._entrees(produits, 1)
+        DocumentRecherche.objects.bulk_create(documents)
+        TermeRecherche.objects.bulk_create(termes, batch_size=1000)
+        return len(documents)
+
+    def recalculer_impacts(self):
+        """
+        Recalcule tous les impacts avec la longueur moyenne actuelle, en une requête.
+        Utile après une reconstruction ou quand le catalogue a beaucoup changé.
+        """
+        normalisation = self.k1 * (1 - self.b + self.b * F('longueur_document') / self.longueur_moyenne())
+        TermeRecherche.objects.update(
+            impact=ExpressionWrapper(
+                F('poids') * (self.k1 + 1) / (F('poids') + normalisation),
+                output_field=FloatField(),
+            )
+        )
+
+    # Recherche
+
+    def scores(self, requete, queryset=None):
+        """
+        Calcule le score BM25 des produits correspondant à la requête.
+
+        Returns:
+            list: Couples (produit_id, score) triés par score décroissant,
+                  au plus max_resultats
+        """
+        termes = sorted(set(analyser(requete)))
+        if not termes:
+            return []
+
+        nombre_documents = DocumentRecherche.objects.count()
+        frequences_documents = dict(
+            TermeRecherche.objects.filter(terme__in=termes)
+            .values_list('terme').annotate(nombre=Count('pk')).order_by()
+        )
+        if not nombre_documents or not frequences_documents:
+            return []
+
+        idf = Case(
+            *[
+                When(terme=terme, then=Value(math.log(1 + (nombre_documents - df + 0.5) / (df + 0.5))))
+                for terme, df in frequences_documents.items()
+            ],
+            output_field=FloatField(),
+        )
+        entrees = TermeRecherche.objects.all()
+        if queryset is not None:
+            # Sous-requête corrélée : vérifiée par clé primaire pour chaque entrée,
+            # sans matérialiser la liste des produits de `queryset`
+            entrees = entrees.filter(Exists(queryset.order_by().filter(pk=OuterRef('produit_id'))))
+        entrees = entrees.values('produit_id').annotate(
+            score=Sum(F('impact') * idf), nombre_termes=Count('pk')
+        ).order_by('-score', 'produit_id')
+        tous_presents = len(frequences_documents) == len(termes)
+
+        seuils = {
+            terme: self.seuil_champions(terme)
+            for terme, df in frequences_documents.items() if df > self.taille_champions
+        }
+        if seuils:
+            champions = entrees.filter(self._filtre_champions(frequences_documents, seuils))
+            if tous_presents:
+                champions = champions.filter(nombre_termes=len(termes))
+            champions = list(champions.values_list('produit_id', 'score')[:self.max_resultats])
+            if len(champions) >= self.min_resultats:
+                return champions
+
+        resultats = entrees.filter(terme__in=list(frequences_documents))
+        # Tous les termes d'abord ; à défaut, au moins un
+        if tous_presents:
+            complets = list(resultats.filter(nombre_termes=len(termes)).values_list(
+                'produit_id', 'score')[:self.max_resultats])
+            if complets:
+                return complets
+        return list(resultats.values_list('produit_id', 'score')[:self.max_resultats])
+
+    def correspondances(self, requete, queryset=None):
+        """
+        Tous les produits correspondant à la requête, sans classement ni
+        limite : ceux qui contiennent tous les termes, à défaut ceux qui en
+        contiennent au moins un (comme scores()).
+
+        Returns:
+            QuerySet: Identifiants des produits (`produit_id`), pour un filtre pk__in
+        """
+        termes = sorted(set(analyser(requete)))
+        entrees = TermeRecherche.objects.filter(terme__in=termes)
+        if queryset is not None:
+            entrees = entrees.filter(Exists(queryset.order_by().filter(pk=OuterRef('produit_id'))))
+        groupes = entrees.values('produit_id').annotate(nombre_termes=Count('pk')).order_by()
+        complets = groupes.filter(nombre_termes=len(termes))
+        if complets.exists():
+            return complets.values('produit_id')
+        return groupes.values('produit_id')
+
+    def seuil_champions(self, terme):
+        """Impact de la `taille_champions`-ième entrée la plus forte du terme."""
+        return (
+            TermeRecherche.objects.filter(terme=terme)
+            .order_by('-impact').values_list('impact', flat=True)[self.taille_champions - 1]
+        )
+
+    def _filtre_champions(self, frequences_documents, seuils):
+        filtre = Q()
+        for terme in frequences_documents:
+            if terme in seuils:
+                filtre |= Q(terme=terme, impact__gte=seuils[terme])
+            else:
+                filtre |= Q(terme=terme)
+        return filtre
+
+    def rechercher(self, requete, queryset=None):
+        if queryset is None:
+            queryset = Produit.objects.all()
+        ids = [produit_id for produit_id, _ in self.scores(requete, queryset)]
+        correspondances = None
+        if len(ids) >= self.max_resultats:
+            # Classement tronqué : les tris explicites relisent toutes les correspondances
+            correspondances = functools.partial(self.correspondances, requete, queryset)
+        return ResultatsRecherche(ids, queryset, correspondances)
@@ -0,0 +1,198 @@
+"""
+Base des index de recherche tenus en mémoire par chaque processus
+(un par worker gunicorn).
+
+L'index est construit à la première utilisation (ou au démarrage du worker,
+voir gunicorn_config.post_worker_init), tenu à jour par les signaux dans le
+processus qui enregistre les modifications, et resynchronisé en arrière-plan
+pour les modifications faites par les autres processus.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class IndexMemoire:
+    """
+    Index en mémoire, construit à la demande et resynchronisé par lots.
+
+    Les sous-classes implémentent construire(), qui reconstruit tout l'état,
+    et synchroniser(), qui applique les changements survenus depuis la
+    dernière synchronisation. Toutes les lectures et écritures de l'état se
+    font sous self.verrou.
+    """
+    # Délai (en secondes) entre deux resynchronisations avec la base
+    intervalle_synchro = getattr(settings, 'INDEX_MEMOIRE_INTERVALLE_SYNCHRO', 30)
+
+    def __init__(self):
+        self.verrou = threading.RLock()
+        self._synchro_en_cours = threading.Lock()
+        self.pret = False
+        self.derniere_synchro = 0.0
+
+    def construire(self):
+        """Reconstruit entièrement l'index depuis la base."""
+        raise NotImplementedError
+
+    def synchroniser(self):
+        """Applique les modifications faites en base depuis la dernière synchronisation."""
+        raise NotImplementedError
+
+    def charger(self):
+        """Construit l'index s'il ne l'est pas encore. Sans effet sinon."""
+        if self.pret:
+            return
+        with self.verrou:
+            if not self.pret:
+                debut = time.perf_counter()
+                self.construire()
+                self.pret = True
+                self.derniere_synchro = time.monotonic()
+                logger.info(
+                    "%s construit en %.0f ms", type(self).__name__, (time.perf_counter() - debut) * 1000
+                )
+
+    def preparer(self):
+        """
+        À appeler avant chaque lecture : construit l'index au premier appel,
+        puis lance une resynchronisation en arrière-plan quand elle est due.
+        """
+        if not self.pret:
+            self.charger()
+        elif time.monotonic() - self.derniere_synchro > self.intervalle_synchro:
+            self.synchroniser_en_arriere_plan()
+
+    def synchroniser_en_arriere_plan(self):
+        if not self._synchro_en_cours.acquire(blocking=False):
+            return
+        self.derniere_synchro = time.monotonic()
+        threading.Thread(target=self._synchroniser, daemon=True).start()
+
+    def _synchroniser(self):
+        try:
+            self.synchroniser()
+        except Exception:
+            logger.exception("Échec de la synchronisation de %s", type(self).__name__)
+        finally:
+            # Connexion propre à ce fil, qui se termine : fermée, pas seulement recyclée
+            connection.close()
+            self._synchro_en_cours.release()
+
+
+class IndexCatalogueMemoire(IndexMemoire):
+    """
+    Index en mémoire construit à partir des produits actifs et des catégories
+    actives.
+
+    Les sous-classes implémentent placer_produit()/placer_categorie() (qui
+    reçoivent un dictionnaire des colonnes PRODUIT_CHAMPS/CATEGORIE_CHAMPS et
+    retirent l'entrée si elle est inactive), retirer_produit()/
+    retirer_categorie() et ids_indexes(). La synchronisation repose sur
+    date_mise_a_jour pour les modifications (une désactivation en est une) ;
+    les identifiants ne sont réconciliés, pour les suppressions, que si le
+    nombre de produits actifs ne correspond plus à celui de l'index.
+    """
+    PRODUIT_CHAMPS = ('id', 'nom', 'slug', 'categorie_id', 'est_actif', 'date_mise_a_jour')
+    CATEGORIE_CHAMPS = ('id', 'nom', 'slug', 'est_active', 'date_mise_a_jour')
+
+    def __init__(self):
+        super().__init__()
+        self.vider()
+
+    def vider(self):
+        self.horodatage = None
+
+    def placer_produit(self, valeurs):
+        raise NotImplementedError
+
+    def placer_categorie(self, valeurs):
+        raise NotImplementedError
+
+    def retirer_produit(self, produit_id):
+        raise NotImplementedError
+
+    def retirer_categorie(self, categorie_id):
+        raise NotImplementedError
+
+    def ids_indexes(self, type_entree):
+        """Identifiants des produits ('produit') ou catégories ('categorie') présents dans l'index."""
+        raise NotImplementedError
+
+    def _noter_horodatage(self, valeurs):
+        if self.horodatage is None or valeurs['date_mise_a_jour'] > self.horodatage:
+            self.horodatage = valeurs['date_mise_a_jour']
+
+    def construire(self):
+        from catalog.models import Categorie, Produit
+
+        with self.verrou:
+            self.vider()
+            for valeurs in Categorie.objects.filter(est_active=True).values(*self.CATEGORIE_CHAMPS):
+                self.placer_categorie(valeurs)
+            produits = Produit.objects.filter(est_actif=True).values(*self.PRODUIT_CHAMPS)
+            for valeurs in produits.iterator(chunk_size=5000):
+                self.placer_produit(valeurs)
+                self._noter_horodatage(valeurs)
+
+    def synchroniser(self):
+        """
+        Rattrape les modifications faites par les autres workers : produits
+        modifiés (ou désactivés) depuis le dernier horodatage connu, puis,
+        si des produits ont été supprimés, retrait de ceux qui ne sont plus
+        actifs. Le compte des produits actifs (une requête d'agrégat) évite
+        de relire tous les identifiants à chaque synchronisation.
+        """
+        from catalog.models import Categorie, Produit
+
+        categories = list(Categorie.objects.values(*self.CATEGORIE_CHAMPS))
+        produits = Produit.objects.all()
+        if self.horodatage is not None:
+            # Borne incluse : une modification du même instant est rejouée sans risque
+            produits = produits.filter(date_mise_a_jour__gte=self.horodatage)
+        modifies = list(produits.values(*self.PRODUIT_CHAMPS))
+        nombre_actifs = Produit.objects.filter(est_actif=True).count()
+
+        with self.verrou:
+            for valeurs in categories:
+                self.placer_categorie(valeurs)
+            connues = {valeurs['id'] for valeurs in categories}
+            for categorie_id in set(self.ids_indexes('categorie')) - connues:
+                self.retirer_categorie(categorie_id)
+
+            for valeurs in modifies:
+                self.placer_produit(valeurs)
+                self._noter_horodatage(valeurs)
+            indexes = set(self.ids_indexes('produit'))
+
+        if len(indexes) != nombre_actifs:
+            actifs = set(Produit.objects.filter(est_actif=True).values_list('id', flat=True))
+            with self.verrou:
+                for produit_id in set(self.ids_indexes('produit')) - actifs:
+                    self.retirer_produit(produit_id)
+
+    # Mises à jour depuis les signaux du processus courant
+
+    def produit_enregistre(self, produit):
+        if self.pret:
+            valeurs = {champ: getattr(produit, champ) for champ in self.PRODUIT_CHAMPS}
+            transaction.on_commit(lambda: self.placer_produit(valeurs))
+
+    def produit_supprime(self, produit):
+        if self.pret:
+            produit_id = produit.pk
+            transaction.on_commit(lambda: self.retirer_produit(produit_id))
+
+    def categorie_enregistree(self, categorie):
+        if self.pret:
+            valeurs = {champ: getattr(categorie, champ) for champ in self.CATEGORIE_CHAMPS}
+            transaction.on_commit(lambda: self.placer_categorie(valeurs))
+
+    def categorie_supprimee(self, categorie):
+        if self.pret:
+            categorie_id = categorie.pk
+            transaction.on_commit(lambda: self.retirer_categorie(categorie_id))
@@ -0,0 +1,197 @@
+from django.db import transaction
+from django.utils import timezone
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from orders.signals import commande_passee
+from . import cache as cache_catalogue, stock
+from .models import Produit, Categorie, AvisProduit, CaracteristiqueProduit, ImageCategorie, ImageProduit
+from .search import get_search_backend
+from .search.autocompletion import get_index_autocompletion
+
+# Envoyé par DetailProduitView quand une fiche produit est affichée (y compris
+# par une réponse 304). Arguments : request, produit_id, categorie_id.
+produit_consulte = Signal()
+
+# Champs de Produit pris en compte par l'index de recherche
+CHAMPS_INDEXES = {'nom', 'resume', 'description', 'categorie', 'categorie_id'}
+
+
+@receiver(post_save, sender=AvisProduit)
+@receiver(post_delete, sender=AvisProduit)
+def mettre_a_jour_notes_produit(sender, instance, **kwargs):
+    """Met à jour la synthèse des notes du produit quand un avis change."""
+    if kwargs.get('raw'):
+        return
+    instance.produit.mettre_a_jour_notes()
+
+
+def indexer_apres_commit(produit_ids):
+    """Réindexe les produits une fois la transaction en cours validée."""
+    if produit_ids:
+        transaction.on_commit(lambda: get_search_backend().indexer(produit_ids))
+
+
+@receiver(post_save, sender=Produit)
+def indexer_produit(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Met à jour l'index de recherche quand un champ indexé du produit change."""
+    if raw:
+        return
+    if update_fields is not None and not CHAMPS_INDEXES.intersection(update_fields):
+        return
+    indexer_apres_commit([instance.pk])
+
+
+@receiver(post_save, sender=CaracteristiqueProduit)
+@receiver(post_delete, sender=CaracteristiqueProduit)
+def indexer_caracteristique(sender, instance, **kwargs):
+    """Les valeurs des caractéristiques sont indexées avec le produit."""
+    if kwargs.get('raw'):
+        return
+    indexer_apres_commit([instance.produit_id])
+
+
+@receiver(post_save, sender=Categorie)
+def indexer_categorie(sender, instance, raw=False, **kwargs):
+    """Le nom de la catégorie est indexé avec chacun de ses produits."""
+    if raw:
+        return
+    indexer_apres_commit(list(instance.produits.values_list('pk', flat=True)))
+
+
+@receiver(pre_delete, sender=Categorie)
+def indexer_categorie_supprimee(sender, instance, **kwargs):
+    """
+    Les produits de la catégorie supprimée sont détachés (SET_NULL, par une
+    mise à jour en masse, sans post_save) : ils sont relevés avant la
+    suppression et réindexés sans le nom de la catégorie après validation.
+    """
+    indexer_apres_commit(list(instance.produits.values_list('pk', flat=True)))
+
+
+# Index d'autocomplétion du processus (les autres workers se resynchronisent)
+
+@receiver(post_save, sender=Produit)
+def autocompletion_produit(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_index_autocompletion().produit_enregistre(instance)
+
+
+@receiver(post_delete, sender=Produit)
+def autocompletion_produit_supprime(sender, instance, **kwargs):
+    get_index_autocompletion().produit_supprime(instance)
+
+
+@receiver(post_save, sender=Categorie)
+def autocompletion_categorie(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_index_autocompletion().categorie_enregistree(instance)
+
+
+@receiver(post_delete, sender=Categorie)
+def autocompletion_categorie_supprimee(sender, instance, **kwargs):
+    get_index_autocompletion().categorie_supprimee(instance)
+
+
+@receiver(post_save, sender='orders.LigneCommande')
+def autocompletion_vente(sender, instance, created=False, raw=False, **kwargs):
+    """Une commande de plus fait remonter le produit dans les suggestions."""
+    index = get_index_autocompletion()
+    if created and not raw and index.pret:
+        produit_id = instance.produit_id
+        transaction.on_commit(lambda: index.vente_enregistree(produit_id))
+
+
+@receiver(commande_passee)
+def autocompletion_commande(sender, commande, quantites, **kwargs):
+    """Les lignes d'une commande passée en masse comptent comme les autres (envoyé après validation)."""
+    index = get_index_autocompletion()
+    if index.pret:
+        for produit_id in quantites:
+            index.vente_enregistree(produit_id)
+
+
+@receiver(commande_passee)
+def compacter_stock_commande(sender, commande, quantites, **kwargs):
+    """Les ventes de la commande, écrites dans le journal, seront reportées sur les produits (voir catalog.stock)."""
+    stock.planifier_compaction()
+
+
+@receiver(post_save, sender=ImageProduit)
+@receiver(post_delete, sender=ImageProduit)
+@receiver(post_save, sender=CaracteristiqueProduit)
+@receiver(post_delete, sender=CaracteristiqueProduit)
+def dater_produit(sender, instance, **kwargs):
+    """
+    Images et caractéristiques font partie de la fiche : sa date de mise à
+    jour (Last-Modified et ETag de la fiche, voir DetailProduitView) avance,
+    comme lors d'un enregistrement depuis l'administration.
+    """
+    if kwargs.get('raw'):
+        return
+    Produit.objects.filter(pk=instance.produit_id).update(date_mise_a_jour=timezone.now())
+
+
+# Cache du catalogue : les entrées de l'espace deviennent périmées (voir catalog.cache)
+
+@receiver(post_save, sender=Produit)
+@receiver(post_delete, sender=Produit)
+@receiver(post_save, sender=ImageProduit)
+@receiver(post_delete, sender=ImageProduit)
+@receiver(post_save, sender=AvisProduit)
+@receiver(post_delete, sender=AvisProduit)
+def invalider_cache_produits(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        cache_catalogue.invalider('produits')
+
+
+# Champs de Produit dont dépend l'arbre des catégories (nombre de produits actifs)
+CHAMPS_ARBRE = ('categorie_id', 'est_actif')
+
+
+@receiver(pre_save, sender=Produit)
+def relever_champs_arbre(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Note sur l'instance si sa catégorie ou son activation change (une requête)."""
+    instance._arbre_modifie = False
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not {'categorie', 'categorie_id', 'est_actif'}.intersection(update_fields):
+        return
+    anciens = Produit.objects.filter(pk=instance.pk).values_list(*CHAMPS_ARBRE).first()
+    instance._arbre_modifie = anciens != tuple(getattr(instance, champ) for champ in CHAMPS_ARBRE)
+
+
+@receiver(post_save, sender=Produit)
+def invalider_arbre_produit(sender, instance, created=False, raw=False, **kwargs):
+    """L'arbre des catégories compte les produits actifs de chaque catégorie."""
+    if not raw and (created or getattr(instance, '_arbre_modifie', False)):
+        cache_catalogue.invalider('categories')
+
+
+@receiver(post_delete, sender=Produit)
+def invalider_arbre_produit_supprime(sender, instance, **kwargs):
+    if instance.est_actif:
+        cache_catalogue.invalider('categories')
+
+
+@receiver(commande_passee)
+def invalider_cache_stock(sender, commande, quantites, **kwargs):
+    """
+    Les ventes passent par le journal de stock (voir catalog.stock), sans
+    post_save sur Produit : seules les fiches des produits vendus changent.
+    """
+    cache_catalogue.invalider_produits(quantites)
+
+
+@receiver(post_save, sender=Categorie)
+@receiver(post_delete, sender=Categorie)
+def invalider_cache_categories(sender, instance, **kwargs):
+    """Le nom de la catégorie figure aussi sur les fiches produits."""
+    if not kwargs.get('raw'):
+        cache_catalogue.invalider('categories', 'produits')
+
+
+@receiver(post_save, sender=ImageCategorie)
+@receiver(post_delete, sender=ImageCategorie)
+def invalider_cache_images_categorie(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        cache_catalogue.invalider('categories')
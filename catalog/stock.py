@@ -0,0 +1,217 @@
+"""
+Stock des produits.
+
+Le stock n'est plus modifié en place : chaque vente, annulation,
+réapprovisionnement ou ajustement ajoute une ligne au journal
+(MouvementStock). Produit.quantite (et en_stock) est le stock à la dernière
+compaction ; compacter() y reporte les mouvements en attente. Chaque
+écriture validée la programme (planifier_compaction) au plus
+STOCK_COMPACTION_DELAI secondes plus tard ; la commande compacter_stock
+(cron, ou worker avec --intervalle) la remplace quand ce délai vaut None.
+Le stock réel est donc
+
+    Produit.quantite + somme des mouvements non compactés
+
+lu en une requête par annoter_stock(), servie par l'index partiel des
+mouvements non compactés.
+
+Toute écriture dans le journal verrouille d'abord les produits concernés
+(verrouiller), par identifiant croissant : la vérification du stock et
+l'ajout des mouvements ne peuvent pas être entrelacés avec ceux d'une autre
+transaction, et la compaction ne reporte que des mouvements validés.
+
+Limite : deux commandes du même produit restent sérialisées par ce verrou,
+jusqu'à la fin de la transaction de la première. Le journal supprime la
+réécriture de la ligne produit (et ses versions mortes sous PostgreSQL), pas
+l'attente : le débit sur un produit très demandé est borné par la durée
+d'une transaction de commande. Mesure avec la commande stress_commandes
+(latence par commande, --produits 1 pour un seul produit disputé).
+"""
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import BooleanField, Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from . import cache as cache_catalogue
+from .models import MouvementStock, Produit
+
+logger = logging.getLogger(__name__)
+
+CLE_COMPACTION = 'catalog:stock:compaction'
+
+
+def annoter_stock(queryset):
+    """Ajoute `stock_reel` aux produits : stock compacté plus mouvements en attente."""
+    en_attente = (
+        MouvementStock.objects.filter(produit=OuterRef('pk'), compacte=False)
+        .order_by().values('produit').annotate(total=Sum('quantite')).values('total')
+    )
+    return queryset.annotate(stock_reel=F('quantite') + Coalesce(Subquery(en_attente), Value(0), output_field=IntegerField()))
+
+
+def stock_reel(produit_id):
+    return annoter_stock(Produit.objects.filter(pk=produit_id)).values_list('stock_reel', flat=True).first() or 0
+
+
+def verrouiller(produit_ids):
+    """
+    Verrouille les produits jusqu'à la fin de la transaction, par identifiant
+    croissant (pas d'interblocage entre deux transactions).
+
+    Le stock doit être lu par une requête suivante : sous PostgreSQL, une
+    requête qui attend un verrou calcule ses sous-requêtes sur l'état
+    d'avant l'attente. FOR NO KEY UPDATE (si disponible) laisse passer
+    l'insertion des lignes qui référencent le produit.
+    """
+    no_key = connection.features.has_select_for_no_key_update
+    return list(
+        Produit.objects.select_for_update(no_key=no_key)
+        .filter(pk__in=produit_ids).order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def enregistrer(mouvements, reporter_aussitot=False):
+    """
+    Ajoute les mouvements au journal, produits verrouillés.
+
+    Avec `reporter_aussitot`, ils sont aussi reportés sur les produits dans la
+    même transaction (un UPDATE pour tous, voir reporter) au lieu d'attendre
+    la compaction : pour les entrées en stock (annulations), qu'il n'y a
+    pas lieu de sérialiser avec les ventes.
+    """
+    produit_ids = {mouvement.produit_id for mouvement in mouvements}
+    with transaction.atomic():
+        verrouiller(produit_ids)
+        if reporter_aussitot:
+            ecarts = defaultdict(int)
+            for mouvement in mouvements:
+                mouvement.compacte = True
+                ecarts[mouvement.produit_id] += mouvement.quantite
+            MouvementStock.objects.bulk_create(mouvements)
+            reporter(ecarts)
+            return mouvements
+        MouvementStock.objects.bulk_create(mouvements)
+        transaction.on_commit(planifier_compaction)
+        # Le stock réel affiché par les fiches change ; en_stock, lu par les
+        # listes, ne change qu'à la compaction
+        cache_catalogue.invalider_produits(produit_ids)
+    return mouvements
+
+
+def reapprovisionner(produit, quantite, auteur=None, motif=''):
+    """Entrée de `quantite` exemplaires en stock."""
+    return enregistrer([MouvementStock(
+        produit_id=produit.pk, type_mouvement=MouvementStock.TYPE_REAPPROVISIONNEMENT,
+        quantite=quantite, auteur=auteur, motif=motif,
+    )])[0]
+
+
+def ajuster(produit, quantite, auteur=None, motif=''):
+    """
+    Ramène le stock réel du produit à `quantite` (inventaire, saisie dans
+    l'administration) par un mouvement d'ajustement.
+
+    Returns:
+        MouvementStock: Le mouvement ajouté, ou None si le stock était déjà juste
+    """
+    with transaction.atomic():
+        verrouiller([produit.pk])
+        ecart = quantite - stock_reel(produit.pk)
+        if not ecart:
+            return None
+        mouvement = MouvementStock.objects.create(
+            produit_id=produit.pk, type_mouvement=MouvementStock.TYPE_AJUSTEMENT,
+            quantite=ecart, auteur=auteur, motif=motif,
+        )
+        transaction.on_commit(planifier_compaction)
+        cache_catalogue.invalider_produits([produit.pk])
+    return mouvement
+
+
+def compacter(taille_lot=500):
+    """
+    Reporte les mouvements en attente sur Produit.quantite et en_stock, par
+    lots de `taille_lot` produits (une transaction par lot).
+
+    Returns:
+        int: Nombre de produits mis à jour
+    """
+    total = 0
+    while True:
+        produit_ids = list(
+            MouvementStock.objects.filter(compacte=False).order_by('produit_id')
+            .values_list('produit_id', flat=True).distinct()[:taille_lot]
+        )
+        if not produit_ids:
+            return total
+        with transaction.atomic():
+            # Les transactions qui écrivent encore des mouvements pour ces
+            # produits sont terminées une fois les verrous obtenus
+            verrouiller(produit_ids)
+            a_compacter = MouvementStock.objects.filter(compacte=False, produit_id__in=produit_ids)
+            ecarts = dict(a_compacter.order_by().values_list('produit').annotate(total=Sum('quantite')))
+            if not ecarts:
+                # Lot déjà compacté par un autre processus pendant l'attente des verrous
+                continue
+            reporter(ecarts)
+            a_compacter.update(compacte=True)
+        total += len(ecarts)
+
+
+def reporter(ecarts):
+    """
+    Ajoute à Produit.quantite l'écart de chaque produit ({produit_id: écart})
+    et recalcule en_stock, en un UPDATE. Produits verrouillés par l'appelant.
+    """
+    bascules = [
+        produit_id for produit_id, quantite, en_stock
+        in Produit.objects.filter(pk__in=ecarts).order_by().values_list('pk', 'quantite', 'en_stock')
+        if (quantite + ecarts[produit_id] > 0) != en_stock
+    ]
+    Produit.objects.filter(pk__in=ecarts).update(
+        quantite=F('quantite') + Case(
+            *[When(pk=produit_id, then=Value(ecart)) for produit_id, ecart in ecarts.items()],
+            output_field=IntegerField(),
+        ),
+        # Les expressions de l'UPDATE lisent les valeurs d'avant la mise à jour
+        en_stock=Case(
+            *[When(pk=produit_id, quantite__gt=-ecart, then=Value(True)) for produit_id, ecart in ecarts.items()],
+            default=Value(False),
+            output_field=BooleanField(),
+        ),
+    )
+    # UPDATE sans signaux : le stock réel des fiches est inchangé, mais
+    # leur objet en cache porte quantite et en_stock ; les listes ne
+    # sont périmées que si en_stock a basculé pour un produit
+    cache_catalogue.invalider_produits(ecarts)
+    if bascules:
+        cache_catalogue.invalider('produits')
+
+
+def planifier_compaction():
+    """
+    Programme une compaction dans STOCK_COMPACTION_DELAI secondes, sauf si
+    une autre l'est déjà (verrou dans le cache, partagé par les processus) :
+    quantite et en_stock, lus par les listes, l'administration et les tirages
+    de ai.echantillonnage, ont au plus ce retard sur le journal.
+    """
+    delai = getattr(settings, 'STOCK_COMPACTION_DELAI', 30)
+    if delai is None or not cache.add(CLE_COMPACTION, True, delai):
+        return
+    minuteur = threading.Timer(delai, _compacter_en_arriere_plan)
+    minuteur.daemon = True
+    minuteur.start()
+
+
+def _compacter_en_arriere_plan():
+    try:
+        compacter()
+    except Exception:
+        logger.exception("Échec de la compaction du stock")
+    finally:
+        connection.close()
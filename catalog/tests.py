@@ -1,3 +1,429 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import cache as cache_catalogue, stock
+from .models import Categorie, ImageProduit, Produit
+from .search.autocompletion import IndexAutocompletion
+from .search.backends import IndexInverseBackend
+
+# Sans cache : chaque requête de la vue est comptée
+SANS_CACHE = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+
+
+def creer_catalogue(nombre, categorie, **champs):
+    """Produits actifs de la catégorie, chacun avec deux images."""
+    produits = []
+    for numero in range(nombre):
+        produit = Produit.objects.create(
+            nom=f"Produit {numero}", reference=f"{categorie.slug}-{numero}", prix=Decimal('10.00') + numero,
+            categorie=categorie, quantite=5, **champs,
+        )
+        ImageProduit.objects.create(produit=produit, image=f'produits/{produit.reference}.jpg', est_principale=True)
+        ImageProduit.objects.create(produit=produit, image=f'produits/{produit.reference}-2.jpg', ordre=1)
+        produits.append(produit)
+    return produits
+
+
+@SANS_CACHE
+class RequetesCatalogueTest(TestCase):
+    """
+    Nombre de requêtes des pages du catalogue, indépendant du nombre de
+    produits affichés (pas de requête par produit ou par image).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categorie = Categorie.objects.create(nom="Bureau", slug='bureau')
+        cls.autre = Categorie.objects.create(nom="Cuisine", slug='cuisine')
+        creer_catalogue(6, cls.categorie, est_nouveau=True, est_meilleur_vente=True, prix_promotionnel=Decimal('5.00'))
+
+    def verifier(self, url, requetes):
+        with self.assertNumQueries(requetes):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # Deux fois plus de produits : autant de requêtes
+        creer_catalogue(6, self.autre, est_nouveau=True, est_meilleur_vente=True, prix_promotionnel=Decimal('5.00'))
+        Produit.objects.update(categorie=self.categorie)
+        with self.assertNumQueries(requetes):
+            self.client.get(url)
+
+    def test_accueil(self):
+        self.verifier(reverse('catalog:accueil'), 4)
+
+    # Dont trois pour l'arbre des catégories du menu, reconstruit sans cache
+    def test_liste_produits(self):
+        self.verifier(reverse('catalog:liste_produits'), 6)
+
+    def test_produits_par_categorie(self):
+        self.verifier(reverse('catalog:produits_par_categorie', args=[self.categorie.slug]), 7)
+
+    def test_nouveautes(self):
+        self.verifier(reverse('catalog:nouveautes'), 2)
+
+    def test_promotions(self):
+        self.verifier(reverse('catalog:promotions'), 2)
+
+
+@SANS_CACHE
+class PaginationCurseurTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        categorie = Categorie.objects.create(nom="Bureau", slug='bureau')
+        # Prix égaux deux à deux : l'id départage les produits
+        cls.produits = [
+            Produit.objects.create(
+                nom=f"Produit {numero}", reference=f"P{numero}", prix=Decimal('10.00') + numero // 2,
+                categorie=categorie, quantite=5,
+            )
+            for numero in range(30)
+        ]
+
+    def test_aller_retour(self):
+        url = reverse('catalog:liste_produits')
+        pages = []
+        response = self.client.get(url, {'tri': 'prix-asc'})
+        while True:
+            pages.append([produit.pk for produit in response.context['produits']])
+            suivant = response.context['page_obj'].curseur_suivant
+            if suivant is None:
+                break
+            response = self.client.get(url, {'tri': 'prix-asc', 'curseur': suivant})
+
+        attendus = [produit.pk for produit in sorted(self.produits, key=lambda produit: (produit.prix, produit.pk))]
+        self.assertEqual([pk for page in pages for pk in page], attendus)
+        self.assertEqual([len(page) for page in pages], [12, 12, 6])
+
+        # Retour en arrière depuis la dernière page
+        for attendue in reversed(pages[:-1]):
+            precedent = response.context['page_obj'].curseur_precedent
+            response = self.client.get(url, {'tri': 'prix-asc', 'curseur': precedent})
+            self.assertEqual([produit.pk for produit in response.context['produits']], attendue)
+        self.assertIsNone(response.context['page_obj'].curseur_precedent)
+
+    def test_promotions_modifiees_pendant_le_parcours(self):
+        Produit.objects.filter(pk__in=[produit.pk for produit in self.produits[:20]]).update(prix_promotionnel=Decimal('5.00'))
+        url = reverse('catalog:promotions')
+        response = self.client.get(url)
+        premiere = [produit.pk for produit in response.context['produits']]
+        # Un produit de la page suivante modifié entre-temps ne remonte pas en tête
+        produit = Produit.objects.get(pk=self.produits[0].pk)
+        produit.description = "Nouvelle description"
+        produit.save()
+        response = self.client.get(url, {'curseur': response.context['page_obj'].curseur_suivant})
+        seconde = [produit.pk for produit in response.context['produits']]
+
+        attendus = sorted(self.produits[:20], key=lambda produit: (produit.date_creation, produit.pk), reverse=True)
+        self.assertEqual(premiere + seconde, [produit.pk for produit in attendus])
+
+    def test_curseur_invalide(self):
+        response = self.client.get(reverse('catalog:liste_produits'), {'tri': 'prix-asc', 'curseur': 'abc'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['produits'].object_list[0], self.produits[0])
+
+
+class RechercheTest(TestCase):
+    """Index inversé (catalog.search.backends.IndexInverseBackend), tenu à jour par les signaux."""
+
+    def setUp(self):
+        self.backend = IndexInverseBackend()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categorie = Categorie.objects.create(nom="Luminaires", slug='luminaires')
+            self.lampe = Produit.objects.create(
+                nom="Lampe de bureau", reference='L1', prix=Decimal('30.00'), categorie=self.categorie,
+                description="Éclairage orientable.",
+            )
+            self.applique = Produit.objects.create(
+                nom="Applique murale", reference='A1', prix=Decimal('20.00'), categorie=self.categorie,
+                description="Une lampe discrète pour le bureau.",
+            )
+            self.chaise = Produit.objects.create(nom="Chaise de bureau", reference='C1', prix=Decimal('80.00'))
+        # Impacts calculés avec la longueur moyenne du catalogue complet
+        self.backend.recalculer_impacts()
+
+    def ids(self, requete, queryset=None):
+        return [produit.pk for produit in self.backend.rechercher(requete, queryset)]
+
+    def test_classement(self):
+        # Le nom pèse plus que la description ; tous les termes sont exigés
+        self.assertEqual(self.ids('lampe bureau'), [self.lampe.pk, self.applique.pk])
+        # Sans produit qui les contienne tous : au moins un terme
+        self.assertEqual(set(self.ids('chaise murale')), {self.chaise.pk, self.applique.pk})
+        self.assertEqual(self.ids('Éclairages'), [self.lampe.pk])
+
+    def test_filtre_queryset(self):
+        self.assertEqual(self.ids('bureau', Produit.objects.exclude(pk=self.lampe.pk)), [self.chaise.pk, self.applique.pk])
+
+    def test_signaux(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chaise.nom = "Fauteuil"
+            self.chaise.save()
+        self.assertEqual(self.ids('fauteuil'), [self.chaise.pk])
+        # Le nom de la catégorie est indexé avec ses produits
+        self.assertEqual(set(self.ids('luminaires')), {self.lampe.pk, self.applique.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categorie.delete()
+        self.assertEqual(self.ids('luminaires'), [])
+        # Suppression : les entrées partent avec le produit (CASCADE)
+        self.lampe.refresh_from_db()
+        self.lampe.delete()
+        self.assertEqual(self.ids('lampe'), [self.applique.pk])
+
+    def test_tri_sur_toutes_les_correspondances(self):
+        # Classement par pertinence limité, tri explicite complet
+        self.backend.max_resultats = 2
+        resultats = self.backend.rechercher('bureau')
+        self.assertEqual(len(resultats), 2)
+        self.assertEqual(
+            list(resultats.order_by('prix').values_list('pk', flat=True)),
+            [self.applique.pk, self.lampe.pk, self.chaise.pk],
+        )
+
+
+class AutocompletionTest(TestCase):
+    """Index d'autocomplétion en mémoire (catalog.search.autocompletion) et son point d'accès."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categorie = Categorie.objects.create(nom="Casques audio", slug='casques-audio')
+        cls.casque = Produit.objects.create(
+            nom="Casque sans fil", reference='C1', prix=Decimal('90.00'), categorie=cls.categorie, est_meilleur_vente=True,
+        )
+        cls.casquette = Produit.objects.create(nom="Casquette", reference='C2', prix=Decimal('15.00'))
+        cls.cable = Produit.objects.create(nom="Câble USB", reference='C3', prix=Decimal('5.00'))
+
+    def setUp(self):
+        self.index = IndexAutocompletion()
+        self.index.charger()
+
+    def noms(self, saisie):
+        return [suggestion['nom'] for suggestion in self.index.suggerer(saisie)['produits']]
+
+    def test_suggestions(self):
+        # Meilleure vente d'abord, puis les plus récents
+        self.assertEqual(self.noms('cas'), ["Casque sans fil", "Casquette"])
+        self.assertEqual(self.noms('CÂBLE'), ["Câble USB"])
+        # Début d'un mot quelconque du nom
+        self.assertEqual(self.noms('fil'), ["Casque sans fil"])
+        self.assertEqual([c['nom'] for c in self.index.suggerer('cas')['categories']], ["Casques audio"])
+        self.assertEqual(self.noms('xyz'), [])
+
+    def test_ventes(self):
+        self.casque.est_meilleur_vente = False
+        self.casque.save()
+        self.index.synchroniser()
+        self.assertEqual(self.noms('cas'), ["Casquette", "Casque sans fil"])
+        self.index.vente_enregistree(self.casque.pk)
+        self.assertEqual(self.noms('cas'), ["Casque sans fil", "Casquette"])
+
+    def test_point_d_acces(self):
+        url = reverse('catalog:autocompletion')
+        self.client.get(url, {'q': 'cas'})
+        # Index chargé : aucune requête en base
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'q': 'cas'})
+        self.assertEqual(response.json()['q'], 'cas')
+        self.assertEqual(set(response.json()), {'q', 'categories', 'produits'})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-catalogue'}})
+class CacheCatalogueTest(TestCase):
+    """Fragments et entrées du cache du catalogue, périmés par les signaux une fois la transaction validée."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categorie = Categorie.objects.create(nom="Bureau", slug='bureau')
+        cls.produits = creer_catalogue(3, cls.categorie)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fragment_liste(self):
+        url = reverse('catalog:liste_produits')
+        self.client.get(url)
+        # Liste et compte servis par le fragment en cache
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'utm_source': 'lettre'})
+        self.assertContains(response, "Produit 2")
+
+        produit = self.produits[2]
+        with self.captureOnCommitCallbacks(execute=True):
+            produit.nom = "Lampe renommée"
+            produit.save()
+        response = self.client.get(url)
+        self.assertContains(response, "Lampe renommée")
+        self.assertNotContains(response, "Produit 2")
+
+    def test_invalidation_apres_validation(self):
+        versions = cache_catalogue.versions()
+        with self.captureOnCommitCallbacks() as rappels:
+            self.produits[0].save()
+        self.assertEqual(cache_catalogue.versions(), versions)
+        for rappel in rappels:
+            rappel()
+        self.assertNotEqual(cache_catalogue.version('produits'), versions['produits'])
+        self.assertEqual(cache_catalogue.version('categories'), versions['categories'])
+
+    def test_obtenir(self):
+        calculs = []
+
+        def calcul():
+            calculs.append(1)
+            return 'valeur'
+
+        self.assertEqual(cache_catalogue.obtenir('produits', ('essai',), calcul), 'valeur')
+        self.assertEqual(cache_catalogue.obtenir('produits', ('essai',), calcul), 'valeur')
+        self.assertEqual(len(calculs), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            cache_catalogue.invalider('produits')
+        cache_catalogue.obtenir('produits', ('essai',), calcul)
+        self.assertEqual(len(calculs), 2)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-arbre'}})
+class ArbreCategoriesTest(TestCase):
+    """Arbre des catégories du processeur de contexte, reconstruit seulement quand il change."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bureau = Categorie.objects.create(nom="Bureau", slug='bureau')
+        cls.cuisine = Categorie.objects.create(nom="Cuisine", slug='cuisine')
+        cls.produits = creer_catalogue(2, cls.bureau)
+
+    def setUp(self):
+        cache.clear()
+
+    def enregistrer(self, objet, **champs):
+        with self.captureOnCommitCallbacks(execute=True):
+            for champ, valeur in champs.items():
+                setattr(objet, champ, valeur)
+            objet.save()
+
+    def test_arbre_en_memoire(self):
+        arbre = cache_catalogue.arbre_categories()
+        self.assertEqual([categorie.nom for categorie in arbre], ["Bureau", "Cuisine"])
+        self.assertEqual(arbre.par_slug['bureau'].nombre_produits, 2)
+        with self.assertNumQueries(0):
+            self.assertIs(cache_catalogue.arbre_categories(), arbre)
+
+        # Le prix n'entre pas dans l'arbre
+        self.enregistrer(self.produits[0], prix=Decimal('99.00'))
+        with self.assertNumQueries(0):
+            self.assertIs(cache_catalogue.arbre_categories(), arbre)
+
+    def test_reconstruction(self):
+        cache_catalogue.arbre_categories()
+        self.enregistrer(self.produits[0], categorie=self.cuisine)
+        arbre = cache_catalogue.arbre_categories()
+        self.assertEqual((arbre.par_slug['bureau'].nombre_produits, arbre.par_slug['cuisine'].nombre_produits), (1, 1))
+
+        self.enregistrer(self.produits[1], est_actif=False)
+        self.assertEqual(cache_catalogue.arbre_categories().par_slug['bureau'].nombre_produits, 0)
+
+        self.enregistrer(self.cuisine, est_active=False)
+        self.assertNotIn('cuisine', cache_catalogue.arbre_categories().par_slug)
+
+    def test_processeur_de_contexte(self):
+        cache_catalogue.arbre_categories()
+        # Menu et liste des catégories lus dans l'arbre en mémoire
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('catalog:liste_categories'))
+        self.assertContains(response, "Cuisine")
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-stock'}})
+class JournalStockTest(TestCase):
+    """Journal des mouvements de stock et sa compaction (catalog.stock)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.produit = Produit.objects.create(nom="Lampe", reference='L1', prix=Decimal('20.00'), quantite=2)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_stock_reel_avant_compaction(self):
+        stock.reapprovisionner(self.produit, 5)
+        self.assertEqual(stock.ajuster(self.produit, 4).quantite, -3)
+        self.assertIsNone(stock.ajuster(self.produit, 4))
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.quantite, 2)
+        self.assertEqual(stock.annoter_stock(Produit.objects.all()).get().stock_reel, 4)
+
+        self.assertEqual(stock.compacter(), 1)
+        self.assertEqual(stock.compacter(), 0)
+        self.produit.refresh_from_db()
+        self.assertEqual((self.produit.quantite, self.produit.en_stock), (4, True))
+
+    def test_compaction_programmee_apres_commit(self):
+        with mock.patch('catalog.stock.threading.Timer') as minuteur:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                stock.reapprovisionner(self.produit, 1)
+            minuteur.assert_not_called()
+            for callback in callbacks:
+                callback()
+            minuteur.assert_called_once()
+            self.assertEqual(minuteur.call_args.args, (30, stock._compacter_en_arriere_plan))
+            # Une seule compaction programmée à la fois
+            with self.captureOnCommitCallbacks(execute=True):
+                stock.reapprovisionner(self.produit, 1)
+            minuteur.assert_called_once()
+        stock.compacter()
+        self.produit.refresh_from_db()
+        self.assertEqual(self.produit.quantite, 4)
+
+    @override_settings(STOCK_COMPACTION_DELAI=None)
+    def test_compaction_automatique_desactivee(self):
+        with mock.patch('catalog.stock.threading.Timer') as minuteur:
+            with self.captureOnCommitCallbacks(execute=True):
+                stock.reapprovisionner(self.produit, 1)
+        minuteur.assert_not_called()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-conditionnel'}})
+class ReponseConditionnelleTest(TestCase):
+    """ETag et 304 des pages du catalogue, validées sans rendu (ecommerce.conditionnel)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categorie = Categorie.objects.create(nom="Bureau", slug='bureau')
+        cls.produits = creer_catalogue(3, cls.categorie)
+
+    def setUp(self):
+        cache.clear()
+
+    def revalider(self, url, requetes):
+        # Première visite : le cookie CSRF, qui fait partie de l'empreinte du visiteur, est posé
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(requetes):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_fiche_produit(self):
+        url = reverse('catalog:detail_produit', args=[self.produits[0].slug])
+        # Une requête : les dates du produit, de sa catégorie, des avis et du stock
+        etag = self.revalider(url, 1)
+
+        stock.reapprovisionner(self.produits[0], 2)
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+        etag = self.client.get(url)['ETag']
+        # Un produit similaire (même catégorie) modifié : la page est rendue de nouveau
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produits[1].nom = "Lampe renommée"
+            self.produits[1].save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_liste(self):
+        url = reverse('catalog:liste_produits')
+        # Versions du cache du catalogue : aucune requête
+        etag = self.revalider(url, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.produits[2].save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -27,6 +27,7 @@ urlpatterns = [
     
     # Recherche
     path('recherche/', views.ResultatsRechercheView.as_view(), name='recherche'),
+    path('recherche/autocompletion/', views.autocompletion, name='autocompletion'),
     
     # Nouveautés
     path('nouveautes/', views.NouveautesView.as_view(), name='nouveautes'),
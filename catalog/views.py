@@ -1,96 +1,196 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, redirect
 from django.views.generic import ListView, DetailView, TemplateView
-from django.db.models import Q
+from django.db.models import Count, OuterRef, Subquery
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib import messages
-from .models import Produit, Categorie, ImageProduit
+from django.http import Http404, JsonResponse, QueryDict
+from django.views.decorators.http import require_GET
+from ecommerce.conditionnel import ReponseConditionnelleMixin
+from ecommerce.pagination import PaginationCurseurMixin
+from . import cache as cache_catalogue
+from .stock import annoter_stock
+from .models import AvisProduit, MouvementStock, Produit, Categorie, ImageProduit
+from .search import rechercher_produits
+from .search.autocompletion import get_index_autocompletion
+from .signals import produit_consulte
 
 
-class AccueilView(TemplateView):
+class AccueilView(cache_catalogue.CacheCatalogueMixin, TemplateView):
     """Page d'accueil avec les produits en vedette"""
     template_name = 'catalog/accueil.html'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['produits_phares'] = Produit.objects.filter(
+        context['produits_phares'] = Produit.objects.for_listing().filter(
             est_actif=True, 
             est_meilleur_vente=True
         )[:8]
-        context['nouveautes'] = Produit.objects.filter(
+        context['nouveautes'] = Produit.objects.for_listing().filter(
             est_actif=True, 
             est_nouveau=True
         )[:4]
         return context
 
 
-class ListeProduitsView(ListView):
-    """Liste des produits avec filtrage par catégorie"""
+# Tris des listes de produits (paramètre `tri`) : clé de la pagination par
+# curseur, terminée par l'id, servie par les index partiels (champ, id) WHERE est_actif de Produit
+TRIS_PRODUITS = {
+    'prix-asc': ('prix', 'id'),
+    'prix-desc': ('-prix', '-id'),
+    'nom-asc': ('nom', 'id'),
+    'nom-desc': ('-nom', '-id'),
+    'date-desc': ('-date_creation', '-id'),
+}
+TRI_PAR_DEFAUT = 'date-desc'
+
+
+def tri_produits(request):
+    """Clé de tri demandée par le paramètre `tri`, celle par défaut s'il est absent ou inconnu."""
+    return TRIS_PRODUITS.get(request.GET.get('tri'), TRIS_PRODUITS[TRI_PAR_DEFAUT])
+
+
+class ListeProduitsView(cache_catalogue.CacheCatalogueMixin, PaginationCurseurMixin, ListView):
+    """Liste des produits avec filtrage par catégorie, paginée par curseur"""
     model = Produit
     template_name = 'catalog/liste_produits.html'
     context_object_name = 'produits'
     paginate_by = 12
     
     def get_queryset(self):
-        queryset = Produit.objects.filter(est_actif=True)
+        queryset = Produit.objects.for_listing().filter(est_actif=True)
         
         # Filtrage par catégorie
         categorie_slug = self.kwargs.get('categorie_slug')
         if categorie_slug:
-            self.categorie = get_object_or_404(Categorie, slug=categorie_slug, est_active=True)
+            self.categorie = cache_catalogue.obtenir(
+                'categories', ('slug', categorie_slug),
+                lambda: Categorie.objects.filter(slug=categorie_slug, est_active=True).first()
+            )
+            if self.categorie is None:
+                raise Http404("Catégorie introuvable")
             queryset = queryset.filter(categorie=self.categorie)
         else:
             self.categorie = None
         
-        # Filtrage par recherche
+        # Filtrage par recherche (triée par pertinence sauf tri explicite)
         query = self.request.GET.get('q')
         if query:
-            queryset = queryset.filter(
-                Q(nom__icontains=query) | 
-                Q(description__icontains=query) |
-                Q(categorie__nom__icontains=query)
-            )
+            queryset = rechercher_produits(query, queryset)
+            if 'tri' not in self.request.GET:
+                return queryset
         
-        # Tri
-        tri = self.request.GET.get('tri', 'date-desc')
-        if tri == 'prix-asc':
-            queryset = queryset.order_by('prix')
-        elif tri == 'prix-desc':
-            queryset = queryset.order_by('-prix')
-        elif tri == 'nom-asc':
-            queryset = queryset.order_by('nom')
-        elif tri == 'nom-desc':
-            queryset = queryset.order_by('-nom')
-        else:  # date-desc par défaut
-            queryset = queryset.order_by('-date_creation')
-            
-        return queryset
+        # Tri (appliqué par la pagination, voir get_tri_curseur)
+        return queryset.order_by(*tri_produits(self.request))
+    
+    def get_tri_curseur(self):
+        # Le classement par pertinence n'est pas une clé de tri en base :
+        # pagination par numéro de page, sur la liste d'identifiants du moteur
+        if self.request.GET.get('q') and 'tri' not in self.request.GET:
+            return None
+        return tri_produits(self.request)
+    
+    def get_parametres_pagination(self):
+        # Recherche et tri seulement, le tri inconnu ramené à celui par défaut
+        parametres = QueryDict(mutable=True)
+        if self.request.GET.get('q'):
+            parametres['q'] = self.request.GET['q']
+        if 'tri' in self.request.GET:
+            tri = self.request.GET['tri']
+            parametres['tri'] = tri if tri in TRIS_PRODUITS else TRI_PAR_DEFAUT
+        return parametres
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Categorie.objects.filter(est_active=True)
         context['categorie_actuelle'] = self.categorie
         context['query'] = self.request.GET.get('q', '')
-        context['tri_actuel'] = self.request.GET.get('tri', 'date-desc')
+        context['tri_actuel'] = self.request.GET.get('tri', TRI_PAR_DEFAUT)
         return context
 
 
-class DetailProduitView(DetailView):
+class DetailProduitView(ReponseConditionnelleMixin, DetailView):
     """Détail d'un produit"""
     model = Produit
     template_name = 'catalog/detail_produit.html'
     context_object_name = 'produit'
     slug_url_kwarg = 'slug'
     
+    def get_validateurs(self):
+        """
+        Dates du produit, de sa catégorie, de son dernier avis et de son
+        dernier mouvement de stock, lues en une requête servie par des index
+        (slug unique, avis et mouvements par produit). Les images et
+        caractéristiques mettent à jour la date du produit (voir catalog.signals).
+        Le bloc des produits similaires est couvert par la version de l'espace
+        'produits' du cache du catalogue (lue dans le cache, sans requête).
+        """
+        avis = AvisProduit.objects.filter(produit=OuterRef('pk')).order_by()
+        ligne = Produit.objects.filter(slug=self.kwargs.get(self.slug_url_kwarg), est_actif=True).values_list(
+            'date_mise_a_jour',
+            'categorie__date_mise_a_jour',
+            Subquery(avis.order_by('-date_mise_a_jour').values('date_mise_a_jour')[:1]),
+            Subquery(
+                MouvementStock.objects.filter(produit=OuterRef('pk'))
+                .order_by('-date_creation').values('date_creation')[:1]
+            ),
+            # Avis supprimés, approuvés ou non : la date du dernier ne suffit pas
+            Subquery(avis.values('produit').annotate(nombre=Count('pk')).values('nombre')),
+            'nombre_avis',
+            'note_moyenne',
+            'id',
+            'categorie_id',
+        ).first()
+        if ligne is None:
+            return None
+        self.consultation = ligne[-2:]
+        return (ligne, cache_catalogue.version('produits')), max(date for date in ligne[:4] if date is not None)
+    
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        # Consultation notée aussi pour un 304 (produit lu par get_validateurs)
+        if request.method == 'GET' and response.status_code in (200, 304):
+            produit = getattr(self, 'object', None)
+            consultation = (produit.pk, produit.categorie_id) if produit is not None else getattr(self, 'consultation', None)
+            if consultation is not None:
+                produit_consulte.send(
+                    sender=Produit, request=request, produit_id=consultation[0], categorie_id=consultation[1]
+                )
+        return response
+    
     def get_queryset(self):
-        return Produit.objects.filter(est_actif=True)
+        # Toutes les images sont affichées (galerie) : un seul préchargement.
+        # Stock réel (voir catalog.stock) dans `stock_reel`
+        return annoter_stock(
+            Produit.objects.filter(est_actif=True).select_related('categorie').prefetch_related('images')
+        )
+    
+    def get_object(self, queryset=None):
+        # Le produit (avec catégorie, images et stock réel) est gardé en cache,
+        # sous son identifiant, jusqu'à sa prochaine modification ou son
+        # prochain mouvement de stock (voir catalog.cache.invalider_produits).
+        # L'identifiant vient de get_validateurs() ou d'une entrée slug -> id.
+        if queryset is not None:
+            return super().get_object(queryset)
+        slug = self.kwargs.get(self.slug_url_kwarg)
+        consultation = getattr(self, 'consultation', None)
+        produit_id = consultation[0] if consultation else cache_catalogue.obtenir(
+            'produits', ('slug', slug),
+            lambda: Produit.objects.filter(slug=slug, est_actif=True).values_list('pk', flat=True).first()
+        )
+        produit = produit_id and cache_catalogue.obtenir(
+            'produits', cache_catalogue.parties_produit(produit_id, 'detail'),
+            lambda: self.get_queryset().filter(pk=produit_id).first()
+        )
+        if produit is None:
+            raise Http404("Produit introuvable")
+        return produit
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        produit = self.get_object()
+        produit = self.object
         user = self.request.user
         
         # Produits similaires (même catégorie)
-        produits_similaires = Produit.objects.filter(
+        produits_similaires = Produit.objects.for_listing().filter(
             categorie=produit.categorie,
             est_actif=True
         ).exclude(id=produit.id)[:4]
@@ -119,18 +219,18 @@ class DetailProduitView(DetailView):
         return context
 
 
-class ListeCategoriesView(ListView):
+class ListeCategoriesView(cache_catalogue.CacheCatalogueMixin, ListView):
     """Liste des catégories"""
     model = Categorie
     template_name = 'catalog/liste_categories.html'
     context_object_name = 'categories'
     
     def get_queryset(self):
-        return Categorie.objects.filter(est_active=True)
+        return cache_catalogue.arbre_categories().categories
 
 
-class ResultatsRechercheView(ListView):
-    """Résultats de la recherche"""
+class ResultatsRechercheView(PaginationCurseurMixin, ListView):
+    """Résultats de la recherche, par pertinence ou selon le paramètre `tri`"""
     model = Produit
     template_name = 'catalog/recherche.html'
     context_object_name = 'produits'
@@ -141,12 +241,16 @@ class ResultatsRechercheView(ListView):
         if not query:
             return Produit.objects.none()
             
-        return Produit.objects.filter(
-            Q(est_actif=True) & 
-            (Q(nom__icontains=query) | 
-             Q(description__icontains=query) |
-             Q(categorie__nom__icontains=query))
-        )
+        resultats = rechercher_produits(query, Produit.objects.for_listing().filter(est_actif=True))
+        if 'tri' in self.request.GET:
+            return resultats.order_by(*tri_produits(self.request))
+        return resultats
+    
+    def get_tri_curseur(self):
+        # Par pertinence : pagination par numéro de page sur les identifiants classés
+        if 'tri' not in self.request.GET:
+            return None
+        return tri_produits(self.request)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -154,15 +258,31 @@ class ResultatsRechercheView(ListView):
         return context
 
 
-class NouveautesView(ListView):
+@require_GET
+def autocompletion(request):
+    """
+    Suggestions de recherche pendant la saisie (JSON), servies par l'index en
+    mémoire du worker : aucune requête en base.
+    """
+    saisie = request.GET.get('q', '')[:100]
+    suggestions = get_index_autocompletion().suggerer(saisie)
+    return JsonResponse({'q': saisie, **suggestions})
+
+
+class NouveautesView(cache_catalogue.CacheCatalogueMixin, PaginationCurseurMixin, ListView):
     """Page des nouveaux produits"""
     model = Produit
     template_name = 'catalog/nouveautes.html'
     context_object_name = 'produits'
     paginate_by = 12
+    tri_curseur = ('-date_creation', '-id')
+    
+    def get_parametres_pagination(self):
+        # Aucun paramètre hors position
+        return QueryDict(mutable=True)
     
     def get_queryset(self):
-        return Produit.objects.filter(
+        return Produit.objects.for_listing().filter(
             est_actif=True,
             est_nouveau=True
         ).order_by('-date_creation')
@@ -174,18 +294,25 @@ class NouveautesView(ListView):
         return context
 
 
-class PromotionsView(ListView):
+class PromotionsView(cache_catalogue.CacheCatalogueMixin, PaginationCurseurMixin, ListView):
     """Page des produits en promotion"""
     model = Produit
     template_name = 'catalog/promotions.html'
     context_object_name = 'produits'
     paginate_by = 12
+    # Clé stable : date_mise_a_jour avance à chaque modification d'un produit,
+    # qui changerait de page pendant le parcours
+    tri_curseur = ('-date_creation', '-id')
+    
+    def get_parametres_pagination(self):
+        # Aucun paramètre hors position
+        return QueryDict(mutable=True)
     
     def get_queryset(self):
-        return Produit.objects.filter(
+        return Produit.objects.for_listing().filter(
             est_actif=True,
             prix_promotionnel__isnull=False
-        ).order_by('-date_mise_a_jour')
+        ).order_by('-date_creation')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
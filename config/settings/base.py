@@ -18,6 +18,82 @@ SITE_NAME = "UNIAPP E-commerce"
 
 # Configuration du panier
 CART_SESSION_ID = 'cart'
+# Durée (secondes) pendant laquelle un article du panier retient son stock (voir cart.reservations)
+CART_RESERVATION_DUREE = 15 * 60
+
+# Moteur de recherche du catalogue (voir catalog.search.backends)
+CATALOG_SEARCH_BACKEND = config(
+    'CATALOG_SEARCH_BACKEND',
+    default='catalog.search.backends.IndexInverseBackend'
+)
+CATALOG_SEARCH_MAX_RESULTATS = 500
+# Entrées les plus fortes lues en premier pour un terme fréquent
+CATALOG_SEARCH_TAILLE_CHAMPIONS = 2000
+
+# Index de recherche en mémoire (voir catalog.search.memoire) : délai en
+# secondes entre deux resynchronisations avec la base
+INDEX_MEMOIRE_INTERVALLE_SYNCHRO = 30
+# Autocomplétion : nombre de suggestions, taille du cache des préfixes et
+# objectif de latence (99e centile, en ms) vérifié par benchmark_autocompletion
+CATALOG_AUTOCOMPLETE_MAX_SUGGESTIONS = 8
+CATALOG_AUTOCOMPLETE_TAILLE_CACHE = 10000
+CATALOG_AUTOCOMPLETE_P99_MS = 5
+# Cache du catalogue (voir catalog.cache) : durée de vie en secondes des
+# fragments de pages et des objets mis en cache
+CATALOG_CACHE_DUREE = 600
+# Journal de stock (voir catalog.stock) : délai maximal en secondes avant le
+# report des mouvements sur Produit.quantite ; None laisse la compaction à la
+# commande compacter_stock (cron)
+STOCK_COMPACTION_DELAI = 30
+# Profilage des requêtes (voir ecommerce.profilage) : fraction des requêtes
+# mesurées (0 à 1), nombre de mesures conservées par processus, répétitions
+# d'une même requête SQL signalées comme N+1
+PROFILAGE_TAUX = config('PROFILAGE_TAUX', default=0.01, cast=float)
+PROFILAGE_TAILLE_TAMPON = 1000
+PROFILAGE_SEUIL_REPETITIONS = 3
+# Budgets par nom d'URL ('*' : toutes les vues) : requetes, doublons,
+# duree_sql_ms, duree_ms. Dépassement journalisé, ou exception si
+# PROFILAGE_BUDGET_STRICT (tests)
+PROFILAGE_BUDGETS = {
+    '*': {'requetes': 30, 'doublons': 5, 'duree_ms': 500},
+    'catalog:accueil': {'requetes': 10},
+    'catalog:liste_produits': {'requetes': 12},
+    'catalog:produits_par_categorie': {'requetes': 12},
+    'catalog:detail_produit': {'requetes': 10},
+    'orders:historique': {'requetes': 8},
+}
+PROFILAGE_BUDGET_STRICT = config('PROFILAGE_BUDGET_STRICT', default=False, cast=bool)
+# Recherche intelligente : groupes de synonymes (défaut : ai.smartsearch.SYNONYMES_PAR_DEFAUT)
+# AI_SMARTSEARCH_SYNONYMES = [['telephone', 'smartphone', 'mobile'], ['ecran', 'moniteur']]
+# Recommandations (voir ai.reco) : voisins conservés par produit, achats
+# récents d'un client pris en compte, clients communs minimum entre deux produits
+AI_RECO_VOISINS = 50
+AI_RECO_ACHATS_RECENTS = 20
+AI_RECO_MIN_CLIENTS_COMMUNS = 1
+# Tirages aléatoires de produits (voir ai.echantillonnage) : délai de
+# reconstruction des segments (secondes) et taille du segment des mieux notés
+AI_ECHANTILLON_INTERVALLE = 300
+AI_ECHANTILLON_MIEUX_NOTES = 200
+# Historique de consultation (voir ai.history) : produits gardés par visiteur,
+# durée dans le cache (secondes), taille et délai maximal (secondes) des lots
+# enregistrés en base
+AI_HISTORIQUE_TAILLE = 20
+AI_HISTORIQUE_DUREE = 30 * 24 * 3600
+AI_HISTORIQUE_LOT = 100
+AI_HISTORIQUE_DELAI = 60
+# Durée (secondes) des cartes produit des modules IA dans le cache (voir ai.cartes)
+AI_CARTES_DUREE = 24 * 3600
+# Fragment des suggestions (voir ai_user.views.suggestions_view) : âge (secondes)
+# au-delà duquel il est recalculé en arrière-plan, et durée dans le cache,
+# par utilisateur connecté et pour les visiteurs anonymes
+AI_SUGGESTIONS_FRAICHEUR = 60
+AI_SUGGESTIONS_DUREE = 3600
+AI_SUGGESTIONS_FRAICHEUR_ANONYME = 300
+AI_SUGGESTIONS_DUREE_ANONYME = 24 * 3600
+# Chatbot (voir ai.intentions) : exemples annotés d'entraînement (défaut :
+# ai/donnees/intentions.json) et confiance minimale d'une intention
+# AI_CHATBOT_EXEMPLES = BASE_DIR / 'ai' / 'donnees' / 'intentions.json'
+AI_CHATBOT_SEUIL = 0.5
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
@@ -49,8 +125,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ecommerce.middleware.ProfilageMiddleware',  # En premier : mesure aussi les autres middlewares
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',  # Fichiers statiques, précompressés (gzip, brotli)
+    'django.middleware.gzip.GZipMiddleware',  # Compression des pages et du JSON (avant tout middleware qui lit le contenu)
+    'django.middleware.http.ConditionalGetMiddleware',  # ETag sur le contenu non compressé, 304 (voir ecommerce.conditionnel)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',  # Ajout du middleware de localisation
     'django.middleware.common.CommonMiddleware',
@@ -58,7 +137,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'ecommerce.middleware.CharsetMiddleware',  # Middleware personnalisé pour forcer l'encodage UTF-8
+    'ecommerce.middleware.CharsetMiddleware',  # charset=utf-8 sur les réponses HTML
 ]
 
 ROOT_URLCONF = 'ecommerce.urls'
@@ -140,6 +219,15 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Cache : mémoire locale du processus par défaut (développement). En
+# production, un cache partagé par les workers (voir production.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'uniapp',
+    }
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
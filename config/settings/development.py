@@ -19,9 +19,16 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 # Debug toolbar
 INSTALLED_APPS += ['debug_toolbar']
-MIDDLEWARE = ['debug_toolbar.middleware.DebugToolbarMiddleware'] + MIDDLEWARE
+# Après la compression et les ETag : la barre modifie le contenu des pages
+MIDDLEWARE.insert(
+    MIDDLEWARE.index('django.middleware.http.ConditionalGetMiddleware') + 1,
+    'debug_toolbar.middleware.DebugToolbarMiddleware',
+)
 INTERNAL_IPS = ['127.0.0.1']
 
+# Profilage de toutes les requêtes (en-tête Server-Timing, /admin/profilage/)
+PROFILAGE_TAUX = 1.0
+
 # Logging
 LOGGING = {
     'version': 1,
@@ -1,6 +1,15 @@
+import sys
+
 from django.apps import AppConfig
 
 
 class EcommerceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ecommerce'
+
+    def ready(self):
+        # Une fois par processus, au démarrage : sorties standard en UTF-8
+        # (journaux et print avec accents, quelle que soit la locale du système)
+        for flux in (sys.stdout, sys.stderr):
+            if getattr(flux, 'encoding', 'utf-8').lower() not in ('utf-8', 'utf8') and hasattr(flux, 'reconfigure'):
+                flux.reconfigure(encoding='utf-8')
@@ -0,0 +1,90 @@
+"""
+Requêtes conditionnelles (If-None-Match, If-Modified-Since) sur les pages.
+
+Une vue avec ReponseConditionnelleMixin décrit le contenu de sa page par
+des validateurs peu coûteux (versions du cache, dates de mise à jour), lus
+avant tout rendu. Si le navigateur ou le CDN a déjà cette version, la
+réponse est un 304 : ni requêtes de la vue, ni rendu du template.
+
+Les pages contiennent aussi des éléments propres au visiteur (menu du
+compte, badge du panier, jeton CSRF, messages) : l'ETag les inclut
+(empreinte_visiteur), et une page avec des messages en attente est
+toujours rendue. Last-Modified, qui ne peut pas les refléter, n'est
+envoyé qu'aux visiteurs anonymes au panier vide.
+
+Les autres réponses (JSON de /api/ai/ notamment) reçoivent un ETag calculé
+sur leur contenu par ConditionalGetMiddleware : le 304 évite alors le
+transfert, pas le calcul.
+"""
+import hashlib
+from datetime import datetime
+
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.translation import get_language
+
+
+def empreinte_visiteur(request):
+    """
+    Ce qui, dans une page, dépend du visiteur : utilisateur, langue, nombre
+    d'articles du panier et cookie CSRF.
+
+    Returns:
+        tuple: L'empreinte, ou None si des messages sont en attente d'affichage
+    """
+    from cart.cart import nombre_articles
+
+    if len(get_messages(request)):
+        return None
+    return (request.user.pk, get_language(), nombre_articles(request), request.META.get('CSRF_COOKIE'))
+
+
+class ReponseConditionnelleMixin:
+    """
+    Pour les vues dont la page peut être validée sans être rendue : répond
+    304 si l'ETag (ou la date Last-Modified) du client est encore valable,
+    et demande sinon au client de revalider à chaque affichage
+    (Cache-Control: no-cache, private pour un utilisateur connecté).
+
+    Les vues définissent get_validateurs().
+    """
+
+    def get_validateurs(self):
+        """
+        Valeurs qui changent dès que la page change, et date de dernière
+        modification (ou None). Appelée avant le traitement de la vue.
+
+        Returns:
+            tuple: (valeurs, derniere_modification), ou None pour rendre la page sans validation
+        """
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        visiteur = empreinte_visiteur(request)
+        validateurs = self.get_validateurs() if visiteur is not None else None
+        if validateurs is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        valeurs, derniere_modification = validateurs
+        etag = '"%s"' % hashlib.md5(repr((valeurs, visiteur)).encode()).hexdigest()
+        anonyme_sans_panier = visiteur[0] is None and not visiteur[2]
+        if not anonyme_sans_panier or not isinstance(derniere_modification, datetime):
+            derniere_modification = None
+        horodatage = int(derniere_modification.timestamp()) if derniere_modification else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=horodatage)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if derniere_modification is not None:
+                response['Last-Modified'] = http_date(horodatage)
+        if request.user.is_authenticated:
+            patch_cache_control(response, no_cache=True, private=True)
+        else:
+            patch_cache_control(response, no_cache=True)
+        return response
+
@@ -0,0 +1,238 @@
+import json
+import random
+import statistics
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.management.catalogue_synthetique import creer_catalogue
+from catalog.models import AvisProduit, Categorie, Produit
+from orders.models import Commande, LigneCommande
+
+# Motifs des plans d'exécution qui signalent une requête non servie par un index
+PROBLEMES_SQLITE = (('SCAN ', 'parcours complet'), ('USE TEMP B-TREE', 'tri sans index'))
+PROBLEMES_POSTGRESQL = (('Seq Scan', 'parcours complet'), ('Sort', 'tri sans index'))
+
+
+class AnnulerAudit(Exception):
+    """Levée pour annuler la transaction de l'audit (données synthétiques, sessions)."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Appelle les pages principales (ou les URL données), capture les "
+        "requêtes SQL de chacune, affiche leur plan d'exécution (EXPLAIN) en "
+        "signalant les parcours complets et les tris sans index, et mesure leur "
+        "durée. Avec --sortie puis --comparer, compare deux passages (avant et "
+        "après une migration d'index). Tout est fait dans une transaction annulée."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*', help="URL à auditer (défaut : pages principales du site)")
+        parser.add_argument(
+            '--utilisateur',
+            help="Nom de l'utilisateur connecté pendant l'audit (défaut : le client qui a le plus de commandes)",
+        )
+        parser.add_argument(
+            '--repetitions', type=int, default=5,
+            help="Exécutions de chaque requête pour la mesure (défaut : 5)",
+        )
+        parser.add_argument(
+            '--catalogue-synthetique', type=int, default=0, metavar='PRODUITS',
+            help="Crée d'abord un catalogue de PRODUITS produits, avec commandes et avis (défaut : 0, données existantes)",
+        )
+        parser.add_argument(
+            '--analyser', action='store_true',
+            help="PostgreSQL : EXPLAIN ANALYZE (exécute la requête) au lieu du plan estimé",
+        )
+        parser.add_argument('--sortie', help="Enregistre les résultats dans ce fichier JSON")
+        parser.add_argument('--comparer', help="Compare aux résultats enregistrés dans ce fichier JSON")
+
+    def handle(self, *args, **options):
+        self.repetitions = max(options['repetitions'], 1)
+        self.analyser = options['analyser']
+        self.verbosity = options['verbosity']
+        self.problemes = PROBLEMES_POSTGRESQL if connection.vendor == 'postgresql' else PROBLEMES_SQLITE
+        avant = None
+        if options['comparer']:
+            with open(options['comparer'], encoding='utf-8') as fichier:
+                avant = json.load(fichier)
+
+        resultats = {}
+        try:
+            with transaction.atomic():
+                utilisateur = None
+                if options['catalogue_synthetique']:
+                    utilisateur = self.creer_donnees(options['catalogue_synthetique'])
+                if options['utilisateur'] or utilisateur is None:
+                    utilisateur = self.trouver_utilisateur(options['utilisateur'])
+                urls = options['urls'] or self.urls_par_defaut(utilisateur)
+                # Sans cache : chaque page fait toutes ses requêtes
+                with override_settings(
+                    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                ):
+                    client = Client()
+                    if utilisateur is not None:
+                        client.force_login(utilisateur)
+                    for url in urls:
+                        resultats[url] = self.auditer(client, url)
+                raise AnnulerAudit
+        except AnnulerAudit:
+            pass
+
+        if options['sortie']:
+            with open(options['sortie'], 'w', encoding='utf-8') as fichier:
+                json.dump(resultats, fichier, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Résultats enregistrés dans {options['sortie']}.")
+        if avant is not None:
+            self.comparer(avant, resultats)
+
+    def creer_donnees(self, nombre_produits):
+        """
+        Catalogue synthétique, puis commandes (1 à 4 lignes) et avis de 200
+        clients.
+
+        Returns:
+            User: Le premier client, administrateur (pages de l'administration auditées)
+        """
+        debut = time.perf_counter()
+        aleatoire = random.Random(7)
+        creer_catalogue(nombre_produits)
+        produits = list(Produit.objects.filter(reference__startswith='BENCH-').values_list('pk', 'prix'))
+        User = get_user_model()
+        clients = User.objects.bulk_create([
+            User(username=f'audit-{numero}', is_staff=not numero, is_superuser=not numero)
+            for numero in range(200)
+        ])
+        commandes = Commande.objects.bulk_create([
+            Commande(
+                utilisateur=aleatoire.choice(clients),
+                adresse_livraison='rue du Test', code_postal='75000', ville='Paris', pays='France',
+                montant_total=Decimal('10.00'), paye=True,
+                statut=aleatoire.choice([choix for choix, _ in Commande.CHOIX_STATUT]),
+            )
+            for _ in range(nombre_produits // 2)
+        ], batch_size=2000)
+        LigneCommande.objects.bulk_create([
+            LigneCommande(commande=commande, produit_id=produit_id, quantite=1, prix_unitaire=prix)
+            for commande in commandes
+            for produit_id, prix in aleatoire.sample(produits, aleatoire.randint(1, 4))
+        ], batch_size=5000)
+        AvisProduit.objects.bulk_create([
+            AvisProduit(
+                produit_id=produit_id, utilisateur=client, note=aleatoire.randint(1, 5),
+                titre='Avis', commentaire='Avis de test', approuve=aleatoire.random() < 0.8,
+            )
+            for client in clients
+            for produit_id, _ in aleatoire.sample(produits, min(len(produits), 25))
+        ], batch_size=5000)
+        self.stdout.write(f"Données synthétiques créées en {time.perf_counter() - debut:.1f} s.")
+        return clients[0]
+
+    def trouver_utilisateur(self, nom):
+        User = get_user_model()
+        if nom:
+            try:
+                return User.objects.get(**{User.USERNAME_FIELD: nom})
+            except User.DoesNotExist:
+                raise CommandError(f"Utilisateur introuvable : {nom}")
+        return User.objects.annotate(nombre=Count('commandes')).filter(nombre__gt=0).order_by('-nombre').first()
+
+    def urls_par_defaut(self, utilisateur):
+        urls = [reverse('catalog:accueil'), reverse('catalog:liste_produits')]
+        urls += [f"{reverse('catalog:liste_produits')}?tri={tri}" for tri in ('prix-asc', 'nom-asc')]
+        categorie = Categorie.objects.filter(est_active=True, produits__est_actif=True).first()
+        if categorie is not None:
+            urls.append(reverse('catalog:produits_par_categorie', args=[categorie.slug]))
+        urls += [reverse('catalog:nouveautes'), reverse('catalog:promotions')]
+        # Produit avec catégorie : la fiche l'affiche dans son fil d'Ariane
+        produit = Produit.objects.filter(est_actif=True, categorie__isnull=False).annotate(
+            nombre=Count('lignes_commande')
+        ).order_by('-nombre').first()
+        if produit is not None:
+            urls.append(reverse('catalog:detail_produit', args=[produit.slug]))
+        if utilisateur is not None:
+            urls.append(reverse('orders:historique'))
+            if produit is not None:
+                # Vérifie l'achat du produit (Produit.has_purchased_by_user)
+                urls.append(reverse('catalog:avis_ajouter', args=[produit.slug]))
+            if utilisateur.is_staff:
+                urls.append(f"{reverse('admin:orders_commande_changelist')}?statut__exact={Commande.STATUT_EN_COURS}")
+        return urls
+
+    def auditer(self, client, url):
+        with CaptureQueriesContext(connection) as capture:
+            debut = time.perf_counter()
+            reponse = client.get(url)
+            duree_page = (time.perf_counter() - debut) * 1000
+        occurrences = Counter(
+            requete['sql'] for requete in capture.captured_queries
+            if requete['sql'].lstrip().upper().startswith('SELECT')
+        )
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{url} : {reponse.status_code}, {len(capture.captured_queries)} requête(s), {duree_page:.1f} ms"
+        ))
+        requetes = []
+        for sql, nombre in occurrences.items():
+            plan = self.expliquer(sql)
+            problemes = sorted({
+                f"{libelle} ({ligne.strip()})"
+                for ligne in plan for motif, libelle in self.problemes
+                if ligne.strip().lstrip('-> ').startswith(motif) and 'USING' not in ligne
+            })
+            duree = self.mesurer(sql)
+            requetes.append({'sql': sql, 'executions': nombre, 'ms': duree, 'plan': plan, 'problemes': problemes})
+            if problemes or self.verbosity >= 2:
+                style = self.style.WARNING if problemes else (lambda texte: texte)
+                self.stdout.write(style(f"  {duree:.2f} ms x{nombre} : {sql[:200]}"))
+                for ligne in plan:
+                    self.stdout.write(f"      {ligne}")
+        total = sum(requete['ms'] * requete['executions'] for requete in requetes)
+        self.stdout.write(f"  total SQL {total:.2f} ms, {sum(1 for requete in requetes if requete['problemes'])} requête(s) à revoir")
+        return {'statut': reponse.status_code, 'requetes': requetes, 'total_ms': total}
+
+    def expliquer(self, sql):
+        with connection.cursor() as curseur:
+            if connection.vendor == 'sqlite':
+                curseur.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return [ligne[-1] for ligne in curseur.fetchall()]
+            prefixe = 'EXPLAIN (ANALYZE, BUFFERS)' if self.analyser else 'EXPLAIN'
+            curseur.execute(f'{prefixe} {sql}')
+            return [ligne[0] for ligne in curseur.fetchall()]
+
+    def mesurer(self, sql):
+        """Durée médiane d'exécution de la requête, en millisecondes (la première exécution chauffe le cache)."""
+        durees = []
+        with connection.cursor() as curseur:
+            for _ in range(self.repetitions + 1):
+                debut = time.perf_counter()
+                curseur.execute(sql)
+                curseur.fetchall()
+                durees.append((time.perf_counter() - debut) * 1000)
+        return statistics.median(durees[1:])
+
+    def comparer(self, avant, apres):
+        self.stdout.write(self.style.MIGRATE_HEADING("Comparaison (SQL, ms)"))
+        for url, resultat in apres.items():
+            if url not in avant:
+                continue
+            ancien, nouveau = avant[url]['total_ms'], resultat['total_ms']
+            gain = f"x{ancien / nouveau:.1f}" if nouveau else '-'
+            self.stdout.write(f"  {url} : {ancien:.2f} -> {nouveau:.2f} ({gain})")
+            anciennes = {requete['sql']: requete for requete in avant[url]['requetes']}
+            for requete in resultat['requetes']:
+                precedente = anciennes.get(requete['sql'])
+                if precedente is not None and precedente['plan'] != requete['plan']:
+                    self.stdout.write(
+                        f"    {precedente['ms']:.2f} -> {requete['ms']:.2f} ms : {requete['sql'][:120]}"
+                    )
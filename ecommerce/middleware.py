@@ -1,42 +1,60 @@
-import os
-import sys
-import locale
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import profilage
+
 
 class CharsetMiddleware:
     """
-    Middleware pour forcer l'encodage UTF-8 sur toutes les réponses HTTP.
-    Gère également la configuration de l'encodage système.
+    Précise charset=utf-8 sur les réponses HTML qui ne l'indiquent pas.
+
+    L'encodage du processus (sorties standard) est configuré une seule fois
+    au démarrage, dans EcommerceConfig.ready(). L'en-tête Content-Encoding
+    n'est pas touché : il est réservé à la compression (GZipMiddleware,
+    fichiers statiques précompressés de WhiteNoise).
     """
     def __init__(self, get_response):
         self.get_response = get_response
-        # Configuration de l'encodage système
-        if sys.version_info[0] < 3:
-            reload(sys)
-            sys.setdefaultencoding('utf-8')
-        
-        # Forcer l'encodage de la locale
-        locale.setlocale(locale.LC_ALL, 'fr_FR.UTF-8')
-        
-        # Configuration de l'environnement pour l'encodage
-        os.environ['PYTHONIOENCODING'] = 'utf-8'
-        if sys.stdout.encoding != 'utf-8':
-            sys.stdout.reconfigure(encoding='utf-8')
-        if sys.stderr.encoding != 'utf-8':
-            sys.stderr.reconfigure(encoding='utf-8')
 
     def __call__(self, request):
-        # Traitement de la requête
         response = self.get_response(request)
-        
-        # Définir l'encodage du contenu sur UTF-8
         content_type = response.get('Content-Type', '')
-        if 'text/html' in content_type and 'charset=' not in content_type:
+        if content_type.startswith('text/html') and 'charset=' not in content_type:
             response['Content-Type'] = content_type + '; charset=utf-8'
-        elif not content_type:
-            response['Content-Type'] = 'text/html; charset=utf-8'
-            
-        # Définir l'en-tête Content-Encoding si nécessaire
-        if 'Content-Encoding' not in response:
-            response['Content-Encoding'] = 'utf-8'
-            
+        return response
+
+
+class ProfilageMiddleware:
+    """
+    Mesure une fraction des requêtes (voir ecommerce.profilage) : requêtes
+    SQL, rendu des templates, taille de la réponse. À placer en tête de
+    MIDDLEWARE pour que les autres middlewares soient comptés.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        profilage.instrumenter_templates()
+
+    def __call__(self, request):
+        if not profilage.echantillonner():
+            return self.get_response(request)
+
+        mesure = profilage.Mesure()
+        jeton = mesure.demarrer()
+        try:
+            with ExitStack() as enveloppes:
+                for connexion in connections.all():
+                    enveloppes.enter_context(connexion.execute_wrapper(mesure))
+                response = self.get_response(request)
+        finally:
+            mesure.arreter(jeton)
+
+        enregistrement = mesure.terminer(request, response)
+        # Les durées internes ne sont montrées qu'à l'équipe ; la mesure est
+        # conservée pour toutes les requêtes tirées
+        utilisateur = getattr(request, 'user', None)
+        if settings.DEBUG or (utilisateur is not None and utilisateur.is_staff):
+            response['Server-Timing'] = profilage.server_timing(enregistrement)
+        profilage.enregistrer(enregistrement)
         return response
@@ -0,0 +1,277 @@
+"""
+Pagination par clé (keyset, « seek »).
+
+Au lieu de LIMIT/OFFSET et d'un COUNT(*), chaque page reprend après la
+dernière ligne de la précédente : WHERE (clé de tri) < (clé de la dernière
+ligne) ORDER BY ... LIMIT n. Avec un index sur la clé de tri, la page 500
+coûte autant que la première.
+
+La position est transmise dans un curseur opaque (paramètre `curseur` de
+l'URL) qui contient le sens de lecture et les valeurs de la clé de tri.
+La clé de tri doit se terminer par un champ unique (id) et ses champs ne
+doivent pas être NULL.
+
+Le nombre total de résultats n'est calculé que s'il est affiché
+(PaginatorCurseur.count) : au-delà de SEUIL_COMPTE_EXACT lignes, c'est
+l'estimation du planificateur de PostgreSQL (voir compte_estime).
+
+PaginationCurseurMixin applique cette pagination aux ListView.
+"""
+import base64
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import SimpleLazyObject, cached_property
+
+SUIVANT = 's'
+PRECEDENT = 'p'
+
+# Nombre de lignes estimé au-delà duquel le compte exact n'est pas calculé
+SEUIL_COMPTE_EXACT = 10000
+
+
+def _serialiser(valeur):
+    # isoformat() garde les microsecondes (DjangoJSONEncoder les tronque) :
+    # une clé arrondie ferait sauter ou répéter des lignes
+    if isinstance(valeur, (datetime.date, datetime.time)):
+        return valeur.isoformat()
+    if isinstance(valeur, Decimal):
+        return str(valeur)
+    return valeur
+
+
+def compte_estime(queryset, seuil=SEUIL_COMPTE_EXACT):
+    """
+    Nombre d'objets de `queryset`. Sous PostgreSQL, l'estimation du
+    planificateur (EXPLAIN, sans lire les lignes) est retenue quand elle
+    dépasse `seuil` ; sinon, et avec les autres bases, COUNT(*) exact.
+
+    Returns:
+        tuple: (nombre, True si c'est une estimation)
+    """
+    connexion = connections[queryset.db]
+    if connexion.vendor == 'postgresql':
+        try:
+            sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        except EmptyResultSet:
+            return 0, False
+        with connexion.cursor() as curseur:
+            curseur.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = curseur.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimation = int(plan[0]['Plan']['Plan Rows'])
+        if estimation > seuil:
+            return estimation, True
+    return queryset.count(), False
+
+
+class CurseurInvalide(ValueError):
+    """Curseur illisible ou ne correspondant pas au tri demandé."""
+
+
+class PageCurseur:
+    """
+    Page de résultats avec les curseurs des pages voisines (None s'il n'y en
+    a pas). La requête n'est faite qu'au premier accès : une page servie par
+    un fragment en cache ne coûte rien.
+    """
+
+    def __init__(self, paginator, sens=SUIVANT, valeurs=None):
+        self.paginator = paginator
+        self.sens = sens
+        self.valeurs = valeurs
+
+    @cached_property
+    def _resultat(self):
+        return self.paginator.charger(self.sens, self.valeurs)
+
+    @property
+    def object_list(self):
+        return self._resultat[0]
+
+    @property
+    def curseur_precedent(self):
+        return self._resultat[1]
+
+    @property
+    def curseur_suivant(self):
+        return self._resultat[2]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.curseur_suivant is not None
+
+    def has_previous(self):
+        return self.curseur_precedent is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class PaginatorCurseur:
+    """
+    Pagine `queryset` selon `tri` (par exemple ('-date_commande', '-id')),
+    `par_page` objets par page.
+    """
+
+    def __init__(self, queryset, tri, par_page):
+        self.queryset = queryset
+        self.tri = tuple(tri)
+        self.par_page = par_page
+        self.champs = [(champ.lstrip('-'), champ.startswith('-')) for champ in self.tri]
+        modele = queryset.model
+        self.conversions = [modele._meta.get_field(nom).to_python for nom, _ in self.champs]
+
+    def encoder(self, sens, objet):
+        valeurs = [_serialiser(getattr(objet, nom)) for nom, _ in self.champs]
+        donnees = json.dumps([sens, valeurs], separators=(',', ':'))
+        return base64.urlsafe_b64encode(donnees.encode()).decode().rstrip('=')
+
+    def decoder(self, curseur):
+        try:
+            donnees = base64.urlsafe_b64decode(curseur + '=' * (-len(curseur) % 4))
+            sens, valeurs = json.loads(donnees)
+            if sens not in (SUIVANT, PRECEDENT) or len(valeurs) != len(self.champs):
+                raise CurseurInvalide(curseur)
+            return sens, [conversion(valeur) for conversion, valeur in zip(self.conversions, valeurs)]
+        except (ValueError, TypeError, ValidationError) as e:
+            raise CurseurInvalide(curseur) from e
+
+    def _apres(self, valeurs, inverse):
+        """(c1, c2, ...) après (v1, v2, ...) dans l'ordre du tri (ou avant, si `inverse`)."""
+        condition = Q()
+        egalites = {}
+        for (nom, decroissant), valeur in zip(self.champs, valeurs):
+            operateur = 'lt' if decroissant != inverse else 'gt'
+            condition |= Q(**egalites, **{f'{nom}__{operateur}': valeur})
+            egalites[nom] = valeur
+        # Borne redondante sur le premier champ : la base parcourt une seule
+        # plage de l'index du tri au lieu de réunir les branches du OR
+        (nom, decroissant), valeur = self.champs[0], valeurs[0]
+        return Q(**{f"{nom}__{'lte' if decroissant != inverse else 'gte'}": valeur}) & condition
+
+    def page(self, curseur=None):
+        """
+        Page qui suit (ou précède) le curseur, la première sans curseur.
+        Une requête, sans COUNT, faite au premier accès à la page.
+
+        Raises:
+            CurseurInvalide: Si le curseur ne peut pas être lu
+        """
+        if not curseur:
+            return PageCurseur(self)
+        return PageCurseur(self, *self.decoder(curseur))
+
+    def charger(self, sens, valeurs):
+        """Objets de la page et curseurs des pages voisines."""
+        inverse = sens == PRECEDENT
+        queryset = self.queryset
+        if valeurs is not None:
+            queryset = queryset.filter(self._apres(valeurs, inverse))
+        ordre = [nom if decroissant == inverse else f'-{nom}' for nom, decroissant in self.champs]
+        # Un objet de plus : indique s'il reste une page dans ce sens
+        objets = list(queryset.order_by(*ordre)[:self.par_page + 1])
+        encore = len(objets) > self.par_page
+        objets = objets[:self.par_page]
+        if inverse:
+            objets.reverse()
+        a_suivant = encore if not inverse else True
+        a_precedent = encore if inverse else valeurs is not None
+        return (
+            objets,
+            self.encoder(PRECEDENT, objets[0]) if objets and a_precedent else None,
+            self.encoder(SUIVANT, objets[-1]) if objets and a_suivant else None,
+        )
+
+    def compter(self):
+        return compte_estime(self.queryset)
+
+    @cached_property
+    def _compte(self):
+        return self.compter()
+
+    @property
+    def count(self):
+        """Nombre total d'objets, estimé pour les grands ensembles (voir `approximatif`)."""
+        return self._compte[0]
+
+    @property
+    def approximatif(self):
+        return self._compte[1]
+
+
+def paginer(request, queryset, tri, par_page, parametre='curseur'):
+    """Page demandée par le paramètre `parametre` de la requête ; la première si le curseur est invalide."""
+    paginator = PaginatorCurseur(queryset, tri, par_page)
+    try:
+        return paginator.page(request.GET.get(parametre))
+    except CurseurInvalide:
+        return paginator.page()
+
+
+class PaginationCurseurMixin:
+    """
+    Pour les ListView : pagination par clé selon le tri renvoyé par
+    get_tri_curseur(), position dans le paramètre `curseur`. Sans tri
+    (None, par exemple un classement par pertinence), la pagination par
+    numéro de page de ListView est conservée.
+
+    Le contexte reçoit `pagination_curseur` (mode utilisé),
+    `parametres_pagination` (paramètres lus par la vue, hors position, à
+    reprendre dans les liens des pages, voir get_parametres_pagination) et
+    `cle_page` (arguments de l'URL, ces paramètres et la position validée :
+    clé des fragments {% cache %} de la liste, qui ignore tout autre
+    paramètre de la requête).
+    """
+    tri_curseur = None
+    paginator_curseur_class = PaginatorCurseur
+    parametre_curseur = 'curseur'
+
+    def get_tri_curseur(self):
+        return self.tri_curseur
+
+    def paginate_queryset(self, queryset, page_size):
+        tri = self.get_tri_curseur()
+        if tri is None:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = self.paginator_curseur_class(queryset, tri, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.parametre_curseur))
+        except CurseurInvalide:
+            page = paginator.page()
+        # La page sert de liste d'objets, et is_paginated n'est évalué que
+        # s'il est lu : rien n'est chargé si le template est servi par le cache
+        return paginator, page, page, SimpleLazyObject(page.has_other_pages)
+
+    def get_parametres_pagination(self):
+        """Paramètres de la requête qui définissent la liste (QueryDict), hors position ; par défaut tous."""
+        parametres = self.request.GET.copy()
+        for nom in (self.parametre_curseur, self.page_kwarg):
+            parametres.pop(nom, None)
+        return parametres
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        parametres = self.get_parametres_pagination().urlencode()
+        page = context.get('page_obj')
+        if isinstance(page, PageCurseur):
+            position = (page.sens, page.valeurs)
+        else:
+            position = page.number if page is not None else None
+        context['parametres_pagination'] = parametres
+        context['pagination_curseur'] = isinstance(context.get('paginator'), PaginatorCurseur)
+        context['cle_page'] = repr((sorted(self.kwargs.items()), parametres, position))
+        return context
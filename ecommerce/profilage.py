@@ -0,0 +1,237 @@
+"""
+Profilage des requêtes HTTP.
+
+ProfilageMiddleware (ecommerce.middleware) mesure une fraction des requêtes,
+tirée au hasard (PROFILAGE_TAUX, de 0 à 1) : nombre et durée des requêtes
+SQL, requêtes répétées (empreintes N+1), durée du rendu des templates et
+taille de la réponse. Une requête non tirée ne coûte qu'un tirage.
+
+Chaque mesure est ajoutée à un tampon circulaire en mémoire du processus
+(les PROFILAGE_TAILLE_TAMPON dernières ; chaque worker a le sien), résumé
+par nom d'URL sur la page réservée à l'équipe (ecommerce.views.rapport_profilage),
+et résumée dans l'en-tête Server-Timing de la réponse pour les membres de
+l'équipe (ou avec DEBUG).
+
+Les budgets (PROFILAGE_BUDGETS, par nom d'URL, '*' pour toutes les vues)
+bornent le nombre de requêtes SQL, leur durée, la durée totale et le nombre
+de requêtes répétées. Un dépassement est journalisé ; avec
+PROFILAGE_BUDGET_STRICT (tests), il lève BudgetDepasse.
+"""
+import functools
+import logging
+import random
+import re
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Listes IN (%s, %s, ...) de longueurs différentes : même empreinte
+_LISTE_PARAMETRES = re.compile(r'%s(?:, %s)+')
+
+_mesure_courante = ContextVar('mesure_profilage', default=None)
+_tampon = None
+
+
+class BudgetDepasse(Exception):
+    """Une vue a dépassé son budget (voir PROFILAGE_BUDGETS)."""
+
+
+def taux():
+    return getattr(settings, 'PROFILAGE_TAUX', 0)
+
+
+def echantillonner():
+    """Tire au hasard si la requête en cours est mesurée."""
+    valeur = taux()
+    return valeur > 0 and (valeur >= 1 or random.random() < valeur)
+
+
+def tampon():
+    """Mesures conservées, des plus anciennes aux plus récentes."""
+    global _tampon
+    taille = getattr(settings, 'PROFILAGE_TAILLE_TAMPON', 1000)
+    if _tampon is None or _tampon.maxlen != taille:
+        _tampon = deque(_tampon or (), maxlen=taille)
+    return _tampon
+
+
+def budget(vue):
+    """Budget de la vue : celui de '*' complété ou remplacé par le sien."""
+    budgets = getattr(settings, 'PROFILAGE_BUDGETS', {})
+    return {**budgets.get('*', {}), **budgets.get(vue, {})}
+
+
+def empreinte(sql):
+    return _LISTE_PARAMETRES.sub('%s…', sql)
+
+
+class Mesure:
+    """
+    Mesure d'une requête HTTP. Sert aussi de fonction d'enveloppe pour
+    connection.execute_wrapper() : chaque requête SQL est chronométrée et
+    son texte (paramètres non substitués) compté.
+    """
+
+    def __init__(self):
+        self.debut = time.perf_counter()
+        self.requetes = Counter()
+        self.duree_sql = 0.0
+        self.duree_templates = 0.0
+        self.rendu_en_cours = False
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duree_sql += time.perf_counter() - debut
+            self.requetes[sql] += 1
+
+    def demarrer(self):
+        return _mesure_courante.set(self)
+
+    def arreter(self, jeton):
+        _mesure_courante.reset(jeton)
+
+    def terminer(self, request, response):
+        """Enregistrement de la mesure (dict), à ajouter au tampon."""
+        empreintes = Counter()
+        for sql, nombre in self.requetes.items():
+            empreintes[empreinte(sql)] += nombre
+        seuil = getattr(settings, 'PROFILAGE_SEUIL_REPETITIONS', 3)
+        nombre = sum(empreintes.values())
+        match = request.resolver_match
+        return {
+            'vue': match.view_name if match else '<non résolue>',
+            'methode': request.method,
+            'chemin': request.path,
+            'statut': response.status_code,
+            'date': time.time(),
+            'duree_ms': (time.perf_counter() - self.debut) * 1000,
+            'sql_ms': self.duree_sql * 1000,
+            'templates_ms': self.duree_templates * 1000,
+            'requetes': nombre,
+            'doublons': nombre - len(empreintes),
+            'repetees': [
+                (sql[:300], repetitions)
+                for sql, repetitions in empreintes.most_common(3) if repetitions >= seuil
+            ],
+            'taille': None if response.streaming else len(response.content),
+        }
+
+
+def instrumenter_templates():
+    """
+    Chronomètre le rendu des templates (moteur Django) pendant les requêtes
+    mesurées. Seul le rendu le plus extérieur compte (un template rendu
+    depuis un autre n'est pas compté deux fois). Sans effet s'il a déjà été
+    appelé.
+    """
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, 'profilage', False):
+        return
+    rendre = Template.render
+
+    @functools.wraps(rendre)
+    def render(self, context=None, request=None):
+        mesure = _mesure_courante.get()
+        if mesure is None or mesure.rendu_en_cours:
+            return rendre(self, context, request)
+        mesure.rendu_en_cours = True
+        debut = time.perf_counter()
+        try:
+            return rendre(self, context, request)
+        finally:
+            mesure.duree_templates += time.perf_counter() - debut
+            mesure.rendu_en_cours = False
+
+    render.profilage = True
+    Template.render = render
+
+
+def depassements(enregistrement):
+    """Libellés des limites du budget de la vue dépassées par la mesure."""
+    limites = budget(enregistrement['vue'])
+    return [
+        f"{cle} {enregistrement[champ]:.0f} > {limites[cle]}"
+        for cle, champ in (
+            ('requetes', 'requetes'),
+            ('doublons', 'doublons'),
+            ('duree_sql_ms', 'sql_ms'),
+            ('duree_ms', 'duree_ms'),
+        )
+        if cle in limites and enregistrement[champ] > limites[cle]
+    ]
+
+
+def enregistrer(enregistrement):
+    """
+    Ajoute la mesure au tampon et vérifie le budget de la vue.
+
+    Raises:
+        BudgetDepasse: Si le budget est dépassé et PROFILAGE_BUDGET_STRICT vrai
+    """
+    enregistrement['depassements'] = depassements(enregistrement)
+    tampon().append(enregistrement)
+    if enregistrement['depassements']:
+        message = f"Budget dépassé par {enregistrement['vue']} ({enregistrement['chemin']}) : " + ', '.join(
+            enregistrement['depassements']
+        )
+        for sql, repetitions in enregistrement['repetees']:
+            message += f"\n  {repetitions} x {sql}"
+        if getattr(settings, 'PROFILAGE_BUDGET_STRICT', False):
+            raise BudgetDepasse(message)
+        logger.warning(message)
+
+
+def server_timing(enregistrement):
+    """Valeur de l'en-tête Server-Timing (durées en ms, lisibles dans les outils du navigateur)."""
+    return (
+        f"total;dur={enregistrement['duree_ms']:.1f}, "
+        f"sql;dur={enregistrement['sql_ms']:.1f};desc=\"{enregistrement['requetes']} requetes\", "
+        f"tpl;dur={enregistrement['templates_ms']:.1f}"
+    )
+
+
+def _centile(valeurs, centile):
+    return valeurs[min(len(valeurs) - 1, int(len(valeurs) * centile))]
+
+
+def rapport():
+    """
+    Résumé du tampon par vue, les plus lentes (95e centile) d'abord.
+
+    Returns:
+        list: Un dict par vue
+    """
+    par_vue = {}
+    for enregistrement in list(tampon()):
+        par_vue.setdefault(enregistrement['vue'], []).append(enregistrement)
+    lignes = []
+    for vue, mesures in par_vue.items():
+        durees = sorted(mesure['duree_ms'] for mesure in mesures)
+        tailles = [mesure['taille'] for mesure in mesures if mesure['taille'] is not None]
+        pire = max(mesures, key=lambda mesure: mesure['duree_ms'])
+        lignes.append({
+            'vue': vue,
+            'nombre': len(mesures),
+            'duree_p50_ms': _centile(durees, 0.5),
+            'duree_p95_ms': _centile(durees, 0.95),
+            'duree_max_ms': durees[-1],
+            'requetes_moyenne': sum(mesure['requetes'] for mesure in mesures) / len(mesures),
+            'requetes_max': max(mesure['requetes'] for mesure in mesures),
+            'sql_ms_moyenne': sum(mesure['sql_ms'] for mesure in mesures) / len(mesures),
+            'templates_ms_moyenne': sum(mesure['templates_ms'] for mesure in mesures) / len(mesures),
+            'doublons_max': max(mesure['doublons'] for mesure in mesures),
+            'taille_moyenne': sum(tailles) / len(tailles) if tailles else None,
+            'depassements': sum(1 for mesure in mesures if mesure['depassements']),
+            'repetees': max((mesure['repetees'] for mesure in mesures), key=len),
+            'pire_chemin': pire['chemin'],
+        })
+    lignes.sort(key=lambda ligne: ligne['duree_p95_ms'], reverse=True)
+    return lignes
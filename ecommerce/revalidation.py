@@ -0,0 +1,52 @@
+"""
+Cache « stale-while-revalidate ».
+
+obtenir() garde une valeur en cache avec sa date de calcul. Tant qu'elle a
+moins de `fraicheur` secondes, elle est servie telle quelle. Plus vieille,
+elle est encore servie (jusqu'à l'expiration de l'entrée, `duree` secondes),
+et un seul fil d'arrière-plan, tous processus confondus (verrou posé par
+cache.add), la recalcule : la requête ne paie jamais le calcul, sauf quand
+la valeur est absente du cache.
+"""
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# Durée maximale (secondes) d'un recalcul en arrière-plan avant qu'un autre puisse être lancé
+DUREE_VERROU = 60
+
+
+def _recalculer(cle, calcul, duree):
+    valeur = calcul()
+    cache.set(cle, (time.time(), valeur), duree)
+    return valeur
+
+
+def _recalculer_en_arriere_plan(cle, calcul, duree):
+    try:
+        _recalculer(cle, calcul, duree)
+    except Exception:
+        logger.exception("Échec du recalcul de %s", cle)
+    finally:
+        close_old_connections()
+        cache.delete(f'{cle}:recalcul')
+
+
+def obtenir(cle, calcul, fraicheur, duree):
+    """
+    Retourne la valeur en cache sous `cle`, calculée par `calcul()` si elle
+    est absente, et relance son calcul en arrière-plan si elle a plus de
+    `fraicheur` secondes.
+    """
+    entree = cache.get(cle)
+    if entree is None:
+        return _recalculer(cle, calcul, duree)
+    date_calcul, valeur = entree
+    if time.time() - date_calcul > fraicheur and cache.add(f'{cle}:recalcul', True, DUREE_VERROU):
+        threading.Thread(target=_recalculer_en_arriere_plan, args=(cle, calcul, duree), daemon=True).start()
+    return valeur
@@ -0,0 +1,75 @@
+import gzip
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, HttpResponseNotModified
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from catalog.models import Produit
+
+from . import profilage
+from .middleware import CharsetMiddleware
+from .profilage import BudgetDepasse
+
+# Sans cache : chaque requête de la vue est comptée
+SANS_CACHE = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+
+
+@SANS_CACHE
+@override_settings(PROFILAGE_TAUX=1, PROFILAGE_BUDGET_STRICT=True)
+class BudgetProfilageTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Produit.objects.create(nom="Lampe", reference='L1', prix=Decimal('20.00'), quantite=3)
+        cls.equipe = get_user_model().objects.create_user(username='equipe', password='x', is_staff=True)
+
+    def setUp(self):
+        profilage.tampon().clear()
+
+    @override_settings(PROFILAGE_BUDGETS={'catalog:liste_produits': {'requetes': 1}})
+    def test_budget_depasse(self):
+        with self.assertRaises(BudgetDepasse):
+            self.client.get(reverse('catalog:liste_produits'))
+
+    @override_settings(PROFILAGE_BUDGETS={'catalog:liste_produits': {'requetes': 50}})
+    def test_server_timing_reserve_a_l_equipe(self):
+        response = self.client.get(reverse('catalog:liste_produits'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+        self.client.force_login(self.equipe)
+        response = self.client.get(reverse('catalog:liste_produits'))
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        # Les deux requêtes sont mesurées
+        self.assertEqual(len(profilage.tampon()), 2)
+
+
+@SANS_CACHE
+class EntetesReponseTest(TestCase):
+    """CharsetMiddleware et compression des réponses (GZipMiddleware)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for numero in range(5):
+            Produit.objects.create(nom=f"Lampe {numero}", reference=f'L{numero}', prix=Decimal('20.00'), quantite=3)
+
+    def test_charset_sans_content_encoding(self):
+        response = self.client.get(reverse('catalog:liste_produits'))
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_reponses_sans_contenu(self):
+        middleware = CharsetMiddleware(lambda request: HttpResponseNotModified())
+        response = middleware(RequestFactory().get('/'))
+        self.assertNotIn('Content-Type', response)
+        middleware = CharsetMiddleware(lambda request: HttpResponse('{}', content_type='application/json'))
+        self.assertEqual(middleware(RequestFactory().get('/'))['Content-Type'], 'application/json')
+
+    def test_compression(self):
+        url = reverse('catalog:liste_produits')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn(b'Lampe 0', gzip.decompress(response.content))
@@ -20,10 +20,15 @@ from django.views.generic import TemplateView, RedirectView
 from django.contrib.auth import views as auth_views
 from django.conf import settings
 
+from . import views
+
 urlpatterns = [
     # Redirection de /catalogue/ vers /produits/
     path('catalogue/', RedirectView.as_view(url='/produits/', permanent=True)),
     
+    # Rapport de profilage des requêtes (équipe)
+    path('admin/profilage/', views.rapport_profilage, name='profilage'),
+
     # URL d'administration
     path('admin/', admin.site.urls),
     
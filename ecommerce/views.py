@@ -0,0 +1,29 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.shortcuts import render
+from django.views.decorators.http import require_GET
+
+from . import profilage
+
+
+@staff_member_required
+@require_GET
+def rapport_profilage(request):
+    """
+    Vues les plus lentes d'après les requêtes mesurées par ProfilageMiddleware
+    (tampon du worker qui répond). ?format=json pour le rapport brut.
+    """
+    lignes = profilage.rapport()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'taux': profilage.taux(),
+            'mesures': len(profilage.tampon()),
+            'vues': lignes,
+        })
+    return render(request, 'ecommerce/profilage.html', {
+        'title': "Profilage des requêtes",
+        'lignes': lignes,
+        'taux': profilage.taux(),
+        'mesures': len(profilage.tampon()),
+        'capacite': profilage.tampon().maxlen,
+    })
@@ -1,4 +1,5 @@
 import multiprocessing
+import os
 
 # Nombre de workers = (2 x nombre_de_CPU) + 1
 workers = multiprocessing.cpu_count() * 2 + 1
@@ -23,3 +24,31 @@ errorlog = '-'   # Sortie vers stderr
 # Redémarrage des workers de temps en temps pour éviter les fuites de mémoire
 max_requests = 1000
 max_requests_jitter = 50
+
+
+def post_worker_init(worker):
+    """
+    Construit les index de recherche et l'échantillonneur de produits en
+    mémoire, et entraîne le moteur d'intentions du chatbot, dès le démarrage
+    du worker, pour que la première requête ne paie pas leur chargement.
+
+    Les objets des index sont ensuite exclus du ramasse-miettes cyclique :
+    sans cela, chaque collecte complète parcourt les centaines de milliers
+    d'objets des index, au milieu d'une requête.
+    """
+    import gc
+    from ai.echantillonnage import get_echantillonneur
+    from ai.intentions import get_moteur
+    from ai.smartsearch import get_index
+    from catalog.search.autocompletion import get_index_autocompletion
+    get_index().charger()
+    get_index_autocompletion().charger()
+    get_echantillonneur().charger()
+    get_moteur()
+    gc.freeze()
+
+
+def worker_exit(server, worker):
+    """Enregistre les consultations de produits encore en mémoire (voir ai.history)."""
+    from ai.history import vider_consultations
+    vider_consultations()
@@ -3,6 +3,7 @@ from django.urls import reverse
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from .models import Commande, LigneCommande
+from .services import TRANSITIONS, annuler_commandes, changer_statut, livrer_commandes
 
 
 class LigneCommandeInline(admin.TabularInline):
@@ -40,6 +41,8 @@ class CommandeAdmin(admin.ModelAdmin):
         'commande_actions',
     ]
     list_filter = ['statut', 'paye', 'date_commande']
+    # Client affiché sur chaque ligne : joint plutôt qu'une requête par commande
+    list_select_related = ['utilisateur']
     search_fields = [
         'id',
         'utilisateur__email',
@@ -135,28 +138,40 @@ class CommandeAdmin(admin.ModelAdmin):
     commande_actions.short_description = 'Actions'
     commande_actions.allow_tags = True
     
+    def save_model(self, request, obj, form, change):
+        """Un changement de statut passe par orders.services.changer_statut (remise en stock)."""
+        from django.contrib import messages
+        
+        if not (change and 'statut' in form.changed_data):
+            super().save_model(request, obj, form, change)
+            return
+        statut = obj.statut
+        obj.statut = form.initial['statut']
+        super().save_model(request, obj, form, change)
+        if statut in TRANSITIONS and changer_statut(Commande.objects.filter(pk=obj.pk), statut):
+            obj.statut = statut
+        else:
+            messages.warning(request, f"Le statut de la commande #{obj.id} n'a pas pu être modifié.")
+    
+    def _message_transition(self, request, queryset, modifiees, libelle):
+        """Compte rendu d'une action en masse : commandes modifiées et ignorées."""
+        self.message_user(request, f"{len(modifiees)} commande(s) {libelle}.")
+        ignorees = queryset.count() - len(modifiees)
+        if ignorees:
+            self.message_user(
+                request,
+                f"{ignorees} commande(s) ignorée(s) : leur statut ne le permet pas.",
+                level='warning',
+            )
+    
     def marquer_comme_livre(self, request, queryset):
         """Action pour marquer les commandes sélectionnées comme livrées."""
-        updated = 0
-        for commande in queryset:
-            if commande.marquer_comme_livre():
-                updated += 1
-        self.message_user(
-            request,
-            f"{updated} commande(s) marquée(s) comme livrée(s)."
-        )
+        self._message_transition(request, queryset, livrer_commandes(queryset), "marquée(s) comme livrée(s)")
     marquer_comme_livre.short_description = "Marquer comme livré"
     
     def marquer_comme_annule(self, request, queryset):
-        """Action pour annuler les commandes sélectionnées."""
-        updated = 0
-        for commande in queryset:
-            if commande.annuler():
-                updated += 1
-        self.message_user(
-            request,
-            f"{updated} commande(s) annulée(s)."
-        )
+        """Action pour annuler les commandes sélectionnées (et remettre leurs articles en stock)."""
+        self._message_transition(request, queryset, annuler_commandes(queryset), "annulée(s)")
     marquer_comme_annule.short_description = "Annuler les commandes sélectionnées"
     
     def get_urls(self):
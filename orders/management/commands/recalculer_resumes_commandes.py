@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from orders.models import ResumeCommandesUtilisateur
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule le résumé des commandes (nombre, total dépensé, dernière "
+        "commande, répartition par statut) de tous les utilisateurs, par "
+        "exemple après un import de commandes en masse."
+    )
+
+    def handle(self, *args, **options):
+        nombre = ResumeCommandesUtilisateur.recalculer()
+        self.stdout.write(self.style.SUCCESS(f"{nombre} résumé(s) recalculé(s)."))
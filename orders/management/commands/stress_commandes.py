@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection
+
+from cart.models import ArticlePanier, Panier
+from catalog.models import MouvementStock, Produit
+from catalog.stock import compacter
+from orders.models import Commande, LigneCommande
+from orders.services import StockInsuffisant, passer_commande
+
+
+class Command(BaseCommand):
+    help = (
+        "Passe des commandes simultanées (un thread par client) sur quelques "
+        "produits à stock limité, puis vérifie qu'aucun produit n'a été vendu "
+        "au-delà de son stock. Les données créées sont supprimées à la fin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=40, help="Nombre de clients (défaut : 40)")
+        parser.add_argument('--produits', type=int, default=5, help="Nombre de produits (défaut : 5)")
+        parser.add_argument('--stock', type=int, default=20, help="Stock initial de chaque produit (défaut : 20)")
+        parser.add_argument('--lignes', type=int, default=3, help="Produits par panier (défaut : 3)")
+
+    def handle(self, *args, **options):
+        prefixe = f"stress-{uuid.uuid4().hex[:8]}"
+        self.sqlite = connection.vendor == 'sqlite'
+        if self.sqlite:
+            # SQLite ignore SELECT ... FOR UPDATE : une transaction qui a lu le
+            # stock puis veut écrire après une autre échoue (« database is
+            # locked ») et est rejouée, ce qui empêche la survente
+            self.stdout.write(self.style.WARNING(
+                "SQLite : pas de verrou de ligne, les écritures concurrentes sont sérialisées par la base."
+            ))
+        try:
+            produits, utilisateurs = self.creer_donnees(prefixe, options)
+            resultats = self.lancer(utilisateurs)
+            self.verifier(produits, options['stock'], resultats)
+        finally:
+            self.nettoyer(prefixe)
+
+    def creer_donnees(self, prefixe, options):
+        aleatoire = random.Random(7)
+        produits = [
+            Produit.objects.create(
+                reference=f"{prefixe}-{numero}",
+                nom=f"Produit {prefixe} {numero}",
+                description="Produit de test de charge",
+                prix=Decimal('10.00'),
+                quantite=options['stock'],
+            )
+            for numero in range(options['produits'])
+        ]
+        utilisateurs = []
+        User = get_user_model()
+        for numero in range(options['clients']):
+            utilisateur = User.objects.create_user(username=f"{prefixe}-{numero}", password=None)
+            panier = Panier.objects.create(utilisateur=utilisateur)
+            ArticlePanier.objects.bulk_create([
+                ArticlePanier(panier=panier, produit=produit, quantite=aleatoire.randint(1, 3), prix_unitaire=produit.prix)
+                for produit in aleatoire.sample(produits, min(options['lignes'], len(produits)))
+            ])
+            panier.mettre_a_jour_totaux()
+            utilisateurs.append(utilisateur)
+        return produits, utilisateurs
+
+    def lancer(self, utilisateurs):
+        resultats = {'passees': 0, 'refusees': 0, 'erreurs': [], 'reprises': 0, 'latences': []}
+        verrou = threading.Lock()
+        depart = threading.Barrier(len(utilisateurs))
+
+        def client(utilisateur):
+            depart.wait()
+            debut = time.perf_counter()
+            try:
+                for tentative in range(200):
+                    try:
+                        passer_commande(utilisateur, 'rue du Test', '75000', 'Paris', 'France')
+                        issue = 'passees'
+                    except StockInsuffisant:
+                        issue = 'refusees'
+                    except OperationalError as e:
+                        # SQLite : « database is locked », la transaction est rejouée
+                        # après une attente croissante
+                        if not self.sqlite or 'locked' not in str(e):
+                            raise
+                        with verrou:
+                            resultats['reprises'] += 1
+                        time.sleep(random.uniform(0, min(0.2, 0.005 * 2 ** tentative)))
+                        continue
+                    with verrou:
+                        resultats[issue] += 1
+                        resultats['latences'].append(time.perf_counter() - debut)
+                    return
+                raise RuntimeError("base toujours verrouillée après 200 tentatives")
+            except Exception as e:
+                with verrou:
+                    resultats['erreurs'].append(f"{utilisateur.username} : {e!r}")
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=client, args=(utilisateur,)) for utilisateur in utilisateurs]
+        debut = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        resultats['duree'] = time.perf_counter() - debut
+        return resultats
+
+    def verifier(self, produits, stock_initial, resultats):
+        duree = resultats['duree']
+        self.stdout.write(
+            f"{resultats['passees']} commandes passées, {resultats['refusees']} refusées (stock insuffisant), "
+            f"{resultats['reprises']} reprises en {duree:.2f} s "
+            f"({resultats['passees'] / duree:.1f} commandes/s)"
+        )
+        # Attente des verrous (et reprises sous SQLite) comprise : sur un
+        # produit disputé, les commandes passent l'une après l'autre
+        latences = sorted(resultats['latences'])
+        if latences:
+            def centile(p):
+                return latences[min(len(latences) - 1, int(p * len(latences)))] * 1000
+
+            self.stdout.write(
+                f"Latence par commande : médiane {centile(0.5):.0f} ms, "
+                f"95e centile {centile(0.95):.0f} ms, max {latences[-1] * 1000:.0f} ms"
+            )
+        for erreur in resultats['erreurs']:
+            self.stdout.write(self.style.ERROR(f"  {erreur}"))
+
+        problemes = list(resultats['erreurs'])
+        # Les ventes sont dans le journal de stock : les reporter sur les produits
+        compacter()
+        for produit in produits:
+            produit.refresh_from_db()
+            vendus = sum(
+                LigneCommande.objects.filter(produit=produit).values_list('quantite', flat=True)
+            )
+            journal = sum(
+                MouvementStock.objects.filter(produit=produit).values_list('quantite', flat=True)
+            )
+            ligne = f"  {produit.reference} : stock {produit.quantite}, vendus {vendus}"
+            if journal != -vendus:
+                problemes.append(f"{produit.reference} : journal {journal} pour {vendus} vendus")
+                ligne = self.style.ERROR(ligne)
+            elif produit.quantite + vendus != stock_initial:
+                problemes.append(f"{produit.reference} : {vendus} vendus pour un stock de {stock_initial}")
+                ligne = self.style.ERROR(ligne)
+            elif produit.en_stock != (produit.quantite > 0):
+                problemes.append(f"{produit.reference} : en_stock incohérent")
+                ligne = self.style.ERROR(ligne)
+            self.stdout.write(ligne)
+        if problemes:
+            raise CommandError("Incohérences : " + '; '.join(problemes))
+        self.stdout.write(self.style.SUCCESS("Aucune survente."))
+
+    def nettoyer(self, prefixe):
+        # Les lignes de commande protègent les produits : utilisateurs (et
+        # leurs commandes, paniers) d'abord
+        Commande.objects.filter(utilisateur__username__startswith=prefixe).delete()
+        get_user_model().objects.filter(username__startswith=prefixe).delete()
+        Produit.objects.filter(reference__startswith=prefixe).delete()
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.10 on 2026-10-18 05:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max, Q, Sum
+
+
+def calculer_resumes(apps, schema_editor):
+    Commande = apps.get_model('orders', 'Commande')
+    Resume = apps.get_model('orders', 'ResumeCommandesUtilisateur')
+    statuts = {'en_cours': 'nombre_en_cours', 'livre': 'nombre_livrees', 'annule': 'nombre_annulees'}
+    lignes = Commande.objects.order_by().values('utilisateur_id').annotate(
+        nombre_commandes=Count('pk'),
+        total_depense=Sum('montant_total'),
+        derniere_commande=Max('date_commande'),
+        **{champ: Count('pk', filter=Q(statut=statut)) for statut, champ in statuts.items()}
+    )
+    Resume.objects.bulk_create([Resume(**ligne) for ligne in lignes], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_profile_picture'),
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumeCommandesUtilisateur',
+            fields=[
+                ('utilisateur', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resume_commandes', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur')),
+                ('nombre_commandes', models.PositiveIntegerField(default=0, verbose_name='Nombre de commandes')),
+                ('total_depense', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total dépensé')),
+                ('derniere_commande', models.DateTimeField(blank=True, null=True, verbose_name='Dernière commande')),
+                ('nombre_en_cours', models.PositiveIntegerField(default=0, verbose_name='Commandes en cours')),
+                ('nombre_livrees', models.PositiveIntegerField(default=0, verbose_name='Commandes livrées')),
+                ('nombre_annulees', models.PositiveIntegerField(default=0, verbose_name='Commandes annulées')),
+            ],
+            options={
+                'verbose_name': 'Résumé des commandes',
+                'verbose_name_plural': 'Résumés des commandes',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['utilisateur', '-date_commande', '-id'], name='commande_utilisateur_date'),
+        ),
+        migrations.RunPython(calculer_resumes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.10 on 2026-10-18 05:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_resume_commandes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(fields=['statut', '-date_commande', '-id'], name='commande_statut_date'),
+        ),
+        migrations.AddIndex(
+            model_name='lignecommande',
+            index=models.Index(fields=['produit', 'commande'], name='ligne_produit_commande'),
+        ),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+from collections import Counter, defaultdict
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from decimal import Decimal
@@ -75,29 +78,45 @@ class Commande(models.Model):
         verbose_name = "Commande"
         verbose_name_plural = "Commandes"
         ordering = ['-date_commande']
+        indexes = [
+            # Historique d'un utilisateur, paginé par clé (date, id)
+            models.Index(fields=['utilisateur', '-date_commande', '-id'], name='commande_utilisateur_date'),
+            # Liste de l'administration filtrée par statut, des plus récentes aux plus anciennes
+            models.Index(fields=['statut', '-date_commande', '-id'], name='commande_statut_date'),
+        ]
     
     def __str__(self):
         return f"Commande #{self.id} - {self.utilisateur.email} - {self.get_statut_display()}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        commande = super().from_db(db, field_names, values)
+        # Montant enregistré : un changement est reporté sur le résumé de l'utilisateur (voir orders.signals)
+        commande._montant_enregistre = commande.__dict__.get('montant_total')
+        return commande
+    
     def est_annulable(self):
         """Vérifie si la commande peut être annulée."""
         return self.statut == self.STATUT_EN_COURS
     
+    def _changer_statut(self, statut):
+        from .services import changer_statut
+        
+        if not changer_statut(Commande.objects.filter(pk=self.pk), statut):
+            return False
+        self.statut = statut
+        return True
+    
     def marquer_comme_livre(self):
-        """Marque la commande comme livrée."""
-        if self.statut == self.STATUT_EN_COURS:
-            self.statut = self.STATUT_LIVRE
-            self.save()
-            return True
-        return False
+        """Marque la commande comme livrée (voir orders.services.changer_statut)."""
+        return self._changer_statut(self.STATUT_LIVRE)
     
     def annuler(self):
-        """Annule la commande si possible."""
-        if self.est_annulable():
-            self.statut = self.STATUT_ANNULE
-            self.save()
-            return True
-        return False
+        """
+        Annule la commande si possible et remet ses articles en stock (voir
+        orders.services.changer_statut).
+        """
+        return self._changer_statut(self.STATUT_ANNULE)
 
 
 class LigneCommande(models.Model):
@@ -130,6 +149,11 @@ class LigneCommande(models.Model):
     class Meta:
         verbose_name = "Ligne de commande"
         verbose_name_plural = "Lignes de commande"
+        indexes = [
+            # Commandes contenant un produit (Produit.has_purchased_by_user),
+            # sans lire les lignes
+            models.Index(fields=['produit', 'commande'], name='ligne_produit_commande'),
+        ]
     
     def __str__(self):
         return f"{self.quantite}x {self.produit.nom} - {self.prix_total()} €"
@@ -137,3 +161,152 @@ class LigneCommande(models.Model):
     def prix_total(self):
         """Calcule le prix total de la ligne de commande."""
         return self.quantite * self.prix_unitaire
+
+
+class ResumeCommandesUtilisateur(models.Model):
+    """
+    Synthèse des commandes d'un utilisateur (historique), tenue à jour à
+    chaque création, suppression, changement de montant ou de statut de
+    commande (voir
+    orders.signals et orders.services.changer_statut) plutôt que recalculée
+    à chaque affichage.
+    """
+    # Compteur de chaque statut
+    CHAMPS_STATUT = {
+        Commande.STATUT_EN_COURS: 'nombre_en_cours',
+        Commande.STATUT_LIVRE: 'nombre_livrees',
+        Commande.STATUT_ANNULE: 'nombre_annulees',
+    }
+    
+    utilisateur = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='resume_commandes',
+        verbose_name="Utilisateur"
+    )
+    nombre_commandes = models.PositiveIntegerField(default=0, verbose_name="Nombre de commandes")
+    total_depense = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Total dépensé")
+    derniere_commande = models.DateTimeField(null=True, blank=True, verbose_name="Dernière commande")
+    nombre_en_cours = models.PositiveIntegerField(default=0, verbose_name="Commandes en cours")
+    nombre_livrees = models.PositiveIntegerField(default=0, verbose_name="Commandes livrées")
+    nombre_annulees = models.PositiveIntegerField(default=0, verbose_name="Commandes annulées")
+    
+    class Meta:
+        verbose_name = "Résumé des commandes"
+        verbose_name_plural = "Résumés des commandes"
+    
+    def __str__(self):
+        return f"Commandes de {self.utilisateur_id} : {self.nombre_commandes}"
+    
+    @classmethod
+    def pour(cls, utilisateur):
+        """Résumé de l'utilisateur (vide s'il n'a jamais commandé), en une requête."""
+        return cls.objects.filter(utilisateur=utilisateur).first() or cls(utilisateur=utilisateur)
+    
+    @classmethod
+    def commande_creee(cls, commande):
+        champ_statut = cls.CHAMPS_STATUT[commande.statut]
+        valeurs = {
+            'nombre_commandes': F('nombre_commandes') + 1,
+            'total_depense': F('total_depense') + commande.montant_total,
+            champ_statut: F(champ_statut) + 1,
+            # GREATEST ignore NULL sous PostgreSQL, pas sous SQLite
+            'derniere_commande': Coalesce(
+                Greatest('derniere_commande', Value(commande.date_commande)), Value(commande.date_commande)
+            ),
+        }
+        if cls.objects.filter(utilisateur_id=commande.utilisateur_id).update(**valeurs):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    utilisateur_id=commande.utilisateur_id,
+                    nombre_commandes=1,
+                    total_depense=commande.montant_total,
+                    derniere_commande=commande.date_commande,
+                    **{champ_statut: 1}
+                )
+        except IntegrityError:
+            # Créé entre-temps par une autre commande du même utilisateur
+            cls.objects.filter(utilisateur_id=commande.utilisateur_id).update(**valeurs)
+    
+    @classmethod
+    def commande_supprimee(cls, commande):
+        champ_statut = cls.CHAMPS_STATUT[commande.statut]
+        cls.objects.filter(utilisateur_id=commande.utilisateur_id).update(
+            nombre_commandes=F('nombre_commandes') - 1,
+            total_depense=F('total_depense') - commande.montant_total,
+            **{champ_statut: F(champ_statut) - 1},
+            derniere_commande=Subquery(
+                Commande.objects.filter(utilisateur=OuterRef('utilisateur'))
+                .order_by('-date_commande').values('date_commande')[:1]
+            ),
+        )
+    
+    @classmethod
+    def montant_change(cls, commande, ecart):
+        cls.objects.filter(utilisateur_id=commande.utilisateur_id).update(
+            total_depense=F('total_depense') + ecart
+        )
+    
+    @classmethod
+    def statuts_changes(cls, commandes, statut):
+        """
+        Reporte des changements de statut, en un UPDATE pour tous les
+        utilisateurs concernés.
+        
+        Args:
+            commandes: Couples (utilisateur_id, ancien statut)
+            statut (str): Nouveau statut
+        """
+        ecarts = defaultdict(Counter)
+        for utilisateur_id, ancien in commandes:
+            ecarts[utilisateur_id][cls.CHAMPS_STATUT[ancien]] -= 1
+            ecarts[utilisateur_id][cls.CHAMPS_STATUT[statut]] += 1
+        champs = {champ for compteur in ecarts.values() for champ, ecart in compteur.items() if ecart}
+        if not champs:
+            return
+        cls.objects.filter(utilisateur_id__in=ecarts).update(**{
+            champ: F(champ) + Case(
+                *[
+                    When(utilisateur_id=utilisateur_id, then=Value(compteur[champ]))
+                    for utilisateur_id, compteur in ecarts.items() if compteur[champ]
+                ],
+                default=Value(0),
+                output_field=models.IntegerField(),
+            )
+            for champ in champs
+        })
+    
+    @classmethod
+    def recalculer(cls, utilisateur_ids=None):
+        """
+        Recalcule les résumés à partir des commandes (tous, ou ceux des
+        utilisateurs donnés).
+        
+        Returns:
+            int: Nombre de résumés enregistrés
+        """
+        from django.db.models import Count, Max, Q, Sum
+        
+        commandes = Commande.objects.all()
+        if utilisateur_ids is not None:
+            commandes = commandes.filter(utilisateur_id__in=utilisateur_ids)
+        lignes = commandes.order_by().values('utilisateur_id').annotate(
+            nombre_commandes=Count('pk'),
+            total_depense=Sum('montant_total'),
+            derniere_commande=Max('date_commande'),
+            **{
+                champ: Count('pk', filter=Q(statut=statut))
+                for statut, champ in cls.CHAMPS_STATUT.items()
+            }
+        )
+        resumes = [cls(**ligne) for ligne in lignes]
+        with transaction.atomic():
+            existants = cls.objects.all()
+            if utilisateur_ids is not None:
+                existants = existants.filter(utilisateur_id__in=utilisateur_ids)
+            existants.delete()
+            cls.objects.bulk_create(resumes, batch_size=1000)
+        return len(resumes)
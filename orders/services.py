@@ -0,0 +1,185 @@
+"""
+Passage de commande.
+
+passer_commande() transforme le panier d'un utilisateur en commande, en un
+nombre fixe de requêtes quelle que soit la taille du panier, et sans
+survente possible même avec des commandes simultanées :
+
+1. le panier puis les produits sont verrouillés (SELECT ... FOR UPDATE),
+   les produits par identifiant croissant pour que deux commandes ne
+   puissent pas s'attendre mutuellement (voir catalog.stock.verrouiller) ;
+2. chaque quantité est comparée au stock réel moins les réservations des
+   autres paniers (cart.reservations), lu après la prise des verrous ;
+3. les lignes de commande et les mouvements de stock (ventes) sont
+   insérés avec bulk_create : la ligne du produit n'est pas modifiée, le
+   stock compacté est mis à jour plus tard (catalog.stock.compacter).
+
+changer_statut() fait passer un ensemble de commandes d'un statut à
+l'autre en un nombre fixe de requêtes, quel que soit leur nombre : seules
+celles dont le statut permet la transition (TRANSITIONS) sont modifiées, par
+un seul UPDATE, de même que les résumés des utilisateurs concernés, et les
+commandes annulées sont remises en stock par un seul INSERT de mouvements
+d'annulation, reportés aussitôt sur les produits par un seul UPDATE.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from cart.models import Panier
+from cart.reservations import annoter_disponible
+from catalog import stock
+from catalog.models import MouvementStock, Produit
+from .models import Commande, LigneCommande, ResumeCommandesUtilisateur
+from .signals import commande_passee
+
+
+class PanierVide(Exception):
+    """Le panier ne contient aucun article."""
+
+
+class StockInsuffisant(Exception):
+    """
+    Stock insuffisant pour au moins un produit du panier.
+
+    Attributes:
+        manquants (list): Triplets (produit, quantité demandée, quantité disponible)
+    """
+
+    def __init__(self, manquants):
+        self.manquants = manquants
+        super().__init__(', '.join(f"{produit.nom} ({demande}/{disponible})" for produit, demande, disponible in manquants))
+
+
+def passer_commande(utilisateur, adresse_livraison, code_postal, ville, pays):
+    """
+    Crée la commande à partir du panier de l'utilisateur, enregistre les
+    ventes au journal de stock et vide le panier, dans une seule transaction.
+
+    Returns:
+        Commande: La commande créée
+
+    Raises:
+        PanierVide: Si le panier est vide ou n'existe pas
+        StockInsuffisant: Si un produit n'a plus assez de stock (rien n'est modifié)
+    """
+    with transaction.atomic():
+        # Verrou du panier : un double envoi du formulaire ne commande pas deux fois
+        panier = Panier.objects.select_for_update().filter(utilisateur=utilisateur).first()
+        if panier is None:
+            raise PanierVide()
+        articles = list(panier.items.order_by('produit_id').values_list('produit_id', 'quantite', 'prix_unitaire'))
+        if not articles:
+            raise PanierVide()
+
+        quantites = {produit_id: quantite for produit_id, quantite, _ in articles}
+        stock.verrouiller(quantites)
+        produits = annoter_disponible(Produit.objects.filter(pk__in=quantites), panier.pk).in_bulk()
+        manquants = [
+            (produits[produit_id], quantite, max(produits[produit_id].stock_disponible, 0))
+            for produit_id, quantite in quantites.items()
+            if quantite > produits[produit_id].stock_disponible
+        ]
+        if manquants:
+            raise StockInsuffisant(manquants)
+
+        commande = Commande.objects.create(
+            utilisateur=utilisateur,
+            adresse_livraison=adresse_livraison,
+            code_postal=code_postal,
+            ville=ville,
+            pays=pays,
+            montant_total=sum((quantite * prix for _, quantite, prix in articles), Decimal('0.00')),
+            paye=True  # À remplacer par une vraie logique de paiement
+        )
+        LigneCommande.objects.bulk_create([
+            LigneCommande(commande=commande, produit_id=produit_id, quantite=quantite, prix_unitaire=prix)
+            for produit_id, quantite, prix in articles
+        ])
+        MouvementStock.objects.bulk_create([
+            MouvementStock(
+                produit_id=produit_id, type_mouvement=MouvementStock.TYPE_VENTE,
+                quantite=-quantite, commande=commande,
+            )
+            for produit_id, quantite in quantites.items()
+        ])
+
+        # Vider le panier (et libérer ses réservations)
+        panier.items.all().delete()
+        panier.mettre_a_jour_totaux()
+
+        lignes = dict(quantites)
+        transaction.on_commit(
+            lambda: commande_passee.send(sender=Commande, commande=commande, quantites=lignes)
+        )
+    return commande
+
+
+# Statut cible -> statuts depuis lesquels on peut y passer
+TRANSITIONS = {
+    Commande.STATUT_LIVRE: (Commande.STATUT_EN_COURS,),
+    Commande.STATUT_ANNULE: (Commande.STATUT_EN_COURS,),
+}
+
+
+def changer_statut(commandes, statut):
+    """
+    Fait passer les commandes au statut `statut` si leur statut actuel le
+    permet ; les autres sont ignorées. Les commandes annulées sont remises
+    en stock.
+
+    Args:
+        commandes (QuerySet): Commandes concernées
+        statut (str): Statut cible (clé de TRANSITIONS)
+
+    Returns:
+        list: Identifiants des commandes modifiées
+    """
+    sources = TRANSITIONS[statut]
+    with transaction.atomic():
+        # Verrou des commandes retenues : une commande annulée deux fois en
+        # même temps n'est comptée (et remise en stock) qu'une fois
+        retenues = list(
+            commandes.filter(statut__in=sources).select_for_update()
+            .order_by('pk').values_list('pk', 'utilisateur_id', 'statut')
+        )
+        if not retenues:
+            return []
+        ids = [pk for pk, _, _ in retenues]
+        Commande.objects.filter(pk__in=ids, statut__in=sources).update(
+            statut=statut, date_mise_a_jour=timezone.now()
+        )
+        ResumeCommandesUtilisateur.statuts_changes(
+            [(utilisateur_id, ancien) for _, utilisateur_id, ancien in retenues], statut
+        )
+        if statut == Commande.STATUT_ANNULE:
+            remettre_en_stock(ids)
+    return ids
+
+
+def remettre_en_stock(commande_ids):
+    """
+    Un mouvement d'annulation par produit de chaque commande, en un INSERT,
+    et le stock des produits augmenté du total de leurs annulations, en un
+    UPDATE (sans attendre la compaction).
+    """
+    lignes = (
+        LigneCommande.objects.filter(commande_id__in=commande_ids)
+        .order_by().values_list('commande_id', 'produit_id').annotate(quantite=Sum('quantite'))
+    )
+    stock.enregistrer([
+        MouvementStock(
+            produit_id=produit_id, type_mouvement=MouvementStock.TYPE_ANNULATION,
+            quantite=quantite, commande_id=commande_id,
+        )
+        for commande_id, produit_id, quantite in lignes
+    ], reporter_aussitot=True)
+
+
+def annuler_commandes(commandes):
+    return changer_statut(commandes, Commande.STATUT_ANNULE)
+
+
+def livrer_commandes(commandes):
+    return changer_statut(commandes, Commande.STATUT_LIVRE)
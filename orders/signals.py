@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from .models import Commande, ResumeCommandesUtilisateur
+
+# Envoyé après la validation d'une commande passée par orders.services.passer_commande.
+# Arguments : commande (Commande), quantites ({produit_id: quantité}). Les lignes
+# étant insérées en masse, post_save n'est pas émis pour LigneCommande.
+commande_passee = Signal()
+
+
+# Résumé des commandes de chaque utilisateur (voir ResumeCommandesUtilisateur).
+# Les changements de statut passent par orders.services.changer_statut.
+
+@receiver(post_save, sender=Commande)
+def resume_commande_creee(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if created:
+        ResumeCommandesUtilisateur.commande_creee(instance)
+    elif update_fields is None or 'montant_total' in update_fields:
+        # Montant corrigé après coup (commande créée puis complétée, administration)
+        ancien = getattr(instance, '_montant_enregistre', None)
+        if ancien is not None and instance.montant_total != ancien:
+            ResumeCommandesUtilisateur.montant_change(instance, instance.montant_total - ancien)
+    instance._montant_enregistre = instance.montant_total
+
+
+@receiver(post_delete, sender=Commande)
+def resume_commande_supprimee(sender, instance, **kwargs):
+    ResumeCommandesUtilisateur.commande_supprimee(instance)
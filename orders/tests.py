@@ -1,3 +1,159 @@
-from django.test import TestCase
+import threading
+import time
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from cart.models import ArticlePanier, Panier
+from catalog import stock
+from catalog.models import MouvementStock, Produit
+
+from .models import Commande, LigneCommande, ResumeCommandesUtilisateur
+from .services import StockInsuffisant, annuler_commandes, livrer_commandes, passer_commande
+
+
+def remplir_panier(utilisateur, produit, quantite):
+    panier = Panier.objects.create(utilisateur=utilisateur)
+    ArticlePanier.objects.create(panier=panier, produit=produit, quantite=quantite, prix_unitaire=produit.prix)
+
+
+def commander(utilisateur):
+    return passer_commande(utilisateur, "1 rue de la Paix", '75001', 'Paris', 'France')
+
+
+class StockCommandeTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.produit = Produit.objects.create(nom="Lampe", reference='L1', prix=Decimal('20.00'), quantite=3)
+        User = get_user_model()
+        cls.acheteurs = [
+            User.objects.create_user(username=f'acheteur{numero}', email=f'acheteur{numero}@example.com', password='x')
+            for numero in range(2)
+        ]
+
+    def test_pas_de_survente(self):
+        for acheteur in self.acheteurs:
+            remplir_panier(acheteur, self.produit, 2)
+        commander(self.acheteurs[0])
+        with self.assertRaises(StockInsuffisant) as erreur:
+            commander(self.acheteurs[1])
+        self.assertEqual(erreur.exception.manquants, [(self.produit, 2, 1)])
+        self.assertEqual(stock.stock_reel(self.produit.pk), 1)
+        # Le panier refusé est intact
+        self.assertEqual(Panier.objects.get(utilisateur=self.acheteurs[1]).items.count(), 1)
+
+    def test_compaction(self):
+        remplir_panier(self.acheteurs[0], self.produit, 3)
+        commander(self.acheteurs[0])
+        stock.compacter()
+        self.produit.refresh_from_db()
+        self.assertEqual((self.produit.quantite, self.produit.en_stock), (0, False))
+        self.assertEqual(stock.stock_reel(self.produit.pk), 0)
+
+
+class ChangementStatutTest(TestCase):
+    """Annulation et livraison (orders.services.changer_statut), résumé des commandes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.produits = [
+            Produit.objects.create(nom=f"Lampe {numero}", reference=f'L{numero}', prix=Decimal('20.00'), quantite=2)
+            for numero in range(2)
+        ]
+        cls.acheteur = get_user_model().objects.create_user(username='acheteur', password=None)
+
+    def commande(self, quantite):
+        panier, _ = Panier.objects.get_or_create(utilisateur=self.acheteur)
+        for produit in self.produits:
+            ArticlePanier.objects.create(panier=panier, produit=produit, quantite=quantite, prix_unitaire=produit.prix)
+        return commander(self.acheteur)
+
+    def test_annulation_remet_en_stock(self):
+        commandes = [self.commande(1), self.commande(1)]
+        stock.compacter()
+        self.assertEqual(Produit.objects.filter(en_stock=False).count(), 2)
+
+        # Nombre fixe quel que soit le nombre de commandes : commandes (verrou,
+        # UPDATE), résumés, lignes, produits (verrou), INSERT des mouvements,
+        # bascules, UPDATE des produits, et deux points de sauvegarde
+        with self.assertNumQueries(12):
+            annulees = annuler_commandes(Commande.objects.all())
+        self.assertEqual(sorted(annulees), sorted(commande.pk for commande in commandes))
+        # Le stock compacté est à jour sans attendre la compaction
+        self.assertFalse(MouvementStock.objects.filter(compacte=False).exists())
+        self.assertEqual(
+            list(Produit.objects.order_by('pk').values_list('quantite', 'en_stock')), [(2, True), (2, True)]
+        )
+        # Une commande annulée ne l'est pas une seconde fois
+        self.assertEqual(annuler_commandes(Commande.objects.all()), [])
+        self.assertEqual(stock.stock_reel(self.produits[0].pk), 2)
+
+        resume = ResumeCommandesUtilisateur.pour(self.acheteur)
+        self.assertEqual((resume.nombre_en_cours, resume.nombre_annulees), (0, 2))
+
+    def test_livraison(self):
+        commande = self.commande(1)
+        self.assertEqual(livrer_commandes(Commande.objects.all()), [commande.pk])
+        self.assertEqual(annuler_commandes(Commande.objects.all()), [])
+        resume = ResumeCommandesUtilisateur.pour(self.acheteur)
+        self.assertEqual((resume.nombre_en_cours, resume.nombre_livrees), (0, 1))
+        self.assertEqual(stock.stock_reel(self.produits[0].pk), 1)
+
+    def test_montant_modifie(self):
+        commande = self.commande(1)
+        self.assertEqual(ResumeCommandesUtilisateur.pour(self.acheteur).total_depense, Decimal('40.00'))
+        commande = Commande.objects.get(pk=commande.pk)
+        commande.montant_total = Decimal('35.00')
+        commande.save()
+        commande.paye = True
+        commande.save(update_fields=['paye'])
+        self.assertEqual(ResumeCommandesUtilisateur.pour(self.acheteur).total_depense, Decimal('35.00'))
+        commande.delete()
+        self.assertEqual(ResumeCommandesUtilisateur.pour(self.acheteur).total_depense, Decimal('0.00'))
+
+
+# Les commandes sont validées pour de bon : pas de compaction en arrière-plan après le test
+@override_settings(STOCK_COMPACTION_DELAI=None)
+class CommandesSimultaneesTest(TransactionTestCase):
+    """Paniers validés en même temps (un thread par client) sur un stock limité."""
+
+    def test_pas_de_survente(self):
+        produit = Produit.objects.create(nom="Lampe", reference='L1', prix=Decimal('20.00'), quantite=5)
+        User = get_user_model()
+        acheteurs = [User.objects.create_user(username=f'acheteur{numero}', password=None) for numero in range(8)]
+        for acheteur in acheteurs:
+            remplir_panier(acheteur, produit, 1)
+        issues = []
+        depart = threading.Barrier(len(acheteurs))
+
+        def client(utilisateur):
+            depart.wait()
+            try:
+                for tentative in range(200):
+                    try:
+                        commander(utilisateur)
+                        issues.append('passee')
+                    except StockInsuffisant:
+                        issues.append('refusee')
+                    except OperationalError as e:
+                        # SQLite verrouille toute la base : la transaction est rejouée
+                        if 'locked' not in str(e):
+                            raise
+                        time.sleep(0.01)
+                        continue
+                    return
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=client, args=(acheteur,)) for acheteur in acheteurs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(issues), ['passee'] * 5 + ['refusee'] * 3)
+        self.assertEqual(sum(LigneCommande.objects.values_list('quantite', flat=True)), 5)
+        self.assertEqual(stock.stock_reel(produit.pk), 0)
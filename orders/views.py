@@ -2,13 +2,14 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.db import transaction
-from django.db.models import Sum, F, Prefetch
+from django.db.models import F, Prefetch
 from django.http import JsonResponse, HttpResponseBadRequest
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.views.decorators.http import require_http_methods, require_GET, require_POST
 from cart.models import Panier, ArticlePanier
-from .models import Commande, LigneCommande
+from ecommerce.pagination import paginer
+from .models import Commande, LigneCommande, ResumeCommandesUtilisateur
+from .services import PanierVide, StockInsuffisant, annuler_commandes, passer_commande
+from cart.reservations import reserver_panier
 from catalog.models import Produit
 from django.conf import settings
 
@@ -16,35 +17,25 @@ from django.conf import settings
 @login_required
 def historique_commandes(request):
     """
-    Affiche l'historique des commandes de l'utilisateur connecté avec pagination.
+    Affiche l'historique des commandes de l'utilisateur connecté, paginé par
+    clé (date, id) : deux requêtes quel que soit le nombre de commandes.
     """
-    # Récupérer toutes les commandes de l'utilisateur
-    commandes_list = Commande.objects.filter(
-        utilisateur=request.user
-    ).select_related('utilisateur').prefetch_related(
-        Prefetch('lignes', queryset=LigneCommande.objects.select_related('produit'))
-    ).order_by('-date_commande')
-    
-    # Pagination - 10 commandes par page
-    page = request.GET.get('page', 1)
-    paginator = Paginator(commandes_list, 10)
-    
-    try:
-        commandes = paginator.page(page)
-    except PageNotAnInteger:
-        commandes = paginator.page(1)
-    except EmptyPage:
-        commandes = paginator.page(paginator.num_pages)
+    # Pagination par curseur - 10 commandes par page (voir ecommerce.pagination)
+    commandes = paginer(
+        request,
+        Commande.objects.filter(utilisateur=request.user),
+        ('-date_commande', '-id'),
+        10,
+    )
     
-    # Calculer le montant total dépensé par l'utilisateur
-    total_depense = Commande.objects.filter(
-        utilisateur=request.user
-    ).aggregate(total=Sum('montant_total'))['total'] or 0
+    # Statistiques tenues à jour à chaque commande (voir ResumeCommandesUtilisateur)
+    resume = ResumeCommandesUtilisateur.pour(request.user)
     
     context = {
         'commandes': commandes,
-        'total_depense': total_depense,
-        'commandes_count': paginator.count,
+        'resume': resume,
+        'total_depense': resume.total_depense,
+        'commandes_count': resume.nombre_commandes,
     }
     
     return render(request, 'orders/historique.html', context)
@@ -90,7 +81,8 @@ def annuler_commande(request, commande_id):
         utilisateur=request.user
     )
     
-    if commande.annuler():
+    # Remise en stock incluse (voir orders.services.changer_statut)
+    if annuler_commandes(Commande.objects.filter(pk=commande.pk)):
         messages.success(
             request,
             f'La commande #{commande.id} a été annulée avec succès.'
@@ -104,22 +96,28 @@ def annuler_commande(request, commande_id):
     return redirect('orders:detail_commande', commande_id=commande.id)
 
 
+def message_stock_insuffisant(request, manquants):
+    """Message d'erreur listant les triplets (produit, demandé, disponible)."""
+    messages.error(
+        request,
+        "Stock insuffisant pour certains articles :\n" + 
+        "\n".join(
+            f"- {produit.nom}: {demande} demandés, {disponible} disponibles"
+            for produit, demande, disponible in manquants
+        ) +
+        "\n\nVeuillez ajuster les quantités avant de réessayer."
+    )
+
+
 @login_required
 @require_http_methods(['GET', 'POST'])
 def creer_commande(request):
     """
-    Vue pour créer une nouvelle commande à partir du panier de l'utilisateur.
+    Vue pour créer une nouvelle commande à partir du panier de l'utilisateur
+    (voir orders.services.passer_commande).
     """
-    # Récupérer le panier de l'utilisateur
-    try:
-        panier = Panier.objects.get(utilisateur=request.user)
-        articles = panier.items.all()
-        
-        # Vérifier que le panier n'est pas vide
-        if not articles.exists():
-            messages.warning(request, 'Votre panier est vide.')
-            return redirect('cart:panier')
-    except Panier.DoesNotExist:
+    panier = Panier.objects.filter(utilisateur=request.user).first()
+    if panier is None or not panier.nombre_articles:
         messages.warning(request, 'Votre panier est vide.')
         return redirect('cart:panier')
     
@@ -137,60 +135,21 @@ def creer_commande(request):
             return redirect('orders:creer_commande')
         
         try:
-            with transaction.atomic():
-                # Créer la commande
-                commande = Commande.objects.create(
-                    utilisateur=request.user,
-                    adresse_livraison=adresse_livraison,
-                    code_postal=code_postal,
-                    ville=ville,
-                    pays=pays,
-                    montant_total=panier.total,
-                    paye=True  # À remplacer par une vraie logique de paiement
-                )
-                
-                # Vérifier le stock avant de créer la commande
-                articles_avec_stock_insuffisant = []
-                for article in articles:
-                    if article.quantite > article.produit.quantite:
-                        articles_avec_stock_insuffisant.append(
-                            f"- {article.produit.nom}: {article.quantite} demandés, {article.produit.quantite} disponibles"
-                        )
-                
-                if articles_avec_stock_insuffisant:
-                    messages.error(
-                        request,
-                        "Stock insuffisant pour certains articles :\n" + 
-                        "\n".join(articles_avec_stock_insuffisant) +
-                        "\n\nVeuillez ajuster les quantités avant de réessayer."
-                    )
-                    return redirect('cart:panier')
-                
-                # Créer les lignes de commande et mettre à jour le stock
-                for article in articles:
-                    # Créer la ligne de commande
-                    LigneCommande.objects.create(
-                        commande=commande,
-                        produit=article.produit,
-                        quantite=article.quantite,
-                        prix_unitaire=article.prix_unitaire
-                    )
-                    
-                    # Mettre à jour le stock
-                    article.produit.quantite -= article.quantite
-                    if article.produit.quantite <= 0:
-                        article.produit.en_stock = False
-                    article.produit.save(update_fields=['quantite', 'en_stock'])
-                
-                # Vider le panier après la commande
-                panier.items.all().delete()
-                
-                # Rediriger vers la page de confirmation de commande
-                messages.success(request, 'Votre commande a été passée avec succès !')
-                return redirect('orders:detail_commande', commande_id=commande.id)
-                
+            commande = passer_commande(
+                request.user,
+                adresse_livraison=adresse_livraison,
+                code_postal=code_postal,
+                ville=ville,
+                pays=pays,
+            )
+        except PanierVide:
+            messages.warning(request, 'Votre panier est vide.')
+            return redirect('cart:panier')
+        except StockInsuffisant as e:
+            message_stock_insuffisant(request, e.manquants)
+            return redirect('cart:panier')
         except Exception as e:
-            # En cas d'erreur, annuler la transaction et afficher un message d'erreur
+            # En cas d'erreur, la transaction est annulée : afficher un message d'erreur
             if settings.DEBUG:
                 print(f"Erreur lors de la création de la commande : {str(e)}")
             messages.error(
@@ -198,8 +157,20 @@ def creer_commande(request):
                 'Une erreur est survenue lors de la création de votre commande. Veuillez réessayer.'
             )
             return redirect('cart:panier')
+        
+        # Rediriger vers la page de confirmation de commande
+        messages.success(request, 'Votre commande a été passée avec succès !')
+        return redirect('orders:detail_commande', commande_id=commande.id)
+    
+    # Si c'est une requête GET, réserver le stock pendant que l'utilisateur
+    # remplit le formulaire : un article indisponible est signalé dès maintenant
+    manquants = reserver_panier(panier)
+    if manquants:
+        message_stock_insuffisant(request, manquants)
+        return redirect('cart:panier')
     
-    # Si c'est une requête GET, afficher le formulaire de commande
+    # Afficher le formulaire de commande
+    articles = panier.items.select_related('produit')
     context = {
         'panier': panier,
         'articles': articles,
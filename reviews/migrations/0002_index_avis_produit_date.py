@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 05:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['product', 'created_at', 'id'], name='avis_produit_date'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.10 on 2026-10-18 05:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0002_index_avis_produit_date'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['product', 'rating'], name='avis_produit_note'),
+        ),
+    ]
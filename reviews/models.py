@@ -78,6 +78,18 @@ class Review(models.Model):
         verbose_name = 'Avis'
         verbose_name_plural = 'Avis'
         ordering = ['-created_at']
+        indexes = [
+            # Avis approuvés d'un produit, du plus récent au plus ancien (pagination par curseur)
+            models.Index(
+                fields=['product', 'created_at', 'id'], name='avis_produit_date',
+                condition=models.Q(is_approved=True),
+            ),
+            # Note moyenne et répartition des notes d'un produit, lues dans l'index
+            models.Index(
+                fields=['product', 'rating'], name='avis_produit_note',
+                condition=models.Q(is_approved=True),
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'product'],
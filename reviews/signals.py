@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Review
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def mettre_a_jour_notes_produit(sender, instance, **kwargs):
+    """Met à jour la synthèse des notes du produit quand un avis change."""
+    if kwargs.get('raw'):
+        return
+    instance.product.mettre_a_jour_notes()
@@ -10,21 +10,24 @@ from django.views.decorators.http import require_http_methods
 from django.db.models import Avg, Count
 
 from catalog.models import Produit as Product
+from ecommerce.pagination import PaginationCurseurMixin
 from .models import Review
 from .forms import ReviewForm, ReviewEditForm
 
 
-class ProductReviewListView(ListView):
+class ProductReviewListView(PaginationCurseurMixin, ListView):
     """
-    Affiche la liste des avis pour un produit donné.
+    Affiche la liste des avis pour un produit donné, paginée par curseur
+    (index avis_produit_date).
     """
     model = Review
     template_name = 'reviews/product_review_list.html'
     context_object_name = 'reviews'
     paginate_by = 5
+    tri_curseur = ('-created_at', '-id')
     
     def get_queryset(self):
-        self.product = get_object_or_404(Product, pk=self.kwargs['product_id'], is_active=True)
+        self.product = get_object_or_404(Product, pk=self.kwargs['product_id'], est_actif=True)
         return Review.objects.filter(
             product=self.product, 
             is_approved=True
@@ -17,8 +17,8 @@ function updateCartCount() {
 
 // Gestionnaire d'événements pour le chargement du document
 document.addEventListener('DOMContentLoaded', function() {
-    // Mettre à jour le compteur du panier au chargement de la page
-    updateCartCount();
+    // Le compteur du panier est rendu par le serveur (badge de l'en-tête) :
+    // updateCartCount() ne sert qu'après un ajout au panier
     // Gestion des messages flash (fermeture automatique après 5 secondes)
     const alerts = document.querySelectorAll('.alert');
     if (alerts.length > 0) {